@@ -1,10 +1,16 @@
 import pathlib
-import zipfile
 import argparse
+import matplotlib
+matplotlib.use('Agg')
 import pandas as pd
-import numpy as np
-from matplotlib import pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.ticker import AutoMinorLocator
+from store import open_results
+from summary import SUMMARY_SOURCES, reduce_cells
+from cache import DEFAULT_CACHE_DIR, BuildCache, code_version, stage_key
+from calibration import UNITS
+from vm.registry import BENCHMARKS
 
 program_dir = pathlib.Path(__file__).parent
 
@@ -13,77 +19,144 @@ parser = argparse.ArgumentParser(description='Generate graphs from test data.')
 # Positional args
 parser.add_argument(
     'benchmark_data', metavar='benchmark-data', type=pathlib.Path,
-    help='path to benchmark data')
+    help='path to benchmark data (raw zip tree or a store built with "store.py ingest")')
 parser.add_argument(
-    'benchmark_name', metavar='benchmark-name', 
-    help='name of benchmark to analyse (timesyscall, timectxsw etc.)')
+    'benchmark_names', metavar='benchmark-name', nargs='*',
+    help='benchmarks to analyse (timesyscall, timectxsw etc.), all of them if omitted')
 
-args = parser.parse_args()
+# Optional args
+parser.add_argument(
+    '--jobs', '-j', type=int, default=1,
+    help='number of worker processes used to reduce suites and VM counts in parallel')
+parser.add_argument(
+    '--dpi', type=int, default=300,
+    help='resolution of saved figures')
+parser.add_argument(
+    '--cache-dir', type=pathlib.Path, default=DEFAULT_CACHE_DIR,
+    help='build cache for summaries and figure dependencies')
+parser.add_argument(
+    '--force', action='store_true',
+    help='re-render every figure, even if it is up to date')
+parser.add_argument(
+    '--unit', choices=UNITS, default='cycles',
+    help='unit of the rdtsc figures: raw cycles, or ns at each cell\'s calibrated rate '
+         '(figures named rdtsc-ns-<suite>.png)')
 
-benchmarks_with_iterations = {
-    'timesyscall' : 10_000_000, 
-    'timectxsw'   :    500_000, 
-    'timetctxsw'  :    500_000, 
-    'timetctxsw2' :    500_000
-}
-
-def get_subdirs(path):
-    assert path.is_dir() == True
-    return [x for x in path.iterdir() if x.is_dir()]
-
-def generate_graph(path, benchmark_name):
-    number_of_vms = len(tuple(path.iterdir()))
-    number_of_data_points = benchmarks_with_iterations[benchmark_name]
-
-    rdtsc_readings = np.ndarray(shape=(number_of_data_points, number_of_vms), dtype=np.int32)
-    combined_exec_times = np.zeros(number_of_vms, dtype=np.int64)
-
-    print('VM: ', end=' ')
-    for benchmark_pass in range(number_of_vms):
-        print(benchmark_pass+1, end=' ')
-        zip_path = path/f'{benchmark_pass+1}/{benchmark_name}.zip'
-        with zipfile.ZipFile(zip_path, mode='r', compression=zipfile.ZIP_DEFLATED) as zf:
-            num_benchmark_processes = len(zf.namelist())
-            for process_num in range(num_benchmark_processes):
-                with zf.open(f'{benchmark_name}{process_num}.out') as b:
-                    raw_bytes = b.read()
-                # Read the clock_gettime execution time, [0] because singleton array
-                combined_exec_times[benchmark_pass] += (np.frombuffer(raw_bytes, dtype=np.int64, count=1)[0] // num_benchmark_processes)
-                # Read all rdtsc readings, offset is 8 to avoid reading 64-bit clock_gettime at beginning of file
-                rdtsc_readings[:,benchmark_pass] += np.frombuffer(raw_bytes, dtype=np.int32, offset=8)
-        rdtsc_readings[:,benchmark_pass] //= num_benchmark_processes
-        
-    
-    print('Plotting and saving...')
-
-    column_labels =[f'{i+1}VM' for i in range(number_of_vms)]
-    df = pd.DataFrame(rdtsc_readings, columns=column_labels)
-    df = pd.DataFrame({'mean' : df.mean(), 'median' : df.median()})
-    ax = df.plot.bar()
-    ax.yaxis.set_minor_locator(AutoMinorLocator())
-    plt.savefig(program_dir/f'figs/{benchmark_name}/rdtsc-{path.stem}.png', dpi=300)
-    plt.close()
-    
+args = parser.parse_args()
+rdtsc_metric = 'rdtsc' if args.unit == 'cycles' else 'rdtsc-ns'
+
+# Benchmarks without results are skipped below
+benchmark_names = args.benchmark_names or list(BENCHMARKS)
+for benchmark_name in benchmark_names:
+    if benchmark_name not in BENCHMARKS:
+        parser.error(f'Unknown benchmark {benchmark_name}')
+
+class BarRenderer:
+    # A single Agg figure that is cleared and redrawn for every plot, bypassing pyplot state
+
+    def __init__(self, dpi):
+        self.dpi = dpi
+        self.figure = Figure()
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_subplot()
+
+    def save_bar(self, df, path):
+        self.ax.clear()
+        df.plot.bar(ax=self.ax)
+        self.ax.yaxis.set_minor_locator(AutoMinorLocator())
+        self.figure.savefig(path, dpi=self.dpi)
+
+def figure_path(benchmark_name, metric, suite):
+    return program_dir/f'figs/{benchmark_name}/{metric}-{suite}.png'
+
+def generate_graph(renderer, suite, benchmark_name, summaries):
+    # summaries maps VM count -> CellSummary
+    vm_counts = sorted(summaries)
+    summaries = [summaries[vm_count] for vm_count in vm_counts]
+
+    column_labels = [f'{vm_count}VM' for vm_count in vm_counts]
+    df = pd.DataFrame({
+        'mean'   : [s.mean(args.unit) for s in summaries],
+        'median' : [s.median(args.unit) for s in summaries],
+    }, index=column_labels)
+    renderer.save_bar(df, figure_path(benchmark_name, rdtsc_metric, suite))
+
+    combined_exec_times = [s.clock_ns_mean() for s in summaries]
     df = pd.DataFrame(combined_exec_times, index=column_labels)
-    ax = df.plot.bar()
-    ax.yaxis.set_minor_locator(AutoMinorLocator())
-    plt.savefig(program_dir/f'figs/{benchmark_name}/clock_gettime-{path.stem}.png', dpi=300)
-    plt.close()
-
-for benchmark_suite in get_subdirs(args.benchmark_data):
-    if (program_dir/f'figs/{args.benchmark_name}/clock_gettime-{benchmark_suite.stem}.png').exists():
-        print(f'Skipping {benchmark_suite.stem}')
-        continue
-    if (program_dir/f'figs/{args.benchmark_name}/rdtsc-{benchmark_suite.stem}.png').exists():
-        print(f'Skipping {benchmark_suite.stem}')
-        continue
-    if benchmark_suite.stem[0] != '(':
-        print(f'Skipping {benchmark_suite.stem}')
-        continue
-    generate_graph(benchmark_suite, args.benchmark_name)
-
-
-        
-
-
-
+    renderer.save_bar(df, figure_path(benchmark_name, 'clock_gettime', suite))
+
+assert args.benchmark_data.is_dir() == True
+results = open_results(args.benchmark_data)
+
+for benchmark_name in benchmark_names:
+    figure_path(benchmark_name, rdtsc_metric, '').parent.mkdir(parents=True, exist_ok=True)
+
+cache = BuildCache(args.cache_dir)
+# Summaries depend on the raw data and the decoding/reduction code, figures on the summaries
+# they are drawn from and this script
+summary_version = code_version(*SUMMARY_SOURCES)
+render_version = stage_key(code_version(__file__), args.dpi)
+
+def figure_key(suite, benchmark_name):
+    # (figure key, {vm_count: summary key}) for one benchmark of one suite
+    summary_keys = {}
+    for vm_count in results.vm_counts(suite):
+        if benchmark_name in results.benchmarks(suite, vm_count):
+            digest = results.source_digest(suite, vm_count, benchmark_name, cache)
+            summary_keys[vm_count] = stage_key(summary_version, digest)
+    return stage_key(render_version, *sorted(summary_keys.items())), summary_keys
+
+# Work out which figures are stale, and which of the summaries they need are not cached yet
+stale = {}
+for benchmark_suite in results.suites():
+    for benchmark_name in benchmark_names:
+        key, summary_keys = figure_key(benchmark_suite, benchmark_name)
+        if not summary_keys:
+            continue
+        if not args.force and \
+           cache.figure_is_current(figure_path(benchmark_name, 'clock_gettime', benchmark_suite), key) and \
+           cache.figure_is_current(figure_path(benchmark_name, rdtsc_metric, benchmark_suite), key):
+            print(f'Skipping {benchmark_name} {benchmark_suite}')
+            continue
+        stale[benchmark_suite, benchmark_name] = key, summary_keys
+
+suite_summaries = {}
+uncached = {}
+for (suite, benchmark_name), (_, summary_keys) in stale.items():
+    for vm_count, summary_key in summary_keys.items():
+        summary = cache.load_summary(summary_key)
+        if summary is None:
+            uncached.setdefault((suite, vm_count), []).append(benchmark_name)
+        else:
+            suite_summaries.setdefault((suite, benchmark_name), {})[vm_count] = summary
+
+def render_suite(suite):
+    print(f'Plotting and saving {suite}...')
+    for benchmark_name in benchmark_names:
+        if (suite, benchmark_name) not in stale:
+            continue
+        key, _ = stale[suite, benchmark_name]
+        generate_graph(renderer, suite, benchmark_name, suite_summaries.pop((suite, benchmark_name)))
+        cache.record_figure(figure_path(benchmark_name, 'clock_gettime', suite), key)
+        cache.record_figure(figure_path(benchmark_name, rdtsc_metric, suite), key)
+    cache.save()
+
+renderer = BarRenderer(args.dpi)
+
+# Every (suite, VM count) cell is independent and is read once for all of its uncached benchmarks.
+# Each suite is plotted as soon as its last cell is in.
+remaining = {}
+for suite, _ in uncached:
+    remaining[suite] = remaining.get(suite, 0) + 1
+for suite in dict.fromkeys(suite for suite, _ in stale):
+    if suite not in remaining:
+        render_suite(suite)
+
+cells = [(suite, vm_count, tuple(names)) for (suite, vm_count), names in uncached.items()]
+for (suite, vm_count, _), summaries in reduce_cells(args.benchmark_data, cells, jobs=args.jobs):
+    for benchmark_name, summary in summaries.items():
+        cache.store_summary(stale[suite, benchmark_name][1][vm_count], summary)
+        suite_summaries.setdefault((suite, benchmark_name), {})[vm_count] = summary
+    remaining[suite] -= 1
+    if remaining[suite] == 0:
+        render_suite(suite)
@@ -0,0 +1,88 @@
+import os
+import json
+import pickle
+import hashlib
+import pathlib
+
+# Dependency-tracked build cache for the analysis stage chain:
+#
+#   raw zip --> decoded arrays (store.py) --> summary statistics (summary.py) --> figure
+#
+# Every artifact is keyed by the content hash of its inputs and the version (source hash) of the
+# code producing it, so only stale artifacts are rebuilt. Summaries are cached on their own, so
+# a change that only affects plotting never touches the raw data again.
+
+program_dir = pathlib.Path(__file__).parent
+
+DEFAULT_CACHE_DIR = program_dir/'.cache'
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while (block := f.read(1 << 22)):
+            digest.update(block)
+    return digest.hexdigest()
+
+def code_version(*paths):
+    # Hash of the source files that implement a stage
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(pathlib.Path(path).read_bytes())
+    return digest.hexdigest()[:16]
+
+def stage_key(*parts):
+    return hashlib.sha256('\0'.join(map(str, parts)).encode('utf-8')).hexdigest()
+
+def write_atomic(path, data):
+    tmp = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+class BuildCache:
+
+    def __init__(self, root=DEFAULT_CACHE_DIR):
+        self.root = pathlib.Path(root)
+        self.summary_dir = self.root/'summaries'
+        self.summary_dir.mkdir(parents=True, exist_ok=True)
+        # path -> [size, mtime_ns, sha256], so unchanged files are not hashed again
+        self.digests = self.load_json('digests.json')
+        # figure path -> key it was rendered from
+        self.figures = self.load_json('figures.json')
+
+    def load_json(self, name):
+        path = self.root/name
+        return json.loads(path.read_text()) if path.is_file() else {}
+
+    def save(self):
+        write_atomic(self.root/'digests.json', json.dumps(self.digests).encode('utf-8'))
+        write_atomic(self.root/'figures.json', json.dumps(self.figures).encode('utf-8'))
+
+    def digest(self, path):
+        path = pathlib.Path(path).resolve()
+        stat = path.stat()
+        known = self.digests.get(str(path))
+        if known is not None and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return known[2]
+        sha256 = sha256_file(path)
+        self.digests[str(path)] = [stat.st_size, stat.st_mtime_ns, sha256]
+        return sha256
+
+    #----------------------------------------------------------------------------------------------#
+
+    def load_summary(self, key):
+        path = self.summary_dir/f'{key}.pkl'
+        if not path.is_file():
+            return None
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def store_summary(self, key, summary):
+        write_atomic(self.summary_dir/f'{key}.pkl', pickle.dumps(summary))
+
+    #----------------------------------------------------------------------------------------------#
+
+    def figure_is_current(self, path, key):
+        return pathlib.Path(path).exists() and self.figures.get(str(path)) == key
+
+    def record_figure(self, path, key):
+        self.figures[str(path)] = key
@@ -0,0 +1,65 @@
+import collections
+import numpy as np
+from loader import SAMPLE_DTYPE
+
+# Cycles to nanoseconds. Every benchmark process times its loop twice: rdtsc deltas back to back,
+# and one clock_gettime total around the whole loop. So each output file carries its own rate,
+#
+#   cycles per ns = sum of deltas / clock_ns
+#
+# and hosts or guests with different TSC frequencies or TSC modes become comparable in ns. The
+# reference rate of a set of outputs is the median of the files' rates, or of the guest's TSC
+# calibration passes where the results have one (vm/tsc.py).
+#
+# Deltas are uint32. The programs saturate a longer delta at SATURATED_DELTA; outputs recorded
+# before that wrapped it modulo 2**32 instead. A wrap drops 2**32 cycles from the file's sum, so
+# against the reference the file is short by a whole number of wraps, which is how they are found.
+
+SATURATED_DELTA = int(np.iinfo(SAMPLE_DTYPE).max)
+WRAP_CYCLES = SATURATED_DELTA + 1
+# Fraction of a wrap a file must be short by to count as one
+WRAP_THRESHOLD = 0.5
+
+UNITS = ('cycles', 'ns')
+
+# What one benchmark process recorded, for calibration
+ProcessClock = collections.namedtuple('ProcessClock', ['clock_ns', 'cycles', 'count', 'saturated'])
+
+def count_saturated(deltas):
+    return int(np.count_nonzero(deltas == SATURATED_DELTA))
+
+def file_rates(processes):
+    # Cycles per ns of every process with a clock total (NaN without one)
+    clock_ns = np.array([p.clock_ns or 0 for p in processes], dtype=np.float64)
+    cycles = np.array([p.cycles for p in processes], dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(clock_ns > 0, cycles / clock_ns, np.nan)
+
+def reference_rate(processes, tsc_rates=()):
+    # (cycles per ns, source): the median guest calibration, else the median file rate
+    if len(tsc_rates):
+        return float(np.median(tsc_rates)), 'tsc'
+    rates = file_rates(processes)
+    rates = rates[~np.isnan(rates)]
+    if not len(rates):
+        return np.nan, None
+    return float(np.median(rates)), 'clock'
+
+def estimate_wraps(processes, rate):
+    # Wraps per process: the whole 2**32s of cycles missing from its sum at the reference rate.
+    # Saturated deltas more than a wrap too long are counted the same way.
+    clock_ns = np.array([p.clock_ns or 0 for p in processes], dtype=np.float64)
+    cycles = np.array([p.cycles for p in processes], dtype=np.float64)
+    if np.isnan(rate):
+        return np.zeros(len(processes), dtype=np.int64)
+    shortfall = (clock_ns * rate - cycles) / WRAP_CYCLES
+    return np.where((clock_ns > 0) & (shortfall >= WRAP_THRESHOLD), np.rint(shortfall), 0).astype(np.int64)
+
+def to_ns(cycles, rate):
+    # Cycle counts (a scalar or any array) in ns
+    return np.asarray(cycles, dtype=np.float64) / rate
+
+def convert(cycles, unit, rate):
+    if unit not in UNITS:
+        raise ValueError(f'Unknown unit {unit}')
+    return cycles if unit == 'cycles' else to_ns(cycles, rate)
@@ -0,0 +1,343 @@
+import sys
+import math
+import zlib
+import pathlib
+import argparse
+import itertools
+import collections
+import multiprocessing
+import concurrent.futures
+import numpy as np
+import pandas as pd
+from histogram import LogHistogram, bucket_bounds
+from calibration import UNITS
+from summary_db import ALL_VCPUS, DEFAULT_DB, PERCENTILES, connect
+from vm.configs import DIMENSIONS, DIMENSION_VALUES, format_results_dir, parse
+
+# Significance of the differences between configurations. Each cell is taken from the per-vCPU
+# histograms in the summary database, so no raw data is read. Two cells A and B at the same VM count
+# are compared by:
+#
+#   mean, pXX      B - A, with a bootstrap confidence interval
+#   prob_lower     P(a delta of B < a delta of A), ties counting half: 0.5 is no shift, above 0.5
+#                  B is faster. Also with a bootstrap interval.
+#   mw_p           two-sided Mann-Whitney p-value (normal approximation with tie correction), and
+#                  mw_q, the same adjusted for the whole table (Benjamini-Hochberg)
+#
+# Consecutive deltas of one process are far from independent, so the bootstrap resamples at two
+# levels. It picks the cell's benchmark processes with replacement, then draws deltas from their
+# mixture over the histogram buckets. Every resample is a row of bucket counts, so a statistic is a
+# cumsum or a dot product over all resamples at once. Cells are resampled independently, once each,
+# and a pair only subtracts their statistics. Mann-Whitney on millions of deltas rejects nearly
+# anything, so judge by the intervals first.
+#
+# Pairs are either two given suites, or every two configurations of the matrix that differ in one
+# dimension only, at every VM count both have. Cells and then pairs are spread over --jobs worker
+# processes.
+
+DEFAULT_RESAMPLES = 1000
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_STATISTICS = ('mean', 'p50', 'p99')
+STATISTICS = ('mean', *PERCENTILES)
+CELLS_PER_TASK = 16
+PAIRS_PER_TASK = 64
+
+# The benchmark processes (vCPUs) of one cell
+CellSample = collections.namedtuple('CellSample', ['histograms', 'cycles_per_ns'])
+
+# How often each process was picked in every resample, and every resample's statistics
+CellResamples = collections.namedtuple('CellResamples', ['picks', 'statistics'])
+
+Settings = collections.namedtuple('Settings', ['statistics', 'resamples', 'confidence', 'unit', 'seed'])
+
+SUMMARY_COLUMNS = ('factor', 'level_a', 'level_b', 'vm_count')
+
+def load_samples(db, benchmark):
+    # {(suite, vm_count): CellSample} of one benchmark
+    samples = {}
+    rows = db.execute('SELECT suite, vm_count, histogram, cycles_per_ns FROM summaries '
+                      'WHERE benchmark = ? AND vcpu != ? ORDER BY suite, vm_count, vcpu',
+                      (benchmark, ALL_VCPUS))
+    for suite, vm_count, blob, rate in rows:
+        histogram = LogHistogram.from_bytes(blob)
+        if not histogram.count:
+            continue
+        sample = samples.setdefault((suite, vm_count), CellSample([], rate))
+        sample.histograms.append(histogram)
+    return samples
+
+def factor_pairs(samples, factors, fixed):
+    # (factor, suite_a, suite_b, vm_count) for every two configurations differing in one factor only,
+    # A before B in the dimension's order
+    configs = {}
+    vm_counts = {}
+    for suite, vm_count in samples:
+        config = parse(suite)
+        if config is None or any(getattr(config, d) != v for d, v in fixed.items()):
+            continue
+        configs[suite] = config
+        vm_counts.setdefault(suite, set()).add(vm_count)
+
+    pairs = []
+    for factor in factors:
+        column = DIMENSIONS.index(factor)
+        groups = {}
+        for suite, config in configs.items():
+            groups.setdefault(config[:column] + config[column+1:], []).append(suite)
+        for suites in groups.values():
+            suites.sort(key=lambda suite: DIMENSION_VALUES[factor].index(configs[suite][column]))
+            for a, b in itertools.combinations(suites, 2):
+                pairs += [(factor, a, b, n) for n in sorted(vm_counts[a] & vm_counts[b])]
+    return pairs
+
+def suite_pairs(samples, suite_a, suite_b, vm_counts=None):
+    # (differing dimensions, suite_a, suite_b, vm_count) at every VM count both suites have
+    config_a, config_b = parse(suite_a), parse(suite_b)
+    factor = ','.join(d for d, a, b in zip(DIMENSIONS, config_a, config_b) if a != b)
+    common = sorted({n for s, n in samples if s == suite_a} & {n for s, n in samples if s == suite_b})
+    return [(factor, suite_a, suite_b, n) for n in common if not vm_counts or n in vm_counts]
+
+#--------------------------------------------------------------------------------------------------#
+
+def cell_grid(sample, unit):
+    # Values in `unit` of the buckets any process of a cell used, and the (processes, buckets) counts
+    indices = np.unique(np.concatenate([h.nonzero()[0] for h in sample.histograms]))
+    low, high = bucket_bounds(indices)
+    rate = sample.cycles_per_ns if unit == 'ns' else 1
+    return (low + high) / 2 / rate, np.stack([h.counts[indices] for h in sample.histograms])
+
+def pair_grid(grid_a, grid_b):
+    # Both cells' counts on the sorted union of their bucket values: (values, A counts, B counts)
+    values, positions = np.unique(np.concatenate([grid_a[0], grid_b[0]]), return_inverse=True)
+    positions = np.split(positions.reshape(-1), [len(grid_a[0])])
+    matrices = []
+    for (_, counts), columns in zip((grid_a, grid_b), positions):
+        matrices.append(np.zeros((len(counts), len(values)), dtype=np.int64))
+        matrices[-1][:, columns] = counts
+    return values, matrices[0], matrices[1]
+
+def resample(counts, resamples, rng):
+    # (processes, buckets) counts -> how often each process was picked (resamples, processes), and
+    # the bucket counts of every resampled cell (resamples, buckets). The deltas are Poisson counts
+    # around the picked processes' mixture (the Poisson bootstrap), so no row needs normalising.
+    processes = len(counts)
+    picks = rng.multinomial(processes, np.full(processes, 1 / processes), size=resamples)
+    return picks.astype(np.uint8), rng.poisson(picks @ counts)
+
+def statistic(counts, values, name):
+    # A statistic of the deltas with the given bucket counts (..., buckets) over the last axis. Ranks
+    # are taken as in LogHistogram.percentile.
+    if name == 'mean':
+        return counts @ values / counts.sum(axis=-1)
+    cumulative = np.cumsum(counts, axis=-1)
+    rank = np.maximum(np.ceil(PERCENTILES[name] / 100 * cumulative[..., -1:]), 1)
+    return values[(cumulative < rank).sum(axis=-1)]
+
+def lower_pairs(a, b):
+    # Pairs of deltas with B's lower, ties counting half, between every process of A and of B:
+    # (processes of A, processes of B) from counts on one grid
+    b = b.astype(np.float64)
+    return a.astype(np.float64) @ (np.cumsum(b, axis=-1) - b / 2).T
+
+def mann_whitney(a, b):
+    # (z, two-sided p) of the Mann-Whitney U test from counts on one grid
+    a, b = a.astype(np.float64), b.astype(np.float64)
+    n_a, n_b = a.sum(), b.sum()
+    n = n_a + n_b
+    ties = a + b
+    variance = n_a * n_b / 12 * ((n + 1) - (ties**3 - ties).sum() / (n * (n - 1)))
+    if variance <= 0:
+        return np.nan, np.nan
+    z = (lower_pairs(a[None], b[None]).item() - n_a * n_b / 2) / math.sqrt(variance)
+    return z, math.erfc(abs(z) / math.sqrt(2))
+
+def benjamini_hochberg(p):
+    # False discovery rate adjusted p-values (NaN stays NaN)
+    p = np.asarray(p, dtype=np.float64)
+    adjusted = np.full(len(p), np.nan)
+    tested = np.flatnonzero(~np.isnan(p))
+    order = tested[np.argsort(p[tested])]
+    scaled = p[order] * len(order) / np.arange(1, len(order) + 1)
+    adjusted[order] = np.minimum(np.minimum.accumulate(scaled[::-1])[::-1], 1)
+    return adjusted
+
+def resample_cell(sample, settings, rng):
+    values, counts = cell_grid(sample, settings.unit)
+    picks, resampled = resample(counts, settings.resamples, rng)
+    return CellResamples(picks, {name : statistic(resampled, values, name) for name in settings.statistics})
+
+def compare_cells(sample_a, sample_b, resamples_a, resamples_b, settings):
+    # Columns of one comparison
+    values, a, b = pair_grid(cell_grid(sample_a, settings.unit), cell_grid(sample_b, settings.unit))
+    total_a, total_b = a.sum(axis=0), b.sum(axis=0)
+    tails = 50 * (1 - settings.confidence), 50 * (1 + settings.confidence)
+
+    row = {'processes_a' : len(a), 'processes_b' : len(b), 'count_a' : int(total_a.sum()), 'count_b' : int(total_b.sum())}
+    for name in settings.statistics:
+        row[f'{name}_a'] = float(statistic(total_a, values, name))
+        row[f'{name}_b'] = float(statistic(total_b, values, name))
+        row[f'{name}_diff'] = row[f'{name}_b'] - row[f'{name}_a']
+        diffs = resamples_b.statistics[name] - resamples_a.statistics[name]
+        row[f'{name}_low'], row[f'{name}_high'] = np.percentile(diffs, tails)
+
+    # Over the picked processes only: with millions of deltas the draws within them hardly matter
+    pairs = lower_pairs(a, b)
+    picks_a, picks_b = resamples_a.picks.astype(np.float64), resamples_b.picks.astype(np.float64)
+    resampled = np.einsum('ri,ij,rj->r', picks_a, pairs, picks_b) / ((picks_a @ a.sum(axis=1)) * (picks_b @ b.sum(axis=1)))
+    row['prob_lower'] = pairs.sum() / (row['count_a'] * row['count_b'])
+    row['prob_lower_low'], row['prob_lower_high'] = np.percentile(resampled, tails)
+    row['mw_z'], row['mw_p'] = mann_whitney(total_a, total_b)
+    return row
+
+#--------------------------------------------------------------------------------------------------#
+
+# Cell samples of the benchmark being compared and their resamples, inherited by forked workers
+worker_samples = {}
+worker_resamples = {}
+
+def resample_cells(cells, settings):
+    resampled = {}
+    for suite, vm_count in cells:
+        # A generator per cell, so the results depend neither on the pairs asked for nor on the workers
+        rng = np.random.default_rng([settings.seed, zlib.crc32(suite.encode('utf-8')), vm_count])
+        resampled[suite, vm_count] = resample_cell(worker_samples[suite, vm_count], settings, rng)
+    return resampled
+
+def compare_pairs(pairs, settings):
+    rows = []
+    for factor, suite_a, suite_b, vm_count in pairs:
+        config_a, config_b = parse(suite_a), parse(suite_b)
+        dimensions = factor.split(',')
+        rows.append({
+            'factor'   : factor,
+            'level_a'  : ','.join(getattr(config_a, d) for d in dimensions),
+            'level_b'  : ','.join(getattr(config_b, d) for d in dimensions),
+            'vm_count' : vm_count,
+            **compare_cells(worker_samples[suite_a, vm_count], worker_samples[suite_b, vm_count],
+                            worker_resamples[suite_a, vm_count], worker_resamples[suite_b, vm_count], settings),
+            'suite_a'  : suite_a,
+            'suite_b'  : suite_b,
+        })
+    return rows
+
+def run_tasks(function, items, per_task, settings, jobs):
+    # function(items, settings) over chunks of items, in order. With jobs > 1 the chunks run in
+    # worker processes forked from this one, so only items and results are sent between them.
+    tasks = [items[i:i + per_task] for i in range(0, len(items), per_task)]
+    if jobs <= 1:
+        return [function(task, settings) for task in tasks]
+    context = multiprocessing.get_context('fork')
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, mp_context=context) as pool:
+        return list(pool.map(function, tasks, itertools.repeat(settings)))
+
+def compare_all(samples, pairs, settings, jobs=1):
+    # One row per pair, in the order given. Every cell is resampled once, however many pairs it is in.
+    worker_samples.clear()
+    worker_samples.update(samples)
+    cells = list(dict.fromkeys((suite, n) for _, a, b, n in pairs for suite in (a, b)))
+    worker_resamples.clear()
+    for resampled in run_tasks(resample_cells, cells, CELLS_PER_TASK, settings, jobs):
+        worker_resamples.update(resampled)
+    chunks = run_tasks(compare_pairs, pairs, PAIRS_PER_TASK, settings, jobs)
+    return pd.DataFrame([row for chunk in chunks for row in chunk])
+
+def significance_table(samples, pairs, settings, metric, jobs=1):
+    # The comparisons, with mw_q over the whole table and `significant` where metric's interval
+    # excludes 0
+    table = compare_all(samples, pairs, settings, jobs)
+    if table.empty:
+        return table
+    table['mw_q'] = benjamini_hochberg(table['mw_p'])
+    table['significant'] = (table[f'{metric}_low'] > 0) | (table[f'{metric}_high'] < 0)
+    return table
+
+####  Main program  ################################################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Bootstrap intervals and rank tests between configurations in the summary database.')
+    parser.add_argument(
+        'benchmark', help='benchmark to compare (timesyscall, timectxsw etc.)')
+    parser.add_argument(
+        '--a', metavar='SUITE',
+        help='compare this configuration ([...] or (...) form) with --b instead of the whole matrix')
+    parser.add_argument(
+        '--b', metavar='SUITE',
+        help='the configuration compared with --a')
+    parser.add_argument(
+        '--vary', action='append', choices=DIMENSIONS,
+        help='compare configurations differing in this dimension (may be repeated, all by default)')
+    parser.add_argument(
+        '--fix', action='append', default=[], metavar='DIMENSION=VALUE',
+        help='only consider configurations with this value (may be repeated)')
+    parser.add_argument(
+        '--vm-count', type=int, action='append',
+        help='only compare at these VM counts (may be repeated)')
+    parser.add_argument(
+        '--statistics', nargs='+', default=DEFAULT_STATISTICS, choices=STATISTICS,
+        help='statistics to compare')
+    parser.add_argument(
+        '--metric', default='p50', choices=STATISTICS,
+        help='statistic whose interval decides the significant column')
+    parser.add_argument(
+        '--unit', choices=UNITS, default='cycles',
+        help='compare raw cycles, or ns at each cell\'s calibrated rate')
+    parser.add_argument(
+        '--resamples', type=int, default=DEFAULT_RESAMPLES,
+        help='bootstrap resamples per cell')
+    parser.add_argument(
+        '--confidence', type=float, default=DEFAULT_CONFIDENCE,
+        help='confidence level of the intervals')
+    parser.add_argument(
+        '--seed', type=int, default=0,
+        help='seed of the bootstrap')
+    parser.add_argument(
+        '--jobs', '-j', type=int, default=1,
+        help='number of worker processes')
+    parser.add_argument(
+        '--csv', type=pathlib.Path,
+        help='also write the full table to this CSV file')
+    parser.add_argument(
+        '--db', type=pathlib.Path, default=DEFAULT_DB,
+        help='path to summary database')
+
+    args = parser.parse_args()
+
+    if (args.a is None) != (args.b is None):
+        parser.error('--a and --b go together')
+    suites = []
+    for suite in filter(None, (args.a, args.b)):
+        config = parse(suite)
+        if config is None:
+            parser.error(f'Cannot parse configuration {suite}')
+        suites.append(format_results_dir(config))
+    fixed = {}
+    for assignment in args.fix:
+        dimension, _, value = assignment.partition('=')
+        if dimension not in DIMENSIONS or value not in DIMENSION_VALUES[dimension]:
+            parser.error(f'Invalid --fix {assignment}')
+        fixed[dimension] = value
+    if not 0 < args.confidence < 1:
+        parser.error('--confidence must be between 0 and 1')
+    statistics = tuple(dict.fromkeys((*args.statistics, args.metric)))
+
+    samples = load_samples(connect(args.db), args.benchmark)
+    if args.unit == 'ns':
+        samples = {cell : s for cell, s in samples.items() if s.cycles_per_ns}
+    if suites:
+        pairs = suite_pairs(samples, *suites, args.vm_count)
+    else:
+        pairs = [p for p in factor_pairs(samples, args.vary or DIMENSIONS, fixed)
+                 if not args.vm_count or p[3] in args.vm_count]
+    if not pairs:
+        sys.exit('No matching results')
+
+    settings = Settings(statistics, args.resamples, args.confidence, args.unit, args.seed)
+    table = significance_table(samples, pairs, settings, args.metric, args.jobs)
+    if args.csv:
+        table.to_csv(args.csv, index=False)
+    columns = [*SUMMARY_COLUMNS, *(f'{args.metric}_{c}' for c in ('a', 'b', 'diff', 'low', 'high')),
+               'prob_lower', 'mw_q', 'significant']
+    print(f'{len(table)} comparisons, {table["significant"].sum()} with a {args.confidence:.0%} '
+          f'interval of the {args.metric} difference (B - A, {args.unit}) excluding 0')
+    print(table[columns].to_string(index=False, float_format=lambda v: f'{v:.4g}'))
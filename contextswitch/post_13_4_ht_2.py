@@ -4,14 +4,12 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
 import random 
-def processing(M):
-    #total=0
-    L=[]
-    H=[]
-    for i in M:
-        L.append(float(i))
-#            L.append(int(9999999999))
-    return L
+import sys
+import pathlib
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from loader import load_output
+def processing(path):
+    return load_output(path, fmt='text').deltas
 g = os.walk("test_KVM_13_8_nonovercommit_hyperthreading")
 g = os.walk("ht_only_time_ns")
 ref=[]
@@ -31,18 +29,15 @@ for i,j in zip(ref,files):
     index=i[0]
     exactly=i[2]
    # print(index, i[1], exactly)
-    f = open(j)
-    tmp = (f.read().splitlines())
-    tmp = processing(tmp)
+    tmp = processing(j)
     if exactly == "timetctxsw2.out":
-        timetctxsw2[int(index)-1].extend(tmp)
+        timetctxsw2[int(index)-1].append(tmp)
     elif exactly == "timetctxsw.out":
-        timetctxsw[int(index)-1].extend(tmp)
+        timetctxsw[int(index)-1].append(tmp)
     elif exactly == "timectxsw.out":
-        timectxsw[int(index)-1].extend(tmp)
+        timectxsw[int(index)-1].append(tmp)
     else:
-        timesyscall[int(index)-1].extend(tmp)
-    f.close()
+        timesyscall[int(index)-1].append(tmp)
 """
 print("timetctxsw2")
 for i in timetctxsw2:
@@ -57,10 +52,10 @@ print("timetctxsw2")
 for i in timesyscall:
     print(len(i))
 """
-_timectxsw=np.array(timectxsw)
-_timetctxsw=np.array(timetctxsw)
-_timetctxsw2=np.array(timetctxsw2)
-_timesyscall=np.array(timesyscall)
+_timectxsw=np.array([np.concatenate(x) for x in timectxsw])
+_timetctxsw=np.array([np.concatenate(x) for x in timetctxsw])
+_timetctxsw2=np.array([np.concatenate(x) for x in timetctxsw2])
+_timesyscall=np.array([np.concatenate(x) for x in timesyscall])
 
 timectxsw=pd.DataFrame(data=_timectxsw.T,columns=list(range(0,8)))
 timetctxsw=pd.DataFrame(data=_timetctxsw.T,columns=list(range(0,8)))
@@ -4,22 +4,14 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
 import random 
-def processing(M):
-    #total=0
-    L=[]
-    H=[]
-    for i in M:
-        if i.isdigit():
-            L.append(int(i))
-        else:
-             L.append(int(99999999))
-    P=np.percentile(L,99)
-    for i in L:
-        if i <= int(P):
-            H.append(int(i))
-        else:
-            H.append(int(P))
-    return H
+import sys
+import pathlib
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from loader import load_output
+def processing(path):
+    # Parse the text output and clamp everything above the 99th percentile to it (unparseable
+    # lines count as 99999999 before clamping)
+    return load_output(path, fmt='text', clamp_percentile=99).deltas
 g = os.walk("test_KVM_4_13_nonovercommit")
 ref=[]
 files=[]
@@ -38,18 +30,15 @@ for i,j in zip(ref,files):
     index=i[0]
     exactly=i[2]
 #    print(index, exactly)
-    f = open(j)
-    tmp = (f.read().splitlines())
-    tmp = processing(tmp)
+    tmp = processing(j)
     if exactly == "timetctxsw2.out":
-        timetctxsw2[int(index)-1].extend(tmp)
+        timetctxsw2[int(index)-1].append(tmp)
     elif exactly == "timetctxsw.out":
-        timetctxsw[int(index)-1].extend(tmp)
+        timetctxsw[int(index)-1].append(tmp)
     elif exactly == "timectxsw.out":
-        timectxsw[int(index)-1].extend(tmp)
+        timectxsw[int(index)-1].append(tmp)
     else:
-        timesyscall[int(index)-1].extend(tmp)
-    f.close()
+        timesyscall[int(index)-1].append(tmp)
 """
 for i in timetctxsw2:
     print(len(i))
@@ -60,10 +49,10 @@ for i in timectxsw:
 for i in timesyscall:
     print(len(i))
 """
-_timectxsw=np.array(timectxsw)
-_timetctxsw=np.array(timetctxsw)
-_timetctxsw2=np.array(timetctxsw2)
-_timesyscall=np.array(timesyscall)
+_timectxsw=np.array([np.concatenate(x) for x in timectxsw])
+_timetctxsw=np.array([np.concatenate(x) for x in timetctxsw])
+_timetctxsw2=np.array([np.concatenate(x) for x in timetctxsw2])
+_timesyscall=np.array([np.concatenate(x) for x in timesyscall])
 
 timectxsw=pd.DataFrame(data=_timectxsw.T,columns=list(range(0,13)))
 timetctxsw=pd.DataFrame(data=_timetctxsw.T,columns=list(range(0,13)))
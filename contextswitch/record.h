@@ -0,0 +1,97 @@
+// The output record and the helpers every benchmark listed in vm/registry.py is built on. Every
+// benchmark writes the same binary record to the file named by its first argument: the run's
+// clock_gettime duration in ns as a 64-bit integer, then one 32-bit rdtsc delta per iteration.
+// The optional second argument overrides the iteration count.
+
+#ifndef RECORD_H
+#define RECORD_H
+
+#include <limits.h>
+#include <fcntl.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/mman.h>
+#include <time.h>
+#include <unistd.h>
+
+static inline unsigned long rdtsc(void) {
+  unsigned long low, high;
+  asm volatile("rdtsc" : "=a" (low), "=d" (high));
+  return ((low) | (high) << 32);
+}
+
+// Deltas are stored as 32 bits. A longer one (over a second, e.g. a long deschedule) is stored as
+// UINT_MAX rather than wrapped, so the analysis can tell it apart.
+static inline unsigned int saturate(unsigned long long cycles) {
+  return cycles > UINT_MAX ? UINT_MAX : (unsigned int) cycles;
+}
+
+static inline long long unsigned time_ns(struct timespec* const ts) {
+  if (clock_gettime(CLOCK_REALTIME, ts)) {
+    exit(1);
+  }
+  return ((long long unsigned) ts->tv_sec) * 1000000000LLU
+    + (long long unsigned) ts->tv_nsec;
+}
+
+// The iteration count: the optional second argument (used by the adaptive run mode to run in
+// batches), or the program's default
+static inline int parse_iterations(int argc, char **argv, int iterations) {
+  if (argc >= 3) {
+    iterations = atoi(argv[2]);
+    if (iterations <= 0) {
+      exit(1);
+    }
+  }
+  return iterations;
+}
+
+// Results array, zeroed and locked. If progress_path names a file (on tmpfs), the array is a
+// shared mapping of that file, so the guest can follow the run from outside (see vm/telemetry.py):
+// deltas are filled in order and are never zero, so the iterations completed so far are the
+// non-zero prefix.
+static inline unsigned int *map_results(int iterations, const char *progress_path) {
+  const size_t size = sizeof(unsigned int) * iterations;
+  unsigned int *results;
+  if (progress_path == NULL) {
+    results = malloc(size);
+    if (results == NULL) {
+      exit(1);
+    }
+  } else {
+    const int fd = open(progress_path, O_RDWR | O_CREAT | O_TRUNC, 0644);
+    if (fd < 0 || ftruncate(fd, size)) {
+      exit(1);
+    }
+    results = mmap(NULL, size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+    if (results == MAP_FAILED) {
+      exit(1);
+    }
+    close(fd);
+  }
+  memset(results, 0, size);
+  mlock(results, size);
+  return results;
+}
+
+// The array of the deltas written out, followed through BENCHMARK_PROGRESS if it is set
+static inline unsigned int *alloc_results(int iterations) {
+  return map_results(iterations, getenv("BENCHMARK_PROGRESS"));
+}
+
+static inline int write_results(int argc, char **argv, long long unsigned delta,
+                         const unsigned int *results, int iterations) {
+  if (argc >= 2) {
+    FILE* out = fopen(argv[1], "w");
+    if (out == NULL) {
+      return 1;
+    }
+    fwrite(&delta, sizeof(unsigned long long), 1, out);
+    fwrite(results, sizeof(unsigned int), iterations, out);
+    fclose(out);
+  }
+  return 0;
+}
+
+#endif
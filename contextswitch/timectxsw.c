@@ -14,39 +14,16 @@
 // along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 #include <sched.h>
-#include <stdio.h>
-#include <stdlib.h>
 #include <sys/ipc.h>
 #include <sys/shm.h>
 #include <sys/syscall.h>
 #include <sys/wait.h>
-#include <time.h>
-#include <unistd.h>
 
 #include <linux/futex.h>
-#include <string.h>
-#include <sys/mman.h>
-
-static inline unsigned long rdtsc(void) {
-  unsigned long low, high;
-  asm volatile("rdtsc" : "=a" (low), "=d" (high));
-  return ((low) | (high) << 32);
-}
-
-static inline long long unsigned time_ns(struct timespec* const ts) {
-  if (clock_gettime(CLOCK_REALTIME, ts)) {
-    exit(1);
-  }
-  return ((long long unsigned) ts->tv_sec) * 1000000000LLU
-    + (long long unsigned) ts->tv_nsec;
-}
+#include "record.h"
 
 int main(int argc, char **argv) {
-  const int iterations = 500000;
-
-  unsigned int *results = malloc(sizeof(unsigned int) * iterations);
-  memset(results, 0, sizeof(unsigned int) * iterations);
-  int ret = mlock(results, sizeof(unsigned int) * iterations);
+  const int iterations = parse_iterations(argc, argv, 500000);
 
   const int shm_id = shmget(IPC_PRIVATE, sizeof (int), IPC_CREAT | 0666);
   const pid_t other = fork();
@@ -56,6 +33,8 @@ int main(int argc, char **argv) {
   unsigned long long start, stop;
 
   if (other == 0) {
+    // The child's deltas are never written out, so its array stays private
+    unsigned int *results = map_results(iterations, NULL);
     start = rdtsc();
     for (int i = 0; i < iterations; i++) {
       sched_yield();
@@ -69,11 +48,12 @@ int main(int argc, char **argv) {
         sched_yield();
       }
       stop = rdtsc();
-      results[i] = (unsigned int)(stop-start);
+      results[i] = saturate(stop - start);
       start = stop;
     }
     return 0;
   }
+  unsigned int *results = alloc_results(iterations);
   struct timespec ts;
   const long long unsigned start_ns = time_ns(&ts);
   start = rdtsc();
@@ -89,22 +69,12 @@ int main(int argc, char **argv) {
       sched_yield();
     }
     stop = rdtsc();
-    results[i] = (unsigned int)(stop-start);
+    results[i] = saturate(stop - start);
     start = stop;
   }
   const long long unsigned delta = time_ns(&ts) - start_ns;
 
-  if (argc == 2) {
-    FILE* out; 
-    out = fopen(argv[1], "w");
-    if (out == NULL) {
-      return 1;
-    }
-    fwrite(&delta, sizeof(unsigned long long), 1, out);
-    fwrite(results, sizeof(unsigned int), iterations, out);
-    fclose(out);
-  }
-
+  const int ret = write_results(argc, argv, delta, results, iterations);
   wait(futex);
-  return 0;
+  return ret;
 }
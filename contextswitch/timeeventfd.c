@@ -0,0 +1,55 @@
+// Benchmarks a ping-pong between two threads over a pair of eventfds: the lightest kernel
+// wakeup primitive with a file descriptor, as used by virtio backends and KVM irqfds.
+
+#include <pthread.h>
+#include <stdint.h>
+#include <sys/eventfd.h>
+#include "record.h"
+
+static int iterations;
+static int ping, pong;
+
+static void* thread(void* unused) {
+  (void) unused;
+  uint64_t value;
+  for (int i = 0; i < iterations; i++) {
+    if (read(ping, &value, sizeof value) != sizeof value || write(pong, &value, sizeof value) != sizeof value) {
+      exit(2);
+    }
+  }
+  return NULL;
+}
+
+int main(int argc, char **argv) {
+  iterations = parse_iterations(argc, argv, 500000);
+  unsigned int *results = alloc_results(iterations);
+
+  ping = eventfd(0, 0);
+  pong = eventfd(0, 0);
+  if (ping < 0 || pong < 0) {
+    return 1;
+  }
+  pthread_t thd;
+  if (pthread_create(&thd, NULL, thread, NULL)) {
+    return 1;
+  }
+
+  struct timespec ts;
+  const long long unsigned start_ns = time_ns(&ts);
+
+  uint64_t value = 1;
+  unsigned long long start, stop;
+  start = rdtsc();
+  for (int i = 0; i < iterations; i++) {
+    if (write(ping, &value, sizeof value) != sizeof value || read(pong, &value, sizeof value) != sizeof value) {
+      return 2;
+    }
+    stop = rdtsc();
+    results[i] = saturate(stop - start);
+    start = stop;
+  }
+  const long long unsigned delta = time_ns(&ts) - start_ns;
+
+  pthread_join(thd, NULL);
+  return write_results(argc, argv, delta, results, iterations);
+}
@@ -0,0 +1,91 @@
+// Benchmarks cross-vCPU wakeups. The measuring thread runs on the BENCHMARK_VCPU'th (default 0)
+// CPU the process may use and its partner on the next one. Both block in FUTEX_WAIT between turns,
+// so their vCPUs go idle and every wakeup needs an inter-processor interrupt; each iteration is a
+// round trip of two. The threads place themselves, so the process must be allowed at least two
+// CPUs: all of a guest's vCPUs, or the CPUs of one VM-equivalent when run natively.
+
+#include <linux/futex.h>
+#include <pthread.h>
+#include <sched.h>
+#include <sys/syscall.h>
+#include "record.h"
+
+static int iterations;
+// Turn numbers: ping is advanced by the measuring thread, pong by its partner
+static int ping, pong;
+
+static void pin(int cpu) {
+  cpu_set_t set;
+  CPU_ZERO(&set);
+  CPU_SET(cpu, &set);
+  if (pthread_setaffinity_np(pthread_self(), sizeof set, &set)) {
+    exit(1);
+  }
+}
+
+// The n'th CPU in a set, counting round
+static int nth_cpu(const cpu_set_t *set, int n) {
+  n %= CPU_COUNT(set);
+  for (int cpu = 0; cpu < CPU_SETSIZE; cpu++) {
+    if (CPU_ISSET(cpu, set) && n-- == 0) {
+      return cpu;
+    }
+  }
+  exit(1);
+}
+
+static void wait_for(int *word, int value) {
+  int seen;
+  while ((seen = __atomic_load_n(word, __ATOMIC_ACQUIRE)) != value) {
+    syscall(SYS_futex, word, FUTEX_WAIT, seen, NULL, NULL, 0);
+  }
+}
+
+static void advance(int *word, int value) {
+  __atomic_store_n(word, value, __ATOMIC_RELEASE);
+  syscall(SYS_futex, word, FUTEX_WAKE, 1, NULL, NULL, 0);
+}
+
+static void* partner(void* cpu) {
+  pin((int) (long) cpu);
+  for (int i = 1; i <= iterations; i++) {
+    wait_for(&ping, i);
+    advance(&pong, i);
+  }
+  return NULL;
+}
+
+int main(int argc, char **argv) {
+  iterations = parse_iterations(argc, argv, 500000);
+  unsigned int *results = alloc_results(iterations);
+
+  cpu_set_t allowed;
+  if (sched_getaffinity(0, sizeof allowed, &allowed)) {
+    return 1;
+  }
+  const char *vcpu = getenv("BENCHMARK_VCPU");
+  const int n = vcpu == NULL ? 0 : atoi(vcpu);
+  const int partner_cpu = nth_cpu(&allowed, n + 1);
+  pin(nth_cpu(&allowed, n));
+  pthread_t thd;
+  if (pthread_create(&thd, NULL, partner, (void *) (long) partner_cpu)) {
+    return 1;
+  }
+
+  struct timespec ts;
+  const long long unsigned start_ns = time_ns(&ts);
+
+  unsigned long long start, stop;
+  start = rdtsc();
+  for (int i = 1; i <= iterations; i++) {
+    advance(&ping, i);
+    wait_for(&pong, i);
+    stop = rdtsc();
+    results[i-1] = saturate(stop - start);
+    start = stop;
+  }
+  const long long unsigned delta = time_ns(&ts) - start_ns;
+
+  pthread_join(thd, NULL);
+  return write_results(argc, argv, delta, results, iterations);
+}
@@ -0,0 +1,31 @@
+// Benchmarks page-fault-heavy memory management: every iteration maps an anonymous page, faults
+// it in with a write and unmaps it again. Under shadow paging each step traps to Xen, under
+// HAP only the guest's own page tables change.
+
+#include "record.h"
+
+int main(int argc, char **argv) {
+  const int iterations = parse_iterations(argc, argv, 1000000);
+  unsigned int *results = alloc_results(iterations);
+  const long page_size = sysconf(_SC_PAGESIZE);
+
+  struct timespec ts;
+  const long long unsigned start_ns = time_ns(&ts);
+
+  unsigned long long start, stop;
+  start = rdtsc();
+  for (int i = 0; i < iterations; i++) {
+    volatile char *page = mmap(NULL, page_size, PROT_READ | PROT_WRITE, MAP_PRIVATE | MAP_ANONYMOUS, -1, 0);
+    if (page == MAP_FAILED) {
+      return 2;
+    }
+    page[0] = 1;
+    munmap((void *) page, page_size);
+    stop = rdtsc();
+    results[i] = saturate(stop - start);
+    start = stop;
+  }
+  const long long unsigned delta = time_ns(&ts) - start_ns;
+
+  return write_results(argc, argv, delta, results, iterations);
+}
@@ -0,0 +1,47 @@
+// Benchmarks a one-byte ping-pong between two processes over a pair of pipes. Each iteration is
+// a round trip: two writes, two blocking reads and two context switches.
+
+#include <sys/wait.h>
+#include "record.h"
+
+int main(int argc, char **argv) {
+  const int iterations = parse_iterations(argc, argv, 500000);
+  unsigned int *results = alloc_results(iterations);
+
+  int ping[2], pong[2];
+  if (pipe(ping) || pipe(pong)) {
+    return 1;
+  }
+  char byte = 0;
+
+  const pid_t other = fork();
+  if (other < 0) {
+    return 1;
+  }
+  if (other == 0) {
+    for (int i = 0; i < iterations; i++) {
+      if (read(ping[0], &byte, 1) != 1 || write(pong[1], &byte, 1) != 1) {
+        exit(2);
+      }
+    }
+    exit(0);
+  }
+
+  struct timespec ts;
+  const long long unsigned start_ns = time_ns(&ts);
+
+  unsigned long long start, stop;
+  start = rdtsc();
+  for (int i = 0; i < iterations; i++) {
+    if (write(ping[1], &byte, 1) != 1 || read(pong[0], &byte, 1) != 1) {
+      return 2;
+    }
+    stop = rdtsc();
+    results[i] = saturate(stop - start);
+    start = stop;
+  }
+  const long long unsigned delta = time_ns(&ts) - start_ns;
+
+  waitpid(other, NULL, 0);
+  return write_results(argc, argv, delta, results, iterations);
+}
@@ -13,37 +13,13 @@
 // You should have received a copy of the GNU General Public License
 // along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-#include <stdio.h>
-#include <stdlib.h>
 #include <sys/syscall.h>
-#include <time.h>
-#include <unistd.h>
-#include <string.h>
-#include <sys/mman.h>
-
-static inline unsigned long rdtsc(void) {
-  unsigned long low, high;
-  asm volatile("rdtsc" : "=a" (low), "=d" (high));
-  return ((low) | (high) << 32);
-}
-
-static inline long long unsigned time_ns(struct timespec* const ts) {
-  if (clock_gettime(CLOCK_REALTIME, ts)) {
-    exit(1);
-  }
-  return ((long long unsigned) ts->tv_sec) * 1000000000LLU
-    + (long long unsigned) ts->tv_nsec;
-}
+#include "record.h"
 
 int main(int argc, char **argv) {
+  const int iterations = parse_iterations(argc, argv, 10000000);
+  unsigned int *results = alloc_results(iterations);
 
-  const int iterations = 10000000;
-
-  // Array for results
-  unsigned int *results = malloc(sizeof(unsigned int) * iterations);
-  memset(results, 0, sizeof(unsigned int) * iterations);
-  while(0 != mlock(results, sizeof(unsigned int) * iterations));
-  
   // For gettime
   struct timespec ts;
   const long long unsigned start_ns = time_ns(&ts);
@@ -58,22 +34,11 @@ int main(int argc, char **argv) {
       exit(2);
     }
     stop = rdtsc();
-    results[i] = (unsigned int)(stop - start);
+    results[i] = saturate(stop - start);
     start = stop;
   }
   
-  const long unsigned delta = time_ns(&ts) - start_ns;
-
-  if (argc == 2) {
-    FILE* out; 
-    out = fopen(argv[1], "w");
-    if (out == NULL) {
-      return 1;
-    }
-    fwrite(&delta, sizeof(unsigned long long), 1, out);
-    fwrite(results, sizeof(unsigned int), iterations, out);
-    fclose(out);
-  }
+  const long long unsigned delta = time_ns(&ts) - start_ns;
 
-  return 0;
+  return write_results(argc, argv, delta, results, iterations);
 }
@@ -15,34 +15,15 @@
 
 #include <pthread.h>
 #include <sched.h>
-#include <stdio.h>
-#include <stdlib.h>
 #include <sys/ipc.h>
 #include <sys/shm.h>
 #include <sys/syscall.h>
 #include <sys/wait.h>
-#include <time.h>
-#include <unistd.h>
 
 #include <linux/futex.h>
-#include <string.h>
-#include <sys/mman.h>
+#include "record.h"
 
-static inline unsigned long rdtsc(void) {
-  unsigned long low, high;
-  asm volatile("rdtsc" : "=a" (low), "=d" (high));
-  return ((low) | (high) << 32);
-}
-
-static inline long long unsigned time_ns(struct timespec* const ts) {
-  if (clock_gettime(CLOCK_REALTIME, ts)) {
-    exit(1);
-  }
-  return ((long long unsigned) ts->tv_sec) * 1000000000LLU
-    + (long long unsigned) ts->tv_nsec;
-}
-
-static const int iterations = 500000;
+static int iterations = 500000;
 
 static void* thread(void* restrict ftx) {
   int* futex = (int*) ftx;
@@ -62,13 +43,12 @@ static void* thread(void* restrict ftx) {
 }
 
 int main(int argc, char **argv) {
+  iterations = parse_iterations(argc, argv, iterations);
   struct timespec ts;
   const int shm_id = shmget(IPC_PRIVATE, sizeof (int), IPC_CREAT | 0666);
   int* futex = shmat(shm_id, NULL, 0);
 
-  unsigned int *results = malloc(sizeof(unsigned int) * iterations);
-  memset(results, 0, sizeof(unsigned int) * iterations);
-  int ret = mlock(results, sizeof(unsigned int) * iterations); 
+  unsigned int *results = alloc_results(iterations);
 
   pthread_t thd;
   if (pthread_create(&thd, NULL, thread, futex)) {
@@ -92,23 +72,12 @@ int main(int argc, char **argv) {
       sched_yield();
     }
     stop = rdtsc();
-    results[i] = (unsigned int)(stop-start);
+    results[i] = saturate(stop - start);
     start = stop;
   }
   const long long unsigned delta = time_ns(&ts) - start_ns;
 
-  if (argc == 2) {
-    FILE* out; 
-    out = fopen(argv[1], "w");
-    if (out == NULL) {
-      return 1;
-    }
-    fwrite(&delta, sizeof(unsigned long long), 1, out);
-    fwrite(results, sizeof(unsigned int), iterations, out);
-    fclose(out);
-  }
-
-
+  const int ret = write_results(argc, argv, delta, results, iterations);
   wait(futex);
-  return 0;
+  return ret;
 }
@@ -15,31 +15,10 @@
 
 #include <sched.h>
 #include <pthread.h>
-#include <unistd.h>
-#include <stdio.h>
-#include <stdlib.h>
-#include <time.h>
-#include <string.h>
 #include <errno.h>
+#include "record.h"
 
-#include <string.h>
-#include <sys/mman.h>
-
-static inline unsigned long rdtsc(void) {
-  unsigned long low, high;
-  asm volatile("rdtsc" : "=a" (low), "=d" (high));
-  return ((low) | (high) << 32);
-}
-
-static inline long long unsigned time_ns(struct timespec* const ts) {
-  if (clock_gettime(CLOCK_REALTIME, ts)) {
-    exit(1);
-  }
-  return ((long long unsigned) ts->tv_sec) * 1000000000LLU
-    + (long long unsigned) ts->tv_nsec;
-}
-
-static const int iterations = 500000;
+static int iterations = 500000;
 
 static void* thread(void*ctx) {
   (void)ctx;
@@ -49,9 +28,8 @@ static void* thread(void*ctx) {
 }
 
 int main(int argc, char **argv) {
-  unsigned int *results = malloc(sizeof(unsigned int) * iterations);
-  memset(results, 0, sizeof(unsigned int) * iterations);
-  int ret = mlock(results, sizeof(unsigned int) * iterations);
+  iterations = parse_iterations(argc, argv, iterations);
+  unsigned int *results = alloc_results(iterations);
 
   unsigned long long start, stop;
   struct sched_param param;
@@ -71,21 +49,10 @@ int main(int argc, char **argv) {
   {
       sched_yield();
       stop = rdtsc();
-      results[i] = (unsigned int)(stop-start);
+      results[i] = saturate(stop - start);
       start = stop;
   }
   long long unsigned delta = time_ns(&ts) - start_ns;
 
-  if (argc == 2) {
-    FILE* out; 
-    out = fopen(argv[1], "w");
-    if (out == NULL) {
-      return 1;
-    }
-    fwrite(&delta, sizeof(unsigned long long), 1, out);
-    fwrite(results, sizeof(unsigned int), iterations, out);
-    fclose(out);
-  }
-  
-  return 0;
+  return write_results(argc, argv, delta, results, iterations);
 }
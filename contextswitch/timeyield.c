@@ -0,0 +1,25 @@
+// Benchmarks sched_yield(): a system call that enters the scheduler each time, which is
+// paravirtualised differently from a plain system call such as timesyscall's gettid.
+
+#include <sched.h>
+#include "record.h"
+
+int main(int argc, char **argv) {
+  const int iterations = parse_iterations(argc, argv, 10000000);
+  unsigned int *results = alloc_results(iterations);
+
+  struct timespec ts;
+  const long long unsigned start_ns = time_ns(&ts);
+
+  unsigned long long start, stop;
+  start = rdtsc();
+  for (int i = 0; i < iterations; i++) {
+    sched_yield();
+    stop = rdtsc();
+    results[i] = saturate(stop - start);
+    start = stop;
+  }
+  const long long unsigned delta = time_ns(&ts) - start_ns;
+
+  return write_results(argc, argv, delta, results, iterations);
+}
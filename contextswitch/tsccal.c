@@ -0,0 +1,51 @@
+// Measures the TSC rate against CLOCK_MONOTONIC_RAW, so the benchmarks' cycle counts can be
+// converted to nanoseconds independently of their own clock_gettime totals. Busy-waits through a
+// number of short windows (5 by default, or the first argument) and prints one JSON object with
+// the median rate in cycles per ns and the rate of every window.
+
+#include "record.h"
+
+#define WINDOW_NS 20000000LL
+
+static long long raw_ns(void) {
+  struct timespec ts;
+  if (clock_gettime(CLOCK_MONOTONIC_RAW, &ts)) {
+    exit(1);
+  }
+  return ts.tv_sec * 1000000000LL + ts.tv_nsec;
+}
+
+static int compare(const void *a, const void *b) {
+  const double x = *(const double *) a, y = *(const double *) b;
+  return (x > y) - (x < y);
+}
+
+int main(int argc, char **argv) {
+  const int windows = argc >= 2 ? atoi(argv[1]) : 5;
+  if (windows <= 0) {
+    return 1;
+  }
+  double *rates = malloc(sizeof(double) * windows);
+  double *sorted = malloc(sizeof(double) * windows);
+  if (rates == NULL || sorted == NULL) {
+    return 1;
+  }
+
+  for (int w = 0; w < windows; w++) {
+    const long long start_ns = raw_ns();
+    const unsigned long long start = rdtsc();
+    long long stop_ns;
+    while ((stop_ns = raw_ns()) - start_ns < WINDOW_NS);
+    const unsigned long long stop = rdtsc();
+    rates[w] = (double) (stop - start) / (double) (stop_ns - start_ns);
+  }
+  memcpy(sorted, rates, sizeof(double) * windows);
+  qsort(sorted, windows, sizeof(double), compare);
+
+  printf("{\"cycles_per_ns\": %.6f, \"window_ns\": %lld, \"windows\": [", sorted[windows / 2], WINDOW_NS);
+  for (int w = 0; w < windows; w++) {
+    printf("%s%.6f", w ? ", " : "", rates[w]);
+  }
+  printf("]}\n");
+  return 0;
+}
@@ -1,7 +1,11 @@
 import pathlib
 import numpy as np
-import zipfile
+import matplotlib
+matplotlib.use('Agg')
 from matplotlib import pyplot as plt
+from store import open_results
+from timeseries import rolling_mean, downsample
+from vm.configs import Config, format_results_dir, vary
 
 program_dir = pathlib.Path(__file__).parent
 
@@ -12,76 +16,49 @@ BENCHMARK = 'timectxsw'
 def reject_outliers(data, m=2):
     return data[abs(data - np.mean(data)) < m * np.std(data)]
 
-def bicond(a, b):
-    return (a and b) or (not a and not b)
-
-means = np.zeros(NUM_VMS)
-medians = np.zeros(NUM_VMS)
-
-combinations = [
-    (num_vms, virt_type, pinning, taskset, scheduler, mem_management, slop) 
-    for num_vms in ('13VM',)
-    for virt_type in ('pv',)
-    for pinning in ('pinning-on',)
-    for taskset in ('taskset-on',)
-    for scheduler in ('credit2-1ms', 'credit2-10ms')
-    for mem_management in ('pv-mmu',)
-    for slop in ('default-slop',)
-    if bicond(virt_type == 'pv', mem_management == 'pv-mmu')
-]
-
-legends = []
+# The configurations to compare: this one, with only the scheduler changed
+base_config = Config(num_vms='13VM', virt_method='pv', vcpu_pinning='pinning-on', taskset='taskset-on',
+                     scheduler='credit2-1ms', hyperthreading='ht-off', mem_management='pv-mmu',
+                     dom0_cpus='dom0-all-cpus', slop='default-slop')
+combinations = [config for config in vary(base_config, 'scheduler')
+                if config.scheduler in ('credit2-1ms', 'credit2-10ms')]
 
 kernel_size = 1000
 
+# Points per line after smoothing; 10M-sample series are decimated to this before plotting
+plot_points = 4000
 
-for num_vms, virt_type, pinning, taskset, scheduler, mem_management, slop in combinations:
-
-    # for vm_count in range(1, NUM_VMS+1):
-    for vm_count in range(13, 14):
+# Raw zip tree or an ingested store (see store.py)
+results = open_results(program_dir.parent)
 
-        benchmark_name = f'({num_vms})({virt_type})({pinning})({taskset})({scheduler})(ht-off)({mem_management})(dom0-all-cpus)({slop})'
-        with zipfile.ZipFile(program_dir.parent / benchmark_name / str(vm_count) / f'{BENCHMARK}.zip', mode='r', compression=zipfile.ZIP_DEFLATED) as zf:
-
-            per_core_means = np.zeros(NUM_VCPUS)
-            # per_core_medians = np.zeros(NUM_VCPUS)
-            
-            for i in range(NUM_VCPUS):
-                with zf.open(f'{BENCHMARK}{i}.out') as f:
-                    plot_name = f'{scheduler}'
-                    print(plot_name)
-                    legends.append(plot_name)
-                    result_bytes = f.read()
-                    time = np.frombuffer(result_bytes, dtype=np.int64, count=1)[0]
-                    print(time)
-                    result_array = np.frombuffer(result_bytes, dtype=np.uint32, offset=8)[::1]
-
-                    print(len(result_array))
-
-                    # print(len(result_array), result_array[0:100].reshape(20,5).tolist())
+# One panel per VM count, one line per (combination, vCPU), coloured by combination
+fig, axes = plt.subplots(NUM_VMS, 1, figsize=(8, 2*NUM_VMS), squeeze=False)
+legends = []
 
+for colour, config in enumerate(combinations):
 
-                    # result_array = reject_outliers(result_array)
+    legends.append(config.scheduler)
 
-                    # print(len(result_array), result_array[0:100].reshape(20,5).tolist())
+    for vm_count in range(1, NUM_VMS+1):
 
+        benchmark_name = format_results_dir(config)
+        ax = axes[vm_count-1, 0]
 
-                    # per_core_means[i] = np.mean(result_array)
+        for i, time, result_array in results.outputs(benchmark_name, vm_count, BENCHMARK):
 
-                    kernel = np.ones(kernel_size) / kernel_size
-                    data_convolved = np.convolve(result_array, kernel, mode='same')
+            # result_array = reject_outliers(result_array)
 
-                    plt.plot(np.linspace(0, time, len(data_convolved)), data_convolved, linewidth=0.5)
+            # O(n) rolling mean, same alignment as np.convolve(..., mode='same')
+            data_convolved = rolling_mean(result_array, kernel_size)
+            x, y = downsample(np.linspace(0, time, len(data_convolved)), data_convolved, plot_points)
 
-                    # per_core_medians[i] = np.median(result_array)
-        means[vm_count-1] = np.mean(per_core_means)
-        # medians[vm_count-1] = np.mean(per_core_medians)
+            ax.plot(x, y, linewidth=0.5, color=f'C{colour}', label=legends[-1] if i == 0 else None)
 
-    # plt.plot(range(1, NUM_VMS+1), means)
-    # plt.plot(range(1, NUM_VMS+1), medians)
+        ax.set_title(f'{vm_count}VM', fontsize='small')
 
 # plt.ylim(bottom=2700, top=3200)
-plt.legend(legends)
+axes[0, 0].legend()
+fig.tight_layout()
 
 # plt.show()
 
@@ -0,0 +1,128 @@
+import sys
+import pathlib
+import argparse
+import collections
+import numpy as np
+import pandas as pd
+from summary_db import ALL_VCPUS, DEFAULT_DB, METRICS, connect
+from vm.configs import DIMENSIONS, DIMENSION_VALUES, parse
+
+# Factor studies over the whole configuration matrix. A ResultIndex holds one benchmark's summary
+# statistics as (configuration x VM count) arrays with every configuration encoded per dimension,
+# so "vary one factor, hold the rest" is a handful of array operations however many suites exist.
+
+FactorSlice = collections.namedtuple(
+    'FactorSlice', ['factor', 'levels', 'groups', 'vm_counts', 'values'])
+# groups:  one dict per combination of the other dimensions
+# values:  metric -> (groups, levels, vm_counts) array, NaN where a result is missing
+
+class ResultIndex:
+
+    def __init__(self, configs, vm_counts, metrics):
+        self.configs = list(configs)
+        self.vm_counts = np.asarray(vm_counts)
+        # metric -> (configs, vm_counts) array, NaN where a result is missing
+        self.metrics = metrics
+        # Index of each configuration's value in DIMENSION_VALUES, per dimension
+        self.codes = np.array(
+            [[DIMENSION_VALUES[d].index(v) for d, v in zip(DIMENSIONS, config)] for config in self.configs],
+            dtype=np.int8).reshape(-1, len(DIMENSIONS))
+
+    @classmethod
+    def from_db(cls, db, benchmark, vcpu=ALL_VCPUS, metrics=METRICS):
+        df = pd.read_sql_query(
+            f'SELECT suite, vm_count, {", ".join(metrics)} FROM summaries WHERE benchmark = ? AND vcpu = ?',
+            db, params=(benchmark, vcpu))
+        suites = sorted(df['suite'].unique())
+        vm_counts = np.sort(df['vm_count'].unique())
+        rows = df['suite'].map({suite : i for i, suite in enumerate(suites)}).to_numpy(dtype=np.int64)
+        columns = np.searchsorted(vm_counts, df['vm_count'].to_numpy())
+        arrays = {}
+        for metric in metrics:
+            arrays[metric] = np.full((len(suites), len(vm_counts)), np.nan)
+            arrays[metric][rows, columns] = df[metric].to_numpy(dtype=np.float64)
+        return cls([parse(suite) for suite in suites], vm_counts, arrays)
+
+    def mask(self, **fixed):
+        selected = np.ones(len(self.configs), dtype=bool)
+        for dimension, value in fixed.items():
+            selected &= self.codes[:, DIMENSIONS.index(dimension)] == DIMENSION_VALUES[dimension].index(value)
+        return selected
+
+    def vary(self, factor, levels=None, **fixed):
+        # Line up every group of configurations that differ only in `factor`
+        levels = tuple(levels or DIMENSION_VALUES[factor])
+        column = DIMENSIONS.index(factor)
+        level_of_code = np.full(len(DIMENSION_VALUES[factor]), -1)
+        level_of_code[[DIMENSION_VALUES[factor].index(level) for level in levels]] = np.arange(len(levels))
+
+        fixed = {d : v for d, v in fixed.items() if d != factor}
+        rows = np.flatnonzero(self.mask(**fixed) & (level_of_code[self.codes[:, column]] >= 0))
+        rest = np.delete(self.codes[rows], column, axis=1)
+        group_codes, group_of = np.unique(rest, axis=0, return_inverse=True)
+        group_of = group_of.reshape(-1)
+        level_of = level_of_code[self.codes[rows, column]]
+
+        other_dimensions = [d for d in DIMENSIONS if d != factor]
+        groups = [{d : DIMENSION_VALUES[d][c] for d, c in zip(other_dimensions, codes)} for codes in group_codes]
+        values = {}
+        for metric, array in self.metrics.items():
+            values[metric] = np.full((len(groups), len(levels), len(self.vm_counts)), np.nan)
+            values[metric][group_of, level_of] = array[rows]
+        return FactorSlice(factor, levels, groups, self.vm_counts, values)
+
+def level_ratios(factor_slice, metric, baseline=0):
+    # Geometric mean over all groups of each level's metric relative to the baseline level,
+    # per VM count: (levels, vm_counts). Groups missing either side are ignored.
+    values = factor_slice.values[metric]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_ratios = np.log(values / values[:, baseline:baseline+1, :])
+    return np.exp(np.nanmean(log_ratios, axis=0)), np.sum(~np.isnan(log_ratios), axis=0)
+
+####  Main program  ################################################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Effect of one factor across every configuration in the summary database.')
+    parser.add_argument(
+        'benchmark', help='benchmark to study (timesyscall, timectxsw etc.)')
+    parser.add_argument(
+        '--vary', required=True, choices=DIMENSIONS,
+        help='the factor to study')
+    parser.add_argument(
+        '--levels', nargs='+',
+        help='values of the factor to compare, the first is the baseline (all of them by default)')
+    parser.add_argument(
+        '--fix', action='append', default=[], metavar='DIMENSION=VALUE',
+        help='only consider configurations with this value (may be repeated)')
+    parser.add_argument(
+        '--metric', default='p50', choices=METRICS,
+        help='statistic to compare')
+    parser.add_argument(
+        '--db', type=pathlib.Path, default=DEFAULT_DB,
+        help='path to summary database')
+
+    args = parser.parse_args()
+
+    fixed = {}
+    for assignment in args.fix:
+        dimension, _, value = assignment.partition('=')
+        if dimension not in DIMENSIONS or value not in DIMENSION_VALUES[dimension]:
+            parser.error(f'Invalid --fix {assignment}')
+        fixed[dimension] = value
+    for level in args.levels or ():
+        if level not in DIMENSION_VALUES[args.vary]:
+            parser.error(f'{level} is not a value of {args.vary}')
+
+    index = ResultIndex.from_db(connect(args.db), args.benchmark, metrics=(args.metric,))
+    factor_slice = index.vary(args.vary, args.levels, **fixed)
+    if not factor_slice.groups:
+        sys.exit('No matching results')
+
+    ratios, pairs = level_ratios(factor_slice, args.metric)
+    columns = [f'{n}VM' for n in factor_slice.vm_counts]
+    print(f'{args.metric} relative to {factor_slice.levels[0]} '
+          f'(geometric mean over {len(factor_slice.groups)} configurations):')
+    print(pd.DataFrame(ratios, index=factor_slice.levels, columns=columns).round(3).to_string())
+    print('\nConfigurations compared:')
+    print(pd.DataFrame(pairs, index=factor_slice.levels, columns=columns).to_string())
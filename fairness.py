@@ -0,0 +1,138 @@
+import sys
+import pathlib
+import argparse
+import numpy as np
+import pandas as pd
+from store import open_results
+from summary import SUMMARY_SOURCES, CellSummary, map_cells, reduce_vms
+from cache import DEFAULT_CACHE_DIR, BuildCache, code_version, stage_key
+
+# Cross-VM view of every cell: how the VMs open at the same time fared against each other. Each
+# VM's outputs are reduced once to a CellSummary, cached under the same key bar-graphs.py uses
+# (the content hash of its zip and the summary code), and everything below works on those
+# summaries, so adding VMs costs one reduction per new zip and O(buckets) per statistic after that.
+#
+#   per VM:    count, mean, p50, p99, max
+#   per cell:  the same over all VMs merged, Jain's fairness index of the VMs' rates of progress,
+#              and the worst VM's p99 next to the best one's
+
+PER_VM_COLUMNS = ('suite', 'vm_count', 'benchmark', 'vm', 'count', 'mean', 'p50', 'p99', 'max')
+CELL_COLUMNS = ('suite', 'vm_count', 'benchmark', 'vms', 'count', 'p50', 'p99', 'jain',
+                'worst_vm', 'worst_p99', 'best_p99', 'p99_spread')
+
+def jain_index(rates):
+    # (sum x)^2 / (n * sum x^2): 1 when every VM progresses equally, 1/n when one VM gets everything
+    rates = np.asarray(rates, dtype=np.float64)
+    if not len(rates) or not (rates**2).sum():
+        return np.nan
+    return rates.sum()**2 / (len(rates) * (rates**2).sum())
+
+def vm_row(suite, vm_count, benchmark, vm, summary):
+    p50, p99 = summary.percentile([50, 99])
+    return {'suite' : suite, 'vm_count' : vm_count, 'benchmark' : benchmark, 'vm' : vm,
+            'count' : summary.count, 'mean' : summary.mean(), 'p50' : p50, 'p99' : p99, 'max' : summary.max}
+
+def cell_row(suite, vm_count, benchmark, summaries):
+    # summaries maps VM -> CellSummary of one cell
+    vms = sorted(vm for vm, s in summaries.items() if s.count)
+    combined = CellSummary()
+    for vm in vms:
+        combined.merge(summaries[vm])
+    p99s = {vm : float(summaries[vm].percentile(99)) for vm in vms}
+    worst_vm = max(p99s, key=p99s.get, default=None)
+    best_p99 = min(p99s.values(), default=np.nan)
+    p50, p99 = combined.percentile([50, 99])
+    return {
+        'suite'      : suite,
+        'vm_count'   : vm_count,
+        'benchmark'  : benchmark,
+        'vms'        : len(vms),
+        'count'      : combined.count,
+        'p50'        : p50,
+        'p99'        : p99,
+        # A VM's rate of progress is the inverse of its mean delta
+        'jain'       : jain_index([1 / summaries[vm].mean() for vm in vms]),
+        'worst_vm'   : worst_vm,
+        'worst_p99'  : p99s.get(worst_vm, np.nan),
+        'best_p99'   : best_p99,
+        'p99_spread' : p99s[worst_vm] / best_p99 if worst_vm is not None and best_p99 else np.nan,
+    }
+
+def vm_summaries(data_path, cache, benchmarks=None, suites=None, jobs=1):
+    # {(suite, vm_count, benchmark): {vm: CellSummary}}, reducing only the zips not yet cached
+    results = open_results(data_path)
+    version = code_version(*SUMMARY_SOURCES)
+    cells = {}
+    uncached = {}
+    for suite in results.suites():
+        if suites and suite not in suites:
+            continue
+        for vm_count in results.vm_counts(suite):
+            for benchmark in results.benchmarks(suite, vm_count):
+                if benchmarks and benchmark not in benchmarks:
+                    continue
+                summaries = cells[suite, vm_count, benchmark] = {}
+                for vm in results.vms(suite, vm_count, benchmark):
+                    key = stage_key(version, results.source_digest(suite, vm_count, benchmark, cache, vm))
+                    summaries[vm] = cache.load_summary(key)
+                    if summaries[vm] is None:
+                        uncached.setdefault((suite, vm_count, benchmark), {})[vm] = key
+    cache.save()
+
+    tasks = [(*cell, tuple(keys)) for cell, keys in uncached.items()]
+    for (suite, vm_count, benchmark, _), reduced in map_cells(reduce_vms, data_path, tasks, jobs):
+        for vm, summary in reduced.items():
+            cache.store_summary(uncached[suite, vm_count, benchmark][vm], summary)
+            cells[suite, vm_count, benchmark][vm] = summary
+    return cells
+
+def fairness_tables(cells):
+    # (per-cell table, per-VM table) as DataFrames
+    cell_rows, vm_rows = [], []
+    for (suite, vm_count, benchmark), summaries in sorted(cells.items()):
+        cell_rows.append(cell_row(suite, vm_count, benchmark, summaries))
+        vm_rows += [vm_row(suite, vm_count, benchmark, vm, s) for vm, s in sorted(summaries.items())]
+    return (pd.DataFrame(cell_rows, columns=CELL_COLUMNS), pd.DataFrame(vm_rows, columns=PER_VM_COLUMNS))
+
+####  Main program  ################################################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Per-VM distributions and fairness across the VMs of each cell.')
+    parser.add_argument(
+        'benchmark_data', metavar='benchmark-data', type=pathlib.Path,
+        help='path to benchmark data (raw zip tree or a store built with "store.py ingest")')
+    parser.add_argument(
+        'benchmark_names', metavar='benchmark-name', nargs='*',
+        help='benchmarks to analyse (timesyscall, timectxsw etc.), all of them if omitted')
+    parser.add_argument(
+        '--suite', action='append',
+        help='only analyse this results directory, e.g. "(13VM)(pvh)...(low-slop)" (may be repeated)')
+    parser.add_argument(
+        '--per-vm', action='store_true',
+        help='print every VM\'s statistics instead of one row per cell')
+    parser.add_argument(
+        '--csv', type=pathlib.Path,
+        help='also write the table to this CSV file')
+    parser.add_argument(
+        '--jobs', '-j', type=int, default=1,
+        help='number of worker processes')
+    parser.add_argument(
+        '--cache-dir', type=pathlib.Path, default=DEFAULT_CACHE_DIR,
+        help='build cache holding content hashes and per-VM summaries')
+
+    args = parser.parse_args()
+
+    if not args.benchmark_data.is_dir():
+        parser.error('Invalid benchmark data path specified')
+
+    cache = BuildCache(args.cache_dir)
+    cells = vm_summaries(args.benchmark_data, cache, args.benchmark_names, args.suite, args.jobs)
+    cache.save()
+    if not cells:
+        sys.exit('No matching results')
+
+    cell_table, vm_table = fairness_tables(cells)
+    table = vm_table if args.per_vm else cell_table
+    if args.csv:
+        table.to_csv(args.csv, index=False)
+    print(table.to_string(index=False))
@@ -0,0 +1,112 @@
+import numpy as np
+
+# HDR-style histogram for uint32 rdtsc deltas. Values below 2**SUB_BUCKET_BITS get a bucket each;
+# above that every power-of-two range is split into 2**(SUB_BUCKET_BITS-1) equal buckets, so any
+# recorded value is known to within 2**-(SUB_BUCKET_BITS-1) of itself (0.2% here). Bucketing is a
+# single vectorised pass and merging is an O(buckets) addition, so histograms can be combined
+# across vCPUs, VMs and runs without going back to the samples. Count, sum, min and max are
+# tracked exactly.
+
+SUB_BUCKET_BITS = 10
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+HALF_SUB_BUCKETS = SUB_BUCKETS >> 1
+VALUE_BITS = 32
+NUM_BUCKETS = (VALUE_BITS - SUB_BUCKET_BITS) * HALF_SUB_BUCKETS + SUB_BUCKETS
+
+def bucket_index(values):
+    values = np.asarray(values, dtype=np.int64)
+    # frexp is exact for 32-bit integers and its exponent is the bit length
+    shift = np.maximum(np.frexp(values)[1] - SUB_BUCKET_BITS, 0)
+    return shift * HALF_SUB_BUCKETS + (values >> shift)
+
+def bucket_bounds(indices):
+    # Inclusive lowest and highest value that map to each bucket index
+    indices = np.asarray(indices, dtype=np.int64)
+    shift = np.maximum(indices // HALF_SUB_BUCKETS - 1, 0)
+    low = (indices - shift * HALF_SUB_BUCKETS) << shift
+    return low, low + (1 << shift) - 1
+
+class LogHistogram:
+
+    def __init__(self):
+        self.counts = np.zeros(NUM_BUCKETS, dtype=np.int64)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def add(self, values):
+        if not len(values):
+            return
+        self.counts += np.bincount(bucket_index(values), minlength=NUM_BUCKETS)
+        self.count += len(values)
+        self.total += int(values.sum(dtype=np.int64))
+        low, high = int(values.min()), int(values.max())
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.count += other.count
+        self.total += other.total
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    def mean(self):
+        return self.total / self.count if self.count else np.nan
+
+    def percentile(self, q):
+        # Value at rank ceil(q/100 * count), reported as the midpoint of its bucket (clamped to the
+        # exact min and max). q may be an array.
+        q = np.asarray(q, dtype=np.float64)
+        if not self.count:
+            return np.full(q.shape, np.nan)
+        rank = np.clip(np.ceil(q / 100 * self.count), 1, self.count)
+        indices = np.searchsorted(np.cumsum(self.counts), rank)
+        low, high = bucket_bounds(indices)
+        return np.clip((low + high) / 2, self.min, self.max)
+
+    def median(self):
+        return float(self.percentile(50))
+
+    def nonzero(self):
+        indices = np.flatnonzero(self.counts)
+        return indices, self.counts[indices]
+
+    def values_and_counts(self):
+        # Representative value of each occupied bucket and its count
+        indices, counts = self.nonzero()
+        low, high = bucket_bounds(indices)
+        return (low + high) / 2, counts
+
+    #----------------------------------------------------------------------------------------------#
+
+    def __getstate__(self):
+        # Pickle only the occupied buckets so histograms stay small when sent between processes
+        indices, counts = self.nonzero()
+        return {'indices' : indices.astype(np.uint32), 'counts' : counts,
+                'total' : self.total, 'min' : self.min, 'max' : self.max}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.counts[state['indices']] = state['counts']
+        self.count = int(state['counts'].sum())
+        self.total, self.min, self.max = state['total'], state['min'], state['max']
+
+    def to_bytes(self):
+        # int64 header (buckets used, total, min, max), uint32 bucket indices, int64 counts
+        indices, counts = self.nonzero()
+        header = np.array([len(indices), self.total, self.min or 0, self.max or 0], dtype=np.int64)
+        return header.tobytes() + indices.astype(np.uint32).tobytes() + counts.tobytes()
+
+    @classmethod
+    def from_bytes(cls, raw_bytes):
+        n, total, low, high = (int(x) for x in np.frombuffer(raw_bytes, dtype=np.int64, count=4))
+        indices = np.frombuffer(raw_bytes, dtype=np.uint32, count=n, offset=32)
+        counts = np.frombuffer(raw_bytes, dtype=np.int64, count=n, offset=32 + 4*n)
+        histogram = cls()
+        histogram.__setstate__({'indices' : indices, 'counts' : counts, 'total' : total,
+                                'min' : low if n else None, 'max' : high if n else None})
+        return histogram
@@ -0,0 +1,92 @@
+import io
+import re
+import pathlib
+import collections
+import numpy as np
+import pandas as pd
+from vm.registry import BINARY_RECORD
+
+# One loader for both benchmark output formats:
+#
+#   binary (Xen guests):   int64 clock_gettime total in ns, then one uint32 rdtsc delta per iteration
+#   text (KVM/bare metal): one value per line, as written to stdout by cpubench.sh
+#
+# Either way the result is a BenchmarkOutput, so both kinds of results go through the same
+# analysis path. Text files have no clock_gettime total, so their clock_ns is None.
+
+# Every benchmark in the registry writes this layout
+HEADER_DTYPE = np.dtype(BINARY_RECORD.header_dtype)
+HEADER_BYTES = HEADER_DTYPE.itemsize
+SAMPLE_DTYPE = np.dtype(BINARY_RECORD.sample_dtype)
+
+# Value substituted for unparseable text lines, as post_process.py has always done
+INVALID_VALUE = 99_999_999
+
+TEXT_BYTES = frozenset(b'0123456789.+-eE \t\r\n')
+
+# Any non-empty line that is not a single number
+MALFORMED_LINE = re.compile(rb'(?m)^(?![ \t]*[-+]?[0-9.]+(?:[eE][-+]?[0-9]+)?[ \t\r]*$).+$')
+
+BenchmarkOutput = collections.namedtuple('BenchmarkOutput', ['clock_ns', 'deltas', 'format'])
+
+def looks_like_text(prefix):
+    # The binary header is a nanosecond count, whose low bytes are practically never all digits
+    return len(prefix) > 0 and all(b in TEXT_BYTES for b in prefix[:64])
+
+def decode_binary(raw_bytes):
+    clock_ns = int(np.frombuffer(raw_bytes, dtype=HEADER_DTYPE, count=1)[0])
+    deltas = np.frombuffer(raw_bytes, dtype=SAMPLE_DTYPE, offset=HEADER_BYTES)
+    return BenchmarkOutput(clock_ns, deltas, 'binary')
+
+def read_column(raw_bytes):
+    return pd.read_csv(io.BytesIO(raw_bytes), header=None, names=['value'],
+                       skip_blank_lines=False, engine='c', low_memory=False)['value']
+
+def parse_text(raw_bytes):
+    # Parsed by pandas' C tokenizer; blank or malformed lines become INVALID_VALUE
+    column = read_column(raw_bytes)
+    if not pd.api.types.is_numeric_dtype(column):
+        # Rare: blank out malformed lines so the whole column parses as numbers in C again
+        column = read_column(MALFORMED_LINE.sub(b'', raw_bytes))
+    values = column.to_numpy()
+    if np.issubdtype(values.dtype, np.floating):
+        invalid = np.isnan(values)
+        if invalid.any():
+            values = values.copy()
+            values[invalid] = INVALID_VALUE
+        # Whole numbers are kept as integers, fractional values (e.g. nanoseconds) as floats
+        if np.array_equal(values, np.floor(values)):
+            values = values.astype(np.int64)
+    return BenchmarkOutput(None, values, 'text')
+
+def clamp_outliers(values, percentile=99):
+    # Vectorised version of the per-element clamp in post_process.py: anything above the given
+    # percentile is replaced by it
+    if not len(values):
+        return values
+    limit = np.percentile(values, percentile)
+    if np.issubdtype(values.dtype, np.integer):
+        limit = int(limit)
+    return np.minimum(values, limit)
+
+def decode_output(raw_bytes, fmt='auto'):
+    if fmt == 'auto':
+        fmt = 'text' if looks_like_text(raw_bytes[:64]) else 'binary'
+    if fmt == 'binary':
+        return decode_binary(raw_bytes)
+    if fmt == 'text':
+        return parse_text(raw_bytes)
+    raise ValueError(f'Unknown output format {fmt}')
+
+def load_output(path, fmt='auto', clamp_percentile=None):
+    # Load a single .out file in either format, optionally clamping outliers
+    output = decode_output(pathlib.Path(path).read_bytes(), fmt)
+    if clamp_percentile is not None:
+        output = output._replace(deltas=clamp_outliers(output.deltas, clamp_percentile))
+    return output
+
+def as_samples(values):
+    # Deltas in the store/histogram sample type: text values are rounded and saturated to uint32
+    if values.dtype == SAMPLE_DTYPE:
+        return values
+    return np.clip(np.rint(values), 0, np.iinfo(SAMPLE_DTYPE).max).astype(SAMPLE_DTYPE)
@@ -0,0 +1,151 @@
+import sys
+import json
+import pathlib
+import argparse
+import numpy as np
+from histogram import LogHistogram
+from summary_db import ALL_VCPUS, DEFAULT_DB, PERCENTILES, connect
+from vm.configs import DIMENSIONS, DIMENSION_VALUES
+
+# One self-contained HTML page in place of the figs/ tree. Everything is read from the summary
+# database in a single query, reduced to what the page draws and embedded as JSON, so building it
+# costs one pass over the summaries and no raw data:
+#
+#   per cell     the configuration, VM count, benchmark, count, mean, min, max, percentiles and
+#                clock_gettime mean in cycles, cycles per ns, saturated and wrapped deltas
+#   distribution the histogram folded into BINS_PER_OCTAVE log-spaced bins, as fractions of 10000
+#   timelines    every vCPU's mean delta over --timeline-points equal parts of its run
+#
+# The page (report_template.html) filters cells by every configuration dimension, tabulates them,
+# draws the chosen metric against the VM count for the selected configurations, and overlays the
+# distributions and timelines of the selected cells, in cycles or ns.
+
+program_dir = pathlib.Path(__file__).parent
+
+TEMPLATE = program_dir/'report_template.html'
+DATA_MARKER = '/*REPORT_DATA*/null'
+DEFAULT_REPORT = program_dir/'report.html'
+
+BINS_PER_OCTAVE = 8
+DISTRIBUTION_SCALE = 10000
+DEFAULT_TIMELINE_POINTS = 32
+REPORT_METRICS = ('count', 'mean', 'min', 'max', *PERCENTILES, 'clock_ns')
+
+def distribution(histogram):
+    # (first bin, counts of the bins from there as fractions of DISTRIBUTION_SCALE), bin b holding
+    # the values in [2**(b/BINS_PER_OCTAVE), 2**((b+1)/BINS_PER_OCTAVE))
+    values, counts = histogram.values_and_counts()
+    if not len(counts):
+        return [0, []]
+    bins = np.floor(np.log2(np.maximum(values, 1)) * BINS_PER_OCTAVE).astype(np.int64)
+    first = int(bins.min())
+    folded = np.bincount(bins - first, weights=counts)
+    return [first, np.rint(folded / folded.sum() * DISTRIBUTION_SCALE).astype(np.int64).tolist()]
+
+def timeline_points(raw_bytes, block, count, points):
+    # A stored timeline averaged over `points` equal parts of the run, in whole cycles
+    means = np.frombuffer(raw_bytes, dtype='<f4').astype(np.float64)
+    if not len(means):
+        return []
+    weights = np.full(len(means), float(block))
+    weights[-1] = count - block * (len(means) - 1)
+    parts = np.array_split(np.arange(len(means)), min(points, len(means)))
+    return [round(float(np.average(means[part], weights=weights[part]))) for part in parts]
+
+def rounded(value):
+    # Metrics to 5 significant digits, which keeps the page small
+    return None if value is None else float(f'{value:.5g}')
+
+def report_data(db, benchmarks=None, fixed=None, timeline_points_per_vcpu=DEFAULT_TIMELINE_POINTS):
+    # The page's data: the dimension values and benchmarks present, and one column per cell field
+    conditions, parameters = [], []
+    if benchmarks:
+        conditions.append(f'benchmark IN ({", ".join("?"*len(benchmarks))})')
+        parameters += list(benchmarks)
+    for dimension, value in (fixed or {}).items():
+        conditions.append(f'{dimension} = ?')
+        parameters.append(value)
+    rows = db.execute(
+        f'SELECT {", ".join(DIMENSIONS)}, vm_count, benchmark, vcpu, {", ".join(REPORT_METRICS)}, '
+        f'cycles_per_ns, saturated, wraps, histogram, timeline, timeline_block FROM summaries '
+        f'{"WHERE " + " AND ".join(conditions) if conditions else ""} '
+        f'ORDER BY suite, vm_count, benchmark, vcpu', parameters)
+
+    cells = {}
+    timelines = {}
+    for row in rows:
+        config = row[:len(DIMENSIONS)]
+        vm_count, benchmark, vcpu, *values, rate, saturated, wraps, histogram, timeline, block = row[len(DIMENSIONS):]
+        key = (config, vm_count, benchmark)
+        if vcpu == ALL_VCPUS:
+            cells[key] = {**dict(zip(REPORT_METRICS, map(rounded, values))), 'rate' : rounded(rate),
+                          'saturated' : saturated, 'wraps' : wraps,
+                          'distribution' : distribution(LogHistogram.from_bytes(histogram))}
+        else:
+            timelines.setdefault(key, []).append(timeline_points(timeline, block, values[0], timeline_points_per_vcpu))
+
+    present = {d : [v for v in DIMENSION_VALUES[d] if any(c[i] == v for c, _, _ in cells)] for i, d in enumerate(DIMENSIONS)}
+    benchmark_names = sorted({b for _, _, b in cells})
+    keys = list(cells)
+    columns = {
+        'config'    : [[present[d].index(v) for d, v in zip(DIMENSIONS, c)] for c, _, _ in keys],
+        'vm_count'  : [n for _, n, _ in keys],
+        'benchmark' : [benchmark_names.index(b) for _, _, b in keys],
+        'timelines' : [timelines.get(key, []) for key in keys],
+    }
+    for field in (*REPORT_METRICS, 'rate', 'saturated', 'wraps', 'distribution'):
+        columns[field] = [cells[key][field] for key in keys]
+    return {
+        'dimensions'    : list(DIMENSIONS),
+        'values'        : present,
+        'benchmarks'    : benchmark_names,
+        'metrics'       : list(REPORT_METRICS),
+        'binsPerOctave' : BINS_PER_OCTAVE,
+        'scale'         : DISTRIBUTION_SCALE,
+        'cells'         : columns,
+    }
+
+def write_report(path, data):
+    # The template with the data in place of its marker. "</" is escaped so no value can end the
+    # script element early.
+    encoded = json.dumps(data, separators=(',', ':')).replace('</', '<\\/')
+    path.write_text(TEMPLATE.read_text().replace(DATA_MARKER, encoded))
+
+####  Main program  ################################################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Write a self-contained HTML report of the summary database.')
+    parser.add_argument(
+        'benchmark_names', metavar='benchmark-name', nargs='*',
+        help='benchmarks to include (timesyscall, timectxsw etc.), all of them if omitted')
+    parser.add_argument(
+        '--fix', action='append', default=[], metavar='DIMENSION=VALUE',
+        help='only include configurations with this value (may be repeated)')
+    parser.add_argument(
+        '--timeline-points', type=int, default=DEFAULT_TIMELINE_POINTS,
+        help='points per vCPU timeline')
+    parser.add_argument(
+        '--output', '-o', type=pathlib.Path, default=DEFAULT_REPORT,
+        help='HTML file to write')
+    parser.add_argument(
+        '--db', type=pathlib.Path, default=DEFAULT_DB,
+        help='path to summary database')
+
+    args = parser.parse_args()
+
+    fixed = {}
+    for assignment in args.fix:
+        dimension, _, value = assignment.partition('=')
+        if dimension not in DIMENSIONS or value not in DIMENSION_VALUES[dimension]:
+            parser.error(f'Invalid --fix {assignment}')
+        fixed[dimension] = value
+    if args.timeline_points < 1:
+        parser.error('--timeline-points must be positive')
+
+    data = report_data(connect(args.db), args.benchmark_names, fixed, args.timeline_points)
+    if not data['benchmarks']:
+        sys.exit('No matching results')
+    write_report(args.output, data)
+    print(f'Wrote {len(data["cells"]["vm_count"])} cells to {args.output} '
+          f'({args.output.stat().st_size / 1e6:.1f} MB)')
@@ -0,0 +1,309 @@
+import os
+import re
+import json
+import shutil
+import pathlib
+import zipfile
+import argparse
+import numpy as np
+from cache import DEFAULT_CACHE_DIR, BuildCache, code_version
+from loader import HEADER_DTYPE, HEADER_BYTES, SAMPLE_DTYPE, as_samples, decode_output, looks_like_text
+from vm.configs import format_vm_dir, parse_vm_dir
+from vm.tsc import TSC_SUFFIX
+
+# An ingested store mirrors the upload tree, but every <bench><i>.out member is inflated once into
+# its own raw uint32 file so analysis can np.memmap it instead of re-running DEFLATE:
+#
+#   <store>/manifest.json
+#   <store>/(13VM)(pvh)...(low-slop)/13/timetctxsw2-3.u32
+#   <store>/(13VM)(pvh)...(low-slop)/13/vm4/timetctxsw2-3.u32
+#
+# The 64-bit clock_gettime header lives in the manifest, so each array file starts on a page
+# boundary and the mapping is a zero-copy view. So does a zip's TSC calibration (vm/tsc.py), if it
+# has one. Results of VMs other than VM1 (see vm/configs.py) are read with vm=<k>; without it
+# every reader sees VM1's results only.
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 4
+SAMPLE_BYTES = np.dtype(SAMPLE_DTYPE).itemsize
+
+def is_suite_dir(path):
+    return path.is_dir() and path.name.startswith('(')
+
+def vm_count_dirs(suite_path):
+    return sorted((p for p in suite_path.iterdir() if p.is_dir() and p.name.isdigit()),
+                  key=lambda p: int(p.name))
+
+def cell_dir(suite, vm_count, vm=1):
+    # Directory of one VM's results, relative to the root of the tree
+    path = pathlib.Path(suite, str(vm_count))
+    return path if vm == 1 else path/format_vm_dir(vm)
+
+def vm_zips(vm_count_path):
+    # (vm, zip path) for every results zip of one VM count
+    zips = [(1, p) for p in vm_count_path.glob('*.zip')]
+    for path in vm_count_path.iterdir():
+        vm = parse_vm_dir(path.name)
+        if vm is not None and path.is_dir():
+            zips += [(vm, p) for p in path.glob('*.zip')]
+    return sorted(zips)
+
+def member_vcpu(name, benchmark):
+    # Members are named <bench><vcpu>.out, e.g. timetctxsw23.out is vcpu 3 of timetctxsw2
+    match = re.fullmatch(re.escape(benchmark) + r'(\d+)\.out', name)
+    return None if match is None else int(match[1])
+
+def read_calibration(zf, benchmark):
+    # The zip's TSC calibration record, or None
+    name = f'{benchmark}{TSC_SUFFIX}'
+    if name not in zf.namelist():
+        return None
+    return json.loads(zf.read(name))
+
+def read_chunks(f, chunk_samples):
+    while (raw_bytes := f.read(chunk_samples * SAMPLE_BYTES)):
+        if len(raw_bytes) % SAMPLE_BYTES:
+            raise ValueError('payload is not a whole number of samples')
+        yield np.frombuffer(raw_bytes, dtype=SAMPLE_DTYPE)
+
+#--------------------------------------------------------------------------------------------------#
+
+class ZipTree:
+    # Reads results straight out of the (config)/<vm_count>/<bench>.zip tree
+
+    def __init__(self, root):
+        self.root = pathlib.Path(root)
+
+    def suites(self):
+        return sorted(p.name for p in self.root.iterdir() if is_suite_dir(p))
+
+    def vm_counts(self, suite):
+        return [int(p.name) for p in vm_count_dirs(self.root/suite)]
+
+    def benchmarks(self, suite, vm_count):
+        return sorted(p.stem for p in (self.root/suite/str(vm_count)).glob('*.zip'))
+
+    def vms(self, suite, vm_count, benchmark):
+        # VMs that recorded results for a cell
+        return [vm for vm, p in vm_zips(self.root/suite/str(vm_count)) if p.stem == benchmark]
+
+    def zip_path(self, suite, vm_count, benchmark, vm=1):
+        return self.root/cell_dir(suite, vm_count, vm)/f'{benchmark}.zip'
+
+    def source_digest(self, suite, vm_count, benchmark, cache, vm=1):
+        # Content hash of the zip a cell is read from
+        return cache.digest(self.zip_path(suite, vm_count, benchmark, vm))
+
+    def calibration(self, suite, vm_count, benchmark, vm=1):
+        with zipfile.ZipFile(self.zip_path(suite, vm_count, benchmark, vm), mode='r') as zf:
+            return read_calibration(zf, benchmark)
+
+    def outputs(self, suite, vm_count, benchmark, vm=1):
+        # Yields (vcpu, clock_ns, deltas) for every benchmark process in the cell
+        zip_path = self.zip_path(suite, vm_count, benchmark, vm)
+        with zipfile.ZipFile(zip_path, mode='r') as zf:
+            names = [(member_vcpu(n, benchmark), n) for n in zf.namelist()]
+            for vcpu, name in sorted(n for n in names if n[0] is not None):
+                with zf.open(name) as b:
+                    output = decode_output(b.read())
+                yield vcpu, output.clock_ns, as_samples(output.deltas)
+
+    def chunked_outputs(self, suite, vm_count, benchmark, chunk_samples, vm=1):
+        # Like outputs(), but yields (vcpu, clock_ns, chunks) where chunks streams the member in
+        # pieces of at most chunk_samples deltas. Each chunks iterator must be consumed in order.
+        zip_path = self.zip_path(suite, vm_count, benchmark, vm)
+        with zipfile.ZipFile(zip_path, mode='r') as zf:
+            names = [(member_vcpu(n, benchmark), n) for n in zf.namelist()]
+            for vcpu, name in sorted(n for n in names if n[0] is not None):
+                with zf.open(name) as b:
+                    header = b.read(HEADER_BYTES)
+                    if looks_like_text(header):
+                        # Text output (KVM/bare metal) has to be parsed as a whole
+                        output = decode_output(header + b.read(), 'text')
+                        yield vcpu, output.clock_ns, iter((as_samples(output.deltas),))
+                    else:
+                        clock_ns = int(np.frombuffer(header, dtype=HEADER_DTYPE)[0])
+                        yield vcpu, clock_ns, read_chunks(b, chunk_samples)
+
+class ResultStore:
+    # Reads results from an ingested store as read-only memory maps
+
+    def __init__(self, root):
+        self.root = pathlib.Path(root)
+        manifest = json.loads((self.root/MANIFEST_NAME).read_text())
+        if manifest['version'] != MANIFEST_VERSION:
+            raise ValueError(f'Unsupported store version {manifest["version"]} in {self.root}')
+        self.sources = manifest['sources']
+        self.entries = manifest['entries']
+        self.calibrations = manifest['calibrations']
+        # (suite, vm_count, benchmark) -> {vm: entries sorted by vcpu}
+        self.cells = {}
+        for entry in self.entries:
+            key = (entry['suite'], entry['vm_count'], entry['benchmark'])
+            self.cells.setdefault(key, {}).setdefault(entry['vm'], []).append(entry)
+        for cell in self.cells.values():
+            for vm_entries in cell.values():
+                vm_entries.sort(key=lambda e: e['vcpu'])
+
+    def suites(self):
+        return sorted({suite for suite, _, _ in self.cells})
+
+    def vm_counts(self, suite):
+        return sorted({n for s, n, _ in self.cells if s == suite})
+
+    def benchmarks(self, suite, vm_count):
+        return sorted(b for (s, n, b), cell in self.cells.items() if (s, n) == (suite, vm_count) and 1 in cell)
+
+    def vms(self, suite, vm_count, benchmark):
+        return sorted(self.cells.get((suite, vm_count, benchmark), ()))
+
+    def source_digest(self, suite, vm_count, benchmark, cache, vm=1):
+        # Recorded at ingest time, so this matches the digest of the original zip
+        return self.sources[(cell_dir(suite, vm_count, vm)/f'{benchmark}.zip').as_posix()]['sha256']
+
+    def calibration(self, suite, vm_count, benchmark, vm=1):
+        return self.calibrations.get((cell_dir(suite, vm_count, vm)/f'{benchmark}.zip').as_posix())
+
+    def map_entry(self, entry):
+        if entry['count'] == 0:
+            return np.empty(0, dtype=SAMPLE_DTYPE)
+        return np.memmap(self.root/entry['file'], dtype=SAMPLE_DTYPE, mode='r', shape=(entry['count'],))
+
+    def outputs(self, suite, vm_count, benchmark, vm=1):
+        for entry in self.cells.get((suite, vm_count, benchmark), {}).get(vm, ()):
+            yield entry['vcpu'], entry['clock_ns'], self.map_entry(entry)
+
+    def chunked_outputs(self, suite, vm_count, benchmark, chunk_samples, vm=1):
+        for vcpu, clock_ns, deltas in self.outputs(suite, vm_count, benchmark, vm):
+            chunks = (deltas[i:i+chunk_samples] for i in range(0, len(deltas), chunk_samples))
+            yield vcpu, clock_ns, chunks
+
+def open_results(path):
+    # Analysis entry point: an ingested store if `path` holds a manifest, otherwise the raw zip tree
+    path = pathlib.Path(path)
+    if (path/MANIFEST_NAME).is_file():
+        return ResultStore(path)
+    return ZipTree(path)
+
+#--------------------------------------------------------------------------------------------------#
+
+def inflate_member(zf, name, dest):
+    # Stream one member to disk without holding it in memory, returning (clock_ns, sample count)
+    # Text members are parsed and stored as samples too; their clock_ns is None
+    tmp = dest.with_name(dest.name + '.tmp')
+    with zf.open(name) as src, open(tmp, 'wb') as dst:
+        header = src.read(HEADER_BYTES)
+        if looks_like_text(header):
+            output = decode_output(header + src.read(), 'text')
+            as_samples(output.deltas).tofile(dst)
+            clock_ns = None
+        elif len(header) != HEADER_BYTES:
+            raise ValueError(f'{name}: truncated header')
+        else:
+            shutil.copyfileobj(src, dst, length=1 << 22)
+            clock_ns = int(np.frombuffer(header, dtype=HEADER_DTYPE)[0])
+        size = dst.tell()
+    if size % SAMPLE_BYTES:
+        tmp.unlink()
+        raise ValueError(f'{name}: payload is not a whole number of samples')
+    os.replace(tmp, dest)
+    return clock_ns, size // SAMPLE_BYTES
+
+def write_manifest(store_dir, sources, entries, calibrations):
+    tmp = store_dir/(MANIFEST_NAME + '.tmp')
+    tmp.write_text(json.dumps({'version': MANIFEST_VERSION, 'sources': sources, 'entries': entries,
+                               'calibrations': calibrations}))
+    os.replace(tmp, store_dir/MANIFEST_NAME)
+
+def ingest(data_dir, store_dir, cache=None, verbose=True):
+    data_dir = pathlib.Path(data_dir)
+    store_dir = pathlib.Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    cache = cache or BuildCache()
+    version = code_version(__file__)
+
+    # Reuse anything already ingested from an unchanged zip
+    if (store_dir/MANIFEST_NAME).is_file() and \
+       json.loads((store_dir/MANIFEST_NAME).read_text())['version'] == MANIFEST_VERSION:
+        old = ResultStore(store_dir)
+        old_sources = old.sources
+        old_calibrations = old.calibrations
+        old_entries = {}
+        for entry in old.entries:
+            old_entries.setdefault(entry['source'], []).append(entry)
+    else:
+        old_sources, old_entries, old_calibrations = {}, {}, {}
+
+    sources = {}
+    entries = []
+    calibrations = {}
+    for suite_path in sorted(p for p in data_dir.iterdir() if is_suite_dir(p)):
+        for vm_path in vm_count_dirs(suite_path):
+            for vm, zip_path in vm_zips(vm_path):
+                benchmark = zip_path.stem
+                rel_dir = cell_dir(suite_path.name, vm_path.name, vm)
+                source_key = (rel_dir/zip_path.name).as_posix()
+                # Decoded arrays are keyed by the zip's content hash and the ingest code version
+                signature = {'sha256' : cache.digest(zip_path), 'code' : version}
+                sources[source_key] = signature
+
+                if old_sources.get(source_key) == signature:
+                    entries += old_entries.get(source_key, [])
+                    if source_key in old_calibrations:
+                        calibrations[source_key] = old_calibrations[source_key]
+                    continue
+
+                if verbose:
+                    print(f'Ingesting {source_key}')
+                (store_dir/rel_dir).mkdir(parents=True, exist_ok=True)
+                with zipfile.ZipFile(zip_path, mode='r') as zf:
+                    calibration = read_calibration(zf, benchmark)
+                    if calibration is not None:
+                        calibrations[source_key] = calibration
+                    for name in zf.namelist():
+                        vcpu = member_vcpu(name, benchmark)
+                        if vcpu is None:
+                            continue
+                        rel_path = rel_dir/f'{benchmark}-{vcpu}.u32'
+                        clock_ns, count = inflate_member(zf, name, store_dir/rel_path)
+                        entries.append({
+                            'suite'     : suite_path.name,
+                            'vm_count'  : int(vm_path.name),
+                            'benchmark' : benchmark,
+                            'vm'        : vm,
+                            'vcpu'      : vcpu,
+                            'clock_ns'  : clock_ns,
+                            'count'     : count,
+                            'file'      : rel_path.as_posix(),
+                            'source'    : source_key,
+                        })
+
+    write_manifest(store_dir, sources, entries, calibrations)
+    cache.save()
+    return entries
+
+####  Main program  ################################################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Memory-mapped columnar store for benchmark results.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    ingest_parser = subparsers.add_parser(
+        'ingest', help='inflate a benchmark data tree into a store (only changed zips are redone)')
+    ingest_parser.add_argument(
+        'benchmark_data', metavar='benchmark-data', type=pathlib.Path,
+        help='path to benchmark data')
+    ingest_parser.add_argument(
+        'store', type=pathlib.Path,
+        help='directory to write the store to')
+    ingest_parser.add_argument(
+        '--cache-dir', type=pathlib.Path, default=DEFAULT_CACHE_DIR,
+        help='build cache holding content hashes of already seen zips')
+
+    args = parser.parse_args()
+
+    if args.command == 'ingest':
+        if not args.benchmark_data.is_dir():
+            parser.error('Invalid benchmark data path specified')
+        entries = ingest(args.benchmark_data, args.store, BuildCache(args.cache_dir))
+        print(f'Store at {args.store} holds {len(entries)} arrays')
@@ -0,0 +1,176 @@
+import pathlib
+import multiprocessing
+import concurrent.futures
+import numpy as np
+from store import open_results
+from histogram import LogHistogram
+from timeseries import BlockTimeline
+from calibration import ProcessClock, convert, count_saturated, estimate_wraps, file_rates, reference_rate
+
+# Streaming reduction of benchmark outputs into small, mergeable summaries. Members are read in
+# fixed-size chunks, so peak memory does not depend on the number of VMs, vCPUs or iterations.
+
+CHUNK_SAMPLES = 1 << 20
+
+program_dir = pathlib.Path(__file__).parent
+
+# Source files whose changes invalidate cached summaries
+SUMMARY_SOURCES = [program_dir/f'{m}.py' for m in ('loader', 'store', 'summary', 'histogram', 'calibration', 'timeseries')]
+
+class CellSummary:
+    # Everything the figures need from one (suite, vm_count, benchmark) cell. The log-bucketed
+    # histogram is the canonical aggregate: exact count, sum, min and max plus accurate percentiles.
+    # Statistics are in cycles, or in ns with unit='ns' (see calibration.py).
+
+    def __init__(self, tsc=None):
+        self.processes = 0
+        # Text (KVM/bare metal) outputs have no clock_gettime total
+        self.clock_processes = 0
+        self.clock_ns_total = 0
+        self.histogram = LogHistogram()
+        # Every process's clock total, cycle sum and saturated deltas, and the guests' TSC
+        # calibrations (tsc: a vm/tsc.py record stored with the outputs)
+        self.clocks = []
+        self.tsc_rates = [tsc['cycles_per_ns']] if tsc else []
+        # (cycles per ns, source) of a larger set of outputs this one is part of, if given
+        self.reference = None
+        # A coarse timeline of every process, in order
+        self.timelines = []
+
+    @property
+    def count(self):
+        return self.histogram.count
+
+    @property
+    def total(self):
+        return self.histogram.total
+
+    @property
+    def min(self):
+        return self.histogram.min
+
+    @property
+    def max(self):
+        return self.histogram.max
+
+    def add_chunk(self, deltas):
+        self.histogram.add(deltas)
+
+    def add_process(self, clock_ns, chunks):
+        self.processes += 1
+        if clock_ns is not None:
+            self.clock_processes += 1
+            self.clock_ns_total += clock_ns
+        count, total, saturated = self.count, self.total, 0
+        timeline = BlockTimeline()
+        for chunk in chunks:
+            self.add_chunk(chunk)
+            timeline.add(chunk)
+            saturated += count_saturated(chunk)
+        self.timelines.append(timeline)
+        self.clocks.append(ProcessClock(clock_ns, self.total - total, self.count - count, saturated))
+
+    def merge(self, other):
+        # O(buckets), however many samples either side holds
+        self.processes += other.processes
+        self.clock_processes += other.clock_processes
+        self.clock_ns_total += other.clock_ns_total
+        self.histogram.merge(other.histogram)
+        self.clocks += other.clocks
+        self.tsc_rates += other.tsc_rates
+        self.timelines += other.timelines
+        self.reference = None
+        return self
+
+    def reference_rate(self):
+        return self.reference or reference_rate(self.clocks, self.tsc_rates)
+
+    def cycles_per_ns(self):
+        return self.reference_rate()[0]
+
+    def calibration(self):
+        # How cycles convert to ns here, and which deltas are not to be trusted
+        rate, source = self.reference_rate()
+        wraps = estimate_wraps(self.clocks, rate)
+        rates = file_rates(self.clocks)
+        return {
+            'cycles_per_ns'     : rate,
+            'source'            : source,
+            'file_rate_min'     : float(np.nanmin(rates)) if (~np.isnan(rates)).any() else np.nan,
+            'file_rate_max'     : float(np.nanmax(rates)) if (~np.isnan(rates)).any() else np.nan,
+            'saturated'         : sum(c.saturated for c in self.clocks),
+            'wraps'             : int(wraps.sum()),
+            'wrapped_processes' : int(np.count_nonzero(wraps)),
+        }
+
+    def mean(self, unit='cycles'):
+        return convert(self.histogram.mean(), unit, self.cycles_per_ns())
+
+    def median(self, unit='cycles'):
+        return convert(self.histogram.median(), unit, self.cycles_per_ns())
+
+    def percentile(self, q, unit='cycles'):
+        return convert(self.histogram.percentile(q), unit, self.cycles_per_ns())
+
+    def clock_ns_mean(self):
+        # Mean clock_gettime execution time per benchmark process
+        return self.clock_ns_total // self.clock_processes if self.clock_processes else 0
+
+def reduce_cell(results, suite, vm_count, benchmark, chunk_samples=CHUNK_SAMPLES, vm=1):
+    summary = CellSummary(results.calibration(suite, vm_count, benchmark, vm))
+    for _, clock_ns, chunks in results.chunked_outputs(suite, vm_count, benchmark, chunk_samples, vm):
+        summary.add_process(clock_ns, chunks)
+    return summary
+
+#--------------------------------------------------------------------------------------------------#
+
+# Results opened by this worker process, keyed by path, so the store manifest is read once
+worker_results = {}
+
+def reduce_benchmarks(results, suite, vm_count, benchmarks):
+    # Summaries for every requested benchmark present in one VM-count directory
+    present = set(results.benchmarks(suite, vm_count))
+    return {b : reduce_cell(results, suite, vm_count, b) for b in benchmarks if b in present}
+
+def reduce_vcpus(results, suite, vm_count, benchmark, chunk_samples=CHUNK_SAMPLES):
+    # One summary per benchmark process (vCPU) of a cell
+    summaries = {}
+    tsc = results.calibration(suite, vm_count, benchmark)
+    for vcpu, clock_ns, chunks in results.chunked_outputs(suite, vm_count, benchmark, chunk_samples):
+        summaries[vcpu] = CellSummary(tsc)
+        summaries[vcpu].add_process(clock_ns, chunks)
+    # A single output cannot show its own wraps, so every vCPU is converted at the cell's rate
+    reference = reference_rate([c for s in summaries.values() for c in s.clocks], [tsc['cycles_per_ns']] if tsc else [])
+    for summary in summaries.values():
+        summary.reference = reference
+    return summaries
+
+def reduce_vms(results, suite, vm_count, benchmark, vms):
+    # One summary per VM of a cell, for the given VMs
+    return {vm : reduce_cell(results, suite, vm_count, benchmark, vm=vm) for vm in vms}
+
+def run_on_results(task, data_path, *cell):
+    if data_path not in worker_results:
+        worker_results[data_path] = open_results(data_path)
+    return task(worker_results[data_path], *cell)
+
+def map_cells(task, data_path, cells, jobs=1):
+    # Run task(results, *cell) for every cell, yielding (cell, result) as cells complete. With
+    # jobs > 1 decompression, decoding and reduction happen in a pool of worker processes and only
+    # the small results come back to the caller. task must be a module-level function.
+    cells = list(cells)
+    if jobs <= 1:
+        for cell in cells:
+            yield cell, run_on_results(task, data_path, *cell)
+        return
+
+    # The analysis scripts are not import-safe, so workers are forked rather than spawned
+    context = multiprocessing.get_context('fork')
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, mp_context=context) as pool:
+        futures = {pool.submit(run_on_results, task, data_path, *cell) : cell for cell in cells}
+        for future in concurrent.futures.as_completed(futures):
+            yield futures[future], future.result()
+
+def reduce_cells(data_path, cells, jobs=1):
+    # (suite, vm_count, benchmarks) cells -> {benchmark: summary}
+    return map_cells(reduce_benchmarks, data_path, cells, jobs)
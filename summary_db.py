@@ -0,0 +1,236 @@
+import sys
+import math
+import sqlite3
+import pathlib
+import argparse
+import pandas as pd
+from store import open_results
+from summary import SUMMARY_SOURCES, CellSummary, map_cells, reduce_vcpus
+from cache import DEFAULT_CACHE_DIR, BuildCache, code_version, stage_key
+from vm.configs import DIMENSIONS, parse
+
+# Persistent database of summary statistics: one row per (configuration, vm_count, benchmark, vcpu)
+# plus a vcpu = -1 row per cell that aggregates all of its vCPUs. Slice comparisons are answered
+# from here without touching the raw data. Latencies are in cycles, and in ns in the *_ns columns,
+# converted at the row's cycles_per_ns; saturated and wraps count deltas not to be trusted (see
+# calibration.py).
+
+program_dir = pathlib.Path(__file__).parent
+
+DEFAULT_DB = program_dir/'summaries.sqlite'
+ALL_VCPUS = -1
+
+KEY_COLUMNS = (*DIMENSIONS, 'vm_count', 'benchmark', 'vcpu')
+PERCENTILES = {'p50' : 50, 'p90' : 90, 'p99' : 99, 'p999' : 99.9}
+NS_METRICS = tuple(f'{m}_ns' for m in ('mean', 'min', 'max', *PERCENTILES))
+CALIBRATION_METRICS = ('cycles_per_ns', 'saturated', 'wraps')
+METRICS = ('count', 'mean', 'min', 'max', *PERCENTILES, 'clock_ns', *NS_METRICS, *CALIBRATION_METRICS)
+STORED_COLUMNS = (*METRICS, 'histogram', 'timeline', 'timeline_block')
+
+SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS summaries (
+    {', '.join(f'{d} TEXT NOT NULL' for d in DIMENSIONS)},
+    vm_count INTEGER NOT NULL,
+    benchmark TEXT NOT NULL,
+    vcpu INTEGER NOT NULL,
+    suite TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    mean REAL,
+    min INTEGER,
+    max INTEGER,
+    {', '.join(f'{p} REAL' for p in PERCENTILES)},
+    clock_ns INTEGER NOT NULL,
+    {', '.join(f'{m} REAL' for m in NS_METRICS)},
+    cycles_per_ns REAL,
+    saturated INTEGER NOT NULL,
+    wraps INTEGER NOT NULL,
+    histogram BLOB NOT NULL,
+    timeline BLOB NOT NULL,
+    timeline_block INTEGER NOT NULL,
+    source_key TEXT NOT NULL,
+    PRIMARY KEY ({', '.join(KEY_COLUMNS)})
+);
+CREATE INDEX IF NOT EXISTS summaries_cell ON summaries (benchmark, vm_count, vcpu);
+CREATE INDEX IF NOT EXISTS summaries_suite ON summaries (suite, vm_count, benchmark);
+{''.join(f'CREATE INDEX IF NOT EXISTS summaries_{d} ON summaries ({d});' for d in DIMENSIONS)}
+'''
+
+def connect(db_path=DEFAULT_DB):
+    db = sqlite3.connect(db_path)
+    # Everything here is derived from the results, so a table of an older layout is rebuilt
+    columns = {row[1] for row in db.execute('PRAGMA table_info(summaries)')}
+    if columns and not set(STORED_COLUMNS) <= columns:
+        db.execute('DROP TABLE summaries')
+    db.executescript(SCHEMA)
+    return db
+
+def summary_row(dimensions, suite, vm_count, benchmark, vcpu, summary, source_key):
+    percentiles = summary.percentile(list(PERCENTILES.values())) if summary.count else [None]*len(PERCENTILES)
+    calibration = summary.calibration()
+    rate = None if math.isnan(calibration['cycles_per_ns']) else calibration['cycles_per_ns']
+    in_cycles = [summary.mean(), summary.min, summary.max, *percentiles] if summary.count else [None]*len(NS_METRICS)
+    # The process's mean deltas over blocks of timeline_block iterations (float32), empty in the
+    # ALL_VCPUS rows
+    timeline = summary.timelines[0] if vcpu != ALL_VCPUS and summary.timelines else None
+    return {
+        **dimensions,
+        'vm_count'   : vm_count,
+        'benchmark'  : benchmark,
+        'vcpu'       : vcpu,
+        'suite'      : suite,
+        'count'      : summary.count,
+        'mean'       : summary.mean() if summary.count else None,
+        'min'        : summary.min,
+        'max'        : summary.max,
+        **{p : None if v is None else float(v) for p, v in zip(PERCENTILES, percentiles)},
+        'clock_ns'   : summary.clock_ns_mean(),
+        **{m : None if v is None or rate is None else float(v / rate) for m, v in zip(NS_METRICS, in_cycles)},
+        'cycles_per_ns' : rate,
+        'saturated'  : calibration['saturated'],
+        'wraps'      : calibration['wraps'],
+        'histogram'  : summary.histogram.to_bytes(),
+        'timeline'   : b'' if timeline is None else timeline.means().astype('<f4').tobytes(),
+        'timeline_block' : 0 if timeline is None else timeline.block,
+        'source_key' : source_key,
+    }
+
+def insert_rows(db, rows):
+    columns = list(rows[0])
+    db.executemany(
+        f'INSERT OR REPLACE INTO summaries ({", ".join(columns)}) VALUES ({", ".join("?"*len(columns))})',
+        [tuple(row[c] for c in columns) for row in rows])
+
+#--------------------------------------------------------------------------------------------------#
+
+def build(db, data_path, cache, jobs=1, verbose=True):
+    results = open_results(data_path)
+    version = code_version(*SUMMARY_SOURCES)
+
+    # source_key of every cell already in the database, so unchanged cells are skipped
+    known = dict(((s, n, b), k) for s, n, b, k in db.execute(
+        'SELECT suite, vm_count, benchmark, source_key FROM summaries WHERE vcpu = ?', (ALL_VCPUS,)))
+
+    cells = {}
+    for suite in results.suites():
+        config = parse(suite)
+        if config is None:
+            print(f'Skipping {suite}')
+            continue
+        dimensions = config._asdict()
+        for vm_count in results.vm_counts(suite):
+            for benchmark in results.benchmarks(suite, vm_count):
+                source_key = stage_key(version, results.source_digest(suite, vm_count, benchmark, cache))
+                if known.get((suite, vm_count, benchmark)) != source_key:
+                    cells[suite, vm_count, benchmark] = dimensions, source_key
+    cache.save()
+
+    for (suite, vm_count, benchmark), summaries in map_cells(reduce_vcpus, data_path, cells, jobs):
+        if verbose:
+            print(f'Adding {suite} {vm_count} {benchmark}')
+        dimensions, source_key = cells[suite, vm_count, benchmark]
+        combined = CellSummary()
+        rows = []
+        for vcpu, summary in sorted(summaries.items()):
+            rows.append(summary_row(dimensions, suite, vm_count, benchmark, vcpu, summary, source_key))
+            combined.merge(summary)
+        rows.append(summary_row(dimensions, suite, vm_count, benchmark, ALL_VCPUS, combined, source_key))
+        db.execute('DELETE FROM summaries WHERE suite = ? AND vm_count = ? AND benchmark = ?',
+                   (suite, vm_count, benchmark))
+        insert_rows(db, rows)
+        db.commit()
+    return len(cells)
+
+def query_slice(db, vary, fixed, benchmark, vm_counts=None, vcpu=ALL_VCPUS, metric='p50'):
+    # Rows for every value of `vary` with all other given dimensions held at `fixed`,
+    # pivoted to (value of vary) x vm_count
+    if vary not in DIMENSIONS:
+        raise ValueError(f'Unknown dimension {vary}')
+    if metric not in METRICS:
+        raise ValueError(f'Unknown metric {metric}')
+    conditions = ['benchmark = ?', 'vcpu = ?']
+    parameters = [benchmark, vcpu]
+    for dimension, value in fixed.items():
+        if dimension == vary:
+            continue
+        if dimension not in DIMENSIONS:
+            raise ValueError(f'Unknown dimension {dimension}')
+        conditions.append(f'{dimension} = ?')
+        parameters.append(value)
+    if vm_counts:
+        conditions.append(f'vm_count IN ({", ".join("?"*len(vm_counts))})')
+        parameters += list(vm_counts)
+    df = pd.read_sql_query(
+        f'SELECT {vary}, vm_count, {metric} FROM summaries WHERE {" AND ".join(conditions)}',
+        db, params=parameters)
+    return df.pivot_table(index=vary, columns='vm_count', values=metric, aggfunc='first')
+
+####  Main program  ################################################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='SQLite database of benchmark summary statistics.')
+    parser.add_argument(
+        '--db', type=pathlib.Path, default=DEFAULT_DB,
+        help='path to summary database')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser(
+        'build', help='add summaries of new or changed results to the database')
+    build_parser.add_argument(
+        'benchmark_data', metavar='benchmark-data', type=pathlib.Path,
+        help='path to benchmark data (raw zip tree or a store built with "store.py ingest")')
+    build_parser.add_argument(
+        '--jobs', '-j', type=int, default=1,
+        help='number of worker processes')
+    build_parser.add_argument(
+        '--cache-dir', type=pathlib.Path, default=DEFAULT_CACHE_DIR,
+        help='build cache holding content hashes of already seen zips')
+
+    query_parser = subparsers.add_parser(
+        'query', help='compare configurations that differ in a single dimension')
+    query_parser.add_argument(
+        'benchmark', help='benchmark to compare (timesyscall, timectxsw etc.)')
+    query_parser.add_argument(
+        '--vary', required=True, choices=DIMENSIONS,
+        help='the one dimension allowed to differ')
+    query_parser.add_argument(
+        '--like', metavar='SUITE',
+        help='configuration ([...] or (...) form) whose values hold every other dimension fixed')
+    query_parser.add_argument(
+        '--fix', action='append', default=[], metavar='DIMENSION=VALUE',
+        help='hold a dimension at a value (overrides --like, may be repeated)')
+    query_parser.add_argument(
+        '--metric', default='p50', choices=METRICS,
+        help='statistic to tabulate')
+    query_parser.add_argument(
+        '--vm-count', type=int, action='append',
+        help='only show these VM counts (may be repeated)')
+    query_parser.add_argument(
+        '--vcpu', type=int, default=ALL_VCPUS,
+        help='a single benchmark process instead of all vCPUs combined')
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        if not args.benchmark_data.is_dir():
+            parser.error('Invalid benchmark data path specified')
+        db = connect(args.db)
+        updated = build(db, args.benchmark_data, BuildCache(args.cache_dir), jobs=args.jobs)
+        print(f'Updated {updated} cells in {args.db}')
+
+    elif args.command == 'query':
+        fixed = {}
+        if args.like:
+            config = parse(args.like)
+            if config is None:
+                parser.error(f'Cannot parse configuration {args.like}')
+            fixed = config._asdict()
+        for assignment in args.fix:
+            dimension, _, value = assignment.partition('=')
+            if dimension not in DIMENSIONS or not value:
+                parser.error(f'Invalid --fix {assignment}')
+            fixed[dimension] = value
+        db = connect(args.db)
+        table = query_slice(db, args.vary, fixed, args.benchmark, args.vm_count, args.vcpu, args.metric)
+        if table.empty:
+            sys.exit('No matching results')
+        print(table.to_string())
@@ -0,0 +1,124 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Smoothing and decimation of per-vCPU latency series before plotting. Everything here is O(n) in
+# the series length, so 10M-sample timelines can be reduced to a few thousand points in well
+# under a second.
+
+def rolling_sum(values, window, edges='zero'):
+    # Sum over x[i - window//2 .. i + (window-1)//2] for every i, the same alignment as
+    # np.convolve(values, np.ones(window), mode='same'). Integer input is summed exactly in int64.
+    n = len(values)
+    dtype = np.int64 if np.issubdtype(values.dtype, np.integer) else np.float64
+    # Cumulative sum padded so that index i + window minus index i is the window around i
+    cumulative = np.empty(n + window, dtype=dtype)
+    cumulative[:window//2 + 1] = 0
+    np.cumsum(values, dtype=dtype, out=cumulative[window//2 + 1:window//2 + 1 + n])
+    cumulative[window//2 + 1 + n:] = cumulative[window//2 + n]
+    sums = cumulative[window:] - cumulative[:n]
+    if edges == 'zero':
+        # Missing samples at the ends count as zero, exactly like np.convolve
+        return sums, window
+    if edges == 'shrink':
+        # Average over the samples that do exist
+        i = np.arange(n)
+        return sums, np.minimum(i + (window-1)//2 + 1, n) - np.maximum(i - window//2, 0)
+    raise ValueError(f'Unknown edge mode {edges}')
+
+def rolling_mean(values, window, edges='zero'):
+    # O(n) replacement for np.convolve(values, np.ones(window)/window, mode='same')
+    sums, counts = rolling_sum(values, window, edges)
+    return sums / counts
+
+def rolling_percentile(values, window, q, step=None):
+    # Percentile(s) q over windows of `window` samples taken every `step` samples (window//4 by
+    # default). Returns (index of each window centre, percentiles), with one column per q if q is
+    # a sequence.
+    step = step or max(window // 4, 1)
+    if len(values) < window:
+        return np.empty(0, dtype=np.int64), np.empty((0, *np.shape(q)))
+    windows = sliding_window_view(values, window)[::step]
+    centres = np.arange(len(windows)) * step + window // 2
+    return centres, np.percentile(windows, q, axis=1).T
+
+def minmax_indices(values, num_points):
+    # Indices of the min and max of each of num_points//2 equal buckets, in order. Spikes survive
+    # decimation, which matters for latency series where the outliers are the interesting part.
+    n = len(values)
+    num_buckets = max(num_points // 2, 1)
+    if n <= num_points:
+        return np.arange(n)
+    size = -(-n // num_buckets)
+    padded = np.empty(num_buckets * size, dtype=values.dtype)
+    padded[:n] = values
+    padded[n:] = values[-1]
+    buckets = padded.reshape(num_buckets, size)
+    offsets = np.arange(num_buckets) * size
+    indices = np.concatenate((offsets + buckets.argmin(axis=1), offsets + buckets.argmax(axis=1)))
+    return np.unique(np.minimum(indices, n - 1))
+
+def lttb_indices(x, y, num_points):
+    # Largest-Triangle-Three-Buckets: keeps the points that best preserve the visual shape.
+    # One vectorised step per output point.
+    n = len(y)
+    if n <= num_points or num_points < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # Bucket boundaries for the points between the fixed first and last ones
+    edges = np.linspace(1, n - 1, num_points - 1).astype(np.int64)
+    indices = np.empty(num_points, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    previous = 0
+    for b in range(num_points - 2):
+        start, end = edges[b], max(edges[b+1], edges[b] + 1)
+        # Average of the next bucket (or the last point)
+        next_start, next_end = end, (edges[b+2] if b + 2 < len(edges) else n)
+        next_x = x[next_start:max(next_end, next_start+1)].mean()
+        next_y = y[next_start:max(next_end, next_start+1)].mean()
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(areas.argmax())
+        indices[b+1] = previous
+    return indices
+
+def downsample(x, y, num_points, method='minmax'):
+    # Reduce a series to about num_points points for plotting
+    if method == 'minmax':
+        indices = minmax_indices(y, num_points)
+    elif method == 'lttb':
+        indices = lttb_indices(x, y, num_points)
+    else:
+        raise ValueError(f'Unknown downsampling method {method}')
+    return x[indices], y[indices]
+
+# Blocks a streamed timeline is kept in at most
+TIMELINE_POINTS = 256
+TIMELINE_BLOCK = 1 << 10
+
+class BlockTimeline:
+    # Mean delta over consecutive blocks of one process's iterations, built chunk by chunk. The block
+    # size doubles whenever there would be more than TIMELINE_POINTS blocks, so a timeline stays
+    # small however long the run, and every block but the last is exactly `block` iterations.
+
+    def __init__(self):
+        self.block = TIMELINE_BLOCK
+        self.count = 0
+        self.sums = np.zeros(0)
+
+    def add(self, values):
+        end = self.count + len(values)
+        while -(-end // self.block) > TIMELINE_POINTS:
+            self.sums = np.add.reduceat(self.sums, np.arange(0, len(self.sums), 2)) if len(self.sums) else self.sums
+            self.block *= 2
+        blocks = (self.count + np.arange(len(values))) // self.block
+        sums = np.bincount(blocks, weights=values, minlength=len(self.sums))
+        sums[:len(self.sums)] += self.sums
+        self.sums = sums
+        self.count = end
+
+    def means(self):
+        counts = np.full(len(self.sums), self.block, dtype=np.float64)
+        if len(counts):
+            counts[-1] = self.count - self.block * (len(counts) - 1)
+        return self.sums / counts
@@ -0,0 +1,94 @@
+import json
+import math
+import statistics
+import collections
+import numpy as np
+from registry import BENCHMARKS
+
+# Adaptive run mode. Instead of one fixed-size run per cell, the guests run the benchmark in batches
+# and VM1 reports the median and p99 of each batch. The host stops a cell once the 95% confidence
+# intervals of both (taken over the batch statistics) are narrower than a target relative to
+# their value, or when the batch budget runs out. The batches are then merged into the usual
+# <bench><vcpu>.out files, so analysis is unchanged, and the achieved precision is stored next to
+# them in the results zip.
+
+# By default a batch is a tenth of a fixed-size run, and the budget is ten batches, so an adaptive
+# cell never runs longer than a fixed one did
+DEFAULT_BATCH_FRACTION = 10
+
+AdaptiveSettings = collections.namedtuple(
+    'AdaptiveSettings', ['target', 'min_batches', 'max_batches', 'batch_fraction'])
+
+# Two-sided 95% Student t quantiles by degrees of freedom. Untabulated values use the next lower
+# tabulated one, which errs on the wide side.
+T_975 = {1 : 12.706, 2 : 4.303, 3 : 3.182, 4 : 2.776, 5 : 2.571, 6 : 2.447, 7 : 2.365, 8 : 2.306,
+         9 : 2.262, 10 : 2.228, 12 : 2.179, 15 : 2.131, 20 : 2.086, 30 : 2.042, 60 : 2.000}
+Z_975 = 1.960
+
+def t_975(dof):
+    if dof > 120:
+        return Z_975
+    return T_975[max(d for d in T_975 if d <= dof)]
+
+def batch_iterations(benchmark, settings):
+    return max(BENCHMARKS[benchmark].iterations // settings.batch_fraction, 1)
+
+def relative_interval(values):
+    # Mean and 95% confidence half-width relative to the mean (inf with fewer than 2 values)
+    mean = statistics.fmean(values)
+    if len(values) < 2 or mean == 0:
+        return mean, math.inf
+    return mean, t_975(len(values) - 1) * statistics.stdev(values) / math.sqrt(len(values)) / abs(mean)
+
+def precision(batches, settings):
+    # Summary of a cell's batches ({'median', 'p99', 'count'} each), as recorded with the results
+    median, median_ci = relative_interval([b['median'] for b in batches])
+    p99, p99_ci = relative_interval([b['p99'] for b in batches])
+    return {
+        'batches'    : len(batches),
+        'iterations' : sum(b['count'] for b in batches),
+        'median'     : median,
+        'median_ci'  : median_ci,
+        'p99'        : p99,
+        'p99_ci'     : p99_ci,
+        'target'     : settings.target,
+        'converged'  : len(batches) >= settings.min_batches and max(median_ci, p99_ci) <= settings.target,
+    }
+
+def is_finished(record, settings):
+    return record['converged'] or record['batches'] >= settings.max_batches
+
+def format_precision(record):
+    return (f'{record["batches"]} batches, median {record["median"]:.0f} ±{100*record["median_ci"]:.2f}%, '
+            f'p99 {record["p99"]:.0f} ±{100*record["p99_ci"]:.2f}%')
+
+#--------------------------------------------------------------------------------------------------#
+# Guest side
+
+def batch_path(results_dir, benchmark, vcpu, batch):
+    return results_dir/f'{benchmark}{vcpu}.batch{batch}.out'
+
+def precision_path(results_dir, benchmark):
+    return results_dir/f'{benchmark}.precision.json'
+
+def read_deltas(path, record):
+    return np.fromfile(path, dtype=record.sample_dtype, offset=np.dtype(record.header_dtype).itemsize)
+
+def batch_stats(benchmark, paths):
+    # Median and p99 over all of a batch's outputs (one per vCPU)
+    record = BENCHMARKS[benchmark].record
+    deltas = np.concatenate([read_deltas(path, record) for path in paths])
+    median, p99 = np.percentile(deltas, [50, 99])
+    return {'median' : float(median), 'p99' : float(p99), 'count' : int(len(deltas))}
+
+def merge_batches(benchmark, paths, out_path):
+    # One output in the usual format: summed clock_gettime header, concatenated deltas
+    record = BENCHMARKS[benchmark].record
+    clock_ns = sum(int(np.fromfile(path, dtype=record.header_dtype, count=1)[0]) for path in paths)
+    with open(out_path, 'wb') as out:
+        out.write(np.array(clock_ns, dtype=record.header_dtype).tobytes())
+        for path in paths:
+            read_deltas(path, record).tofile(out)
+
+def write_precision(path, record):
+    path.write_text(json.dumps(record, indent=2))
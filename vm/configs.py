@@ -0,0 +1,126 @@
+import re
+import itertools
+import collections
+
+# The benchmark configuration space, shared by vm.py (list generation), host.py (parsing the
+# benchmark list) and the analysis scripts (results directory names). A configuration is written
+# in two forms:
+#
+#   benchmark list:     | |    [13VM][pvh][pinning-on][taskset-off][credit2-1ms][ht-off][hap][dom0-all-cpus][low-slop]
+#   results directory:  (13VM)(pvh)(pinning-on)(taskset-off)(credit2-1ms)(ht-off)(hap)(dom0-all-cpus)(low-slop)
+
+# Every dimension and its possible values, in the order they appear in both forms
+DIMENSION_VALUES = {
+    'num_vms'        : ('13VM', '4VM'),
+    'virt_method'    : ('pv', 'hvm', 'pvh', 'native', 'kvm'),
+    'vcpu_pinning'   : ('pinning-on', 'pinning-off', 'null-pinning'),
+    'taskset'        : ('taskset-on', 'taskset-off'),
+    'scheduler'      : ('credit2-1ms', 'credit2-3ms', 'credit2-10ms', 'null'),
+    'hyperthreading' : ('ht-on', 'ht-off'),
+    'mem_management' : ('hap', 'shadow', 'pv-mmu'),
+    'dom0_cpus'      : ('dom0-all-cpus', 'dom0-less-cpus', 'dom0-less-cpus-pinned', 'dom0-null-pinning'),
+    'slop'           : ('default-slop', 'low-slop'),
+}
+DIMENSIONS = tuple(DIMENSION_VALUES)
+
+# Baselines run without Xen by native.py, on the host itself or inside one KVM guest. Their
+# configurations keep the other dimensions of the Xen configuration they are compared with.
+XEN_VIRT_METHODS = ('pv', 'hvm', 'pvh')
+NATIVE_VIRT_METHODS = ('native', 'kvm')
+
+LINE_PREFIXES = {False : '| |    ', True : '|X|    '}
+
+Config = collections.namedtuple('Config', DIMENSIONS)
+
+def dimensions_regex(open_bracket, close_bracket):
+    o, c = re.escape(open_bracket), re.escape(close_bracket)
+    return ''.join(
+        f'{o}(?P<{dimension}>{"|".join(map(re.escape, values))}){c}'
+        for dimension, values in DIMENSION_VALUES.items())
+
+BENCHMARK_REGEX = dimensions_regex('[', ']')
+RESULTS_DIR_REGEX = dimensions_regex('(', ')')
+LINE_REGEX = r'\|(?P<done> |X)\|    ' + BENCHMARK_REGEX
+
+def parse(text):
+    # Either form (without the list-line prefix), or None if it isn't a configuration
+    for regex in (BENCHMARK_REGEX, RESULTS_DIR_REGEX):
+        match = re.fullmatch(regex, text)
+        if match is not None:
+            return Config(**match.groupdict())
+    return None
+
+def parse_line(line):
+    # A line of the benchmark list: (config, done) or None if malformed
+    match = re.fullmatch(LINE_REGEX, line)
+    if match is None:
+        return None
+    groups = match.groupdict()
+    done = groups.pop('done') == 'X'
+    return Config(**groups), done
+
+def format_benchmark(config):
+    return ''.join(f'[{value}]' for value in config)
+
+def format_results_dir(config):
+    return ''.join(f'({value})' for value in config)
+
+def format_line(config, done=False):
+    return LINE_PREFIXES[done] + format_benchmark(config)
+
+#--------------------------------------------------------------------------------------------------#
+# Every guest uploads its own results. VM1's stay where they have always been, the other VMs' go
+# into a directory per VM next to them:
+#
+#   (13VM)(pvh)...(low-slop)/7/timectxsw.zip        VM1
+#   (13VM)(pvh)...(low-slop)/7/vm4/timectxsw.zip    VM4
+
+VM_DIR_REGEX = r'vm(?P<vm>[0-9]+)'
+
+def format_vm_dir(vm):
+    return f'vm{vm}'
+
+def parse_vm_dir(name):
+    # VM index of a vm<k> directory name, or None
+    match = re.fullmatch(VM_DIR_REGEX, name)
+    return None if match is None else int(match['vm'])
+
+def results_location(config, num_vms_open, benchmark, vm=1):
+    cell_dir = f'{format_results_dir(config)}/{num_vms_open}'
+    if vm != 1:
+        cell_dir += f'/{format_vm_dir(vm)}'
+    return f'{cell_dir}/{benchmark}.zip'
+
+#--------------------------------------------------------------------------------------------------#
+
+def match(xs, ys):
+    # True if all of xs equal ys, or none of them do
+    matches = [x==y for x, y in zip(xs, ys)]
+    return all(matches) or not any(matches)
+
+def is_valid(config):
+    # The null scheduler always comes with null pinning, and PV guests always use PV MMU. Baselines
+    # carry the memory management of whichever Xen configuration they are compared with.
+    return match([config.scheduler, config.vcpu_pinning, config.dom0_cpus], ['null', 'null-pinning', 'dom0-null-pinning']) \
+       and (config.virt_method in NATIVE_VIRT_METHODS or match([config.virt_method, config.mem_management], ['pv', 'pv-mmu']))
+
+# Order in which vm.py has always emitted the list: num_vms varies fastest, slop slowest
+LIST_ORDER = ('slop', 'dom0_cpus', 'mem_management', 'hyperthreading', 'scheduler',
+              'taskset', 'vcpu_pinning', 'virt_method', 'num_vms')
+
+def all_configs():
+    # Every Xen configuration; the baselines are derived from these (see native_config)
+    configs = []
+    for values in itertools.product(*(DIMENSION_VALUES[d] for d in LIST_ORDER)):
+        config = Config(**dict(zip(LIST_ORDER, values)))
+        if config.virt_method in XEN_VIRT_METHODS and is_valid(config):
+            configs.append(config)
+    return configs
+
+def vary(config, dimension):
+    # Every valid configuration that differs from `config` only in `dimension`, including itself
+    return [c for c in (config._replace(**{dimension : v}) for v in DIMENSION_VALUES[dimension]) if is_valid(c)]
+
+def native_config(config, virt_method='native'):
+    # The baseline of a Xen configuration: the same configuration without Xen
+    return config._replace(virt_method=virt_method)
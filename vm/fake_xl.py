@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import sys
+import json
+import time
+import fcntl
+import random
+from pathlib import Path
+
+# Stand-in for the xl toolstack, for exercising host.py and lifecycle.py without a hypervisor:
+#
+#   python3 host.py --xl vm/fake_xl.py ...
+#
+# Domains are kept in a JSON state file. Environment variables:
+#
+#   FAKE_XL_STATE           state file (default /tmp/fake-xl.json)
+#   FAKE_XL_CREATE_DELAY    seconds "xl create" takes (default 1)
+#   FAKE_XL_SHUTDOWN_DELAY  seconds from "xl shutdown" until the domain is gone (default 2)
+#   FAKE_XL_STUCK           comma-separated domain names that ignore shutdown
+#
+# "fake_xl.py top" stands in for xentop (see xensampler.py); vcpu-list places vCPUs at random.
+
+state_path = Path(os.environ.get('FAKE_XL_STATE', '/tmp/fake-xl.json'))
+create_delay = float(os.environ.get('FAKE_XL_CREATE_DELAY', 1))
+shutdown_delay = float(os.environ.get('FAKE_XL_SHUTDOWN_DELAY', 2))
+stuck = set(filter(None, os.environ.get('FAKE_XL_STUCK', '').split(',')))
+
+HOST_CPUS = 52
+DOM0 = {'id' : 0, 'vcpus' : 8, 'memory' : 4096, 'created_at' : 0}
+
+def update_state(function):
+    # Apply function to the domain table under an exclusive lock, as concurrent xl commands must
+    # not lose each other's updates
+    with open(state_path, 'a+') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0)
+        text = f.read()
+        domains = json.loads(text) if text else {}
+        # Domains whose shutdown has completed
+        now = time.time()
+        domains = {name : d for name, d in domains.items() if d.get('gone_at', now + 1) > now}
+        result = function(domains)
+        f.seek(0)
+        f.truncate()
+        json.dump(domains, f)
+        return result
+
+def create(cfg_path):
+    text = Path(cfg_path).read_text()
+    name = re.search(r'(?m)^\s*name\s*=\s*[\'"]([^\'"]+)[\'"]', text)[1]
+    vcpus = re.search(r'(?m)^\s*vcpus\s*=\s*(\d+)', text)
+    memory = re.search(r'(?m)^\s*memory\s*=\s*(\d+)', text)
+    time.sleep(create_delay)
+
+    def add(domains):
+        if name in domains:
+            sys.exit(f'libxl: error: domain with name "{name}" already exists')
+        domain_id = max([d['id'] for d in domains.values()], default=0) + 1
+        domains[name] = {'id' : domain_id, 'vcpus' : int(vcpus[1]) if vcpus else 1,
+                         'memory' : int(memory[1]) if memory else 512, 'created_at' : time.time()}
+    update_state(add)
+
+def shutdown(name, wait):
+    def request(domains):
+        if name not in domains:
+            sys.exit(f'Domain \'{name}\' does not exist.')
+        if name not in stuck:
+            domains[name].setdefault('gone_at', time.time() + shutdown_delay)
+        return domains[name].get('gone_at')
+    gone_at = update_state(request)
+    if wait:
+        while gone_at is None or time.time() < gone_at:
+            time.sleep(0.1)
+
+def destroy(name):
+    def remove(domains):
+        if domains.pop(name, None) is None:
+            sys.exit(f'Domain \'{name}\' does not exist.')
+    update_state(remove)
+
+def list_domains():
+    domains = update_state(dict)
+    print(f'{"Name":<40}{"ID":>5}{"Mem":>6}{"VCPUs":>6}{"State":>10}{"Time(s)":>10}')
+    print(f'{"Domain-0":<40}{0:>5}{4096:>6}{8:>6}{"r-----":>10}{0.0:>10.1f}')
+    now = time.time()
+    for name, d in sorted(domains.items(), key=lambda item: item[1]['id']):
+        state = '--ps--' if 'gone_at' in d else '-b----'
+        print(f'{name:<40}{d["id"]:>5}{d["memory"]:>6}{d["vcpus"]:>6}{state:>10}{now - d["created_at"]:>10.1f}')
+
+def all_domains():
+    # Domain-0 first, then the guests by id
+    domains = update_state(dict)
+    return [('Domain-0', DOM0)] + sorted(domains.items(), key=lambda item: item[1]['id'])
+
+def cpu_seconds(d):
+    # As if every vCPU had been busy half the time since creation
+    return 0.5 * d['vcpus'] * (time.time() - d['created_at']) if d['created_at'] else 1000.0
+
+def vcpu_list():
+    print(f'{"Name":<33}{"ID":>5}{"VCPU":>6}{"CPU":>6} {"State":<6}{"Time(s)":>9} Affinity (Hard / Soft)')
+    for name, d in all_domains():
+        for vcpu in range(d['vcpus']):
+            state = random.choice(['r--', '-b-', '---'])
+            print(f'{name:<33}{d["id"]:>5}{vcpu:>6}{random.randrange(HOST_CPUS):>6} {state:<6}'
+                  f'{cpu_seconds(d) / d["vcpus"]:>9.1f} all / all')
+
+def top():
+    print(f'{"NAME":>10}  STATE   CPU(sec) CPU(%)     MEM(k) MEM(%)  MAXMEM(k) MAXMEM(%) VCPUS')
+    for name, d in all_domains():
+        print(f'{name:>10} --b---   {cpu_seconds(d):>8.0f}    0.0 {1024*d["memory"]:>10}    1.0   no limit       n/a '
+              f'{d["vcpus"]:>5}')
+
+def info():
+    domains = update_state(dict)
+    free = 256 * 1024 - DOM0['memory'] - sum(d['memory'] for d in domains.values())
+    print(f'host                   : fake\nnr_cpus                : {HOST_CPUS}\ncpu_mhz                : 2100.000\n'
+          f'total_memory           : {256 * 1024}\nfree_memory            : {free}\nxen_version            : 4.14.0')
+
+####  Main program  ################################################################################
+
+command, *args = sys.argv[1:] or ['help']
+
+if command == 'create':
+    create(args[-1])
+elif command == 'shutdown':
+    shutdown(args[-1], '--wait' in args or '-w' in args)
+elif command == 'destroy':
+    destroy(args[-1])
+elif command == 'list':
+    list_domains()
+elif command == 'vcpu-list':
+    vcpu_list()
+elif command == 'top':
+    top()
+elif command == 'info':
+    info()
+elif command in ('sched-credit2', 'sched-null'):
+    pass
+else:
+    sys.exit(f'fake_xl: unsupported command {command}')
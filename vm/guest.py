@@ -1,112 +1,226 @@
 #!/usr/bin/env -S python3 -u
 
+import time
 import socket
-import subprocess
-import re
+import asyncio
 import os
 import multiprocessing
-import zipfile
+import shutil
+import argparse
 from pathlib import Path
-from google.cloud import storage
+from configs import parse, results_location
+from protocol import GuestAgent, SOCKET_PORT
+from upload import Uploader, open_backend
+from adaptive import batch_path, batch_stats, merge_batches, precision_path, write_precision
+from telemetry import PROGRESS_ENV, ProgressReader, progress_path
+from registry import BENCHMARKS, VCPU_ENV
+from tsc import tsc_path, write_calibration
+from start import start_path, write_start
 
 HOST_NAME = 'xone'
-SOCKET_PORT = 44544
 
 my_hostname  = socket.gethostname()
-my_address   = ('0.0.0.0', SOCKET_PORT)
+# Sent in every message, so the host never has to look guests up by address
+my_name      = my_hostname.split('.')[0]
 host_address = (socket.gethostbyname(HOST_NAME), SOCKET_PORT)
 
 prog_dir = Path(__file__).parent
 benchmark_dir = prog_dir / 'benchmarks'
 results_dir = prog_dir / 'results'
+staging_dir = results_dir / 'staging'
 
 os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = str(prog_dir / 'cred.json')
 STORAGE_BUCKET_NAME = 'dissertation-benchmark-bucket'
 
-is_vm1 = my_hostname.endswith('-1')
-default_benchmarks = ('timesyscall', 'timectxsw', 'timetctxsw', 'timetctxsw2')
+# Guest hostnames end in their VM number, e.g. xen-benchmark-vm-4
+my_vm = int(my_name.rsplit('-', 1)[-1])
+is_vm1 = my_vm == 1
 
 num_vcpus = multiprocessing.cpu_count()
 
-def wait_on_command(regex_string):
-    while True:
-        message, _ = guest_socket.recvfrom(1024)
-        print(message)
-        if (match := re.fullmatch(regex_string, message.decode('utf-8'))):
-            return match.groupdict()
-
-def upload_file(filename, bucket_destination):
-    storage_client = storage.Client()
-    bucket = storage_client.get_bucket(STORAGE_BUCKET_NAME)
-    blob = bucket.blob(bucket_destination)
-    blob.upload_from_filename(str(filename))
-
-####  Main program  ################################################################################
-
-# Create and bind guest socket
-guest_socket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
-guest_socket.bind(my_address)
+# Benchmark processes are created ahead of the start and block on their stdin until it; only then
+# do they exec the benchmark. taskset pins a process before it execs anything.
+BARRIER_COMMAND = ['sh', '-c', 'read _ && exec "$@"', 'sh']
+# asyncio.sleep() overshoots by up to a millisecond or so; the last stretch before the start is spun
+SPIN_SECONDS = 0.002
 
-print('Waiting on messages!')
+def upload_location(args):
+    # Where this cell's results go: (config)/<num_vms_open>/<bench>.zip for VM1 and
+    # (config)/<num_vms_open>/vm<k>/<bench>.zip for the others
+    return results_location(parse(args['bench_string']), args['num_vms_open'], args['bench'], my_vm)
 
-while True:
-    print('Either just started or got RESET, sending READY')
-    # Send ready message to script on host
-    guest_socket.sendto(bytes('READY', 'utf-8'), host_address)
+def queue_upload(args, extra_paths=()):
+    # Hand this cell's outputs to the background uploader and return their location
+    paths = [results_dir/(args['bench']+str(i)+'.out') for i in range(num_vcpus)] + list(extra_paths)
+    return uploader.submit(paths, args['bench']+'.zip', upload_location(args))
 
-    print('Waiting on START')
-    # Block here until the 'START' message is received
-    args = wait_on_command(
-        r'START (?P<bench>.+) (?P<num_vms_open>\d+) (?P<params>.+) (?P<bench_string>\[.+\])')
+def batch_paths(args, vcpu, num_batches):
+    return [batch_path(results_dir, args['bench'], vcpu, batch) for batch in range(num_batches)]
 
-    print('Got START! Starting benchmarks.')
-
-    # Create as many processes as there are vcpus
+def merge_and_queue_upload(args, record):
+    # Adaptive mode: join the batches into the usual outputs and keep the precision with them
+    for i in range(num_vcpus):
+        paths = batch_paths(args, i, record['batches'])
+        merge_batches(args['bench'], paths, results_dir/(args['bench']+str(i)+'.out'))
+        for path in paths:
+            path.unlink()
+    write_precision(precision_path(results_dir, args['bench']), record)
+    extra_paths = [precision_path(results_dir, args['bench']), start_path(results_dir, args['bench'])]
+    return queue_upload(args, extra_paths + calibration_paths(args))
+
+def calibration_paths(args):
+    # The cell's TSC calibration, if the host had one taken (see calibrate_tsc)
+    path = tsc_path(results_dir, args['bench'])
+    return [path] if args.get('calibrate_tsc') and path.exists() else []
+
+async def wait_until(instant):
+    # Wait for a wall-clock time (as from time.time()), returning at once if it has passed
+    remaining = instant - time.time()
+    if remaining > SPIN_SECONDS:
+        await asyncio.sleep(remaining - SPIN_SECONDS)
+    while time.time() < instant:
+        pass
+
+async def report_progress(agent, benchmark, readers, interval):
+    # Post a PROGRESS frame every interval until cancelled (see telemetry.py)
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        frames = await loop.run_in_executor(None, lambda: [reader.frame() for reader in readers])
+        agent.post('PROGRESS', bench=benchmark, vcpus=frames)
+
+async def run_benchmarks(agent, args):
+    # Create as many processes as there are vcpus, each pinned to its own vcpu if required, and
+    # start them all at the instant given by the host. Returns when they were started.
+    spec = BENCHMARKS[args['bench']]
+    pinned = spec.affinity == 'vcpu' and args['params'] == 'taskset-on'
+    interval = args.get('telemetry_interval')
+    readers = [ProgressReader(progress_path(args['bench'], i)) for i in range(num_vcpus)] if interval else []
     running_benchmarks = []
     for i in range(num_vcpus):
-        parameters = [str(benchmark_dir/args['bench'])]
-        # If vm1, pass name of destination file to benchmark program
-        if is_vm1:
+        # Every VM records its results, so VMs can be compared with each other
+        parameters = [str(benchmark_dir/spec.name)]
+        # Adaptive mode: a batch of the given size
+        if 'batch' in args:
+            parameters += [str(batch_path(results_dir, args['bench'], i, args['batch'])), str(args['iterations'])]
+        else:
             parameters += [str(results_dir/(args['bench']+str(i)+'.out'))]
-        benchmark = subprocess.Popen(parameters)
+        parameters = BARRIER_COMMAND + parameters
+        if pinned:
+            parameters = ['taskset', '--cpu-list', str(i)] + parameters
+        env = {**os.environ, VCPU_ENV : str(i)}
+        if readers:
+            env[PROGRESS_ENV] = str(readers[i].path)
+        benchmark = await asyncio.create_subprocess_exec(*parameters, stdin=asyncio.subprocess.PIPE, env=env)
         running_benchmarks.append(benchmark)
 
-    print('Setting affinity')
-
-    # Set affinity of each process if required
-    if (args['bench'] in default_benchmarks) and (args['params'] == 'taskset-on'):
-        for benchmark in running_benchmarks:
-            os.sched_setaffinity(benchmark.pid, range(num_vcpus))
+    print(f'Waiting for the start ({args["start_at"] - time.time():.3f}s)')
+    await wait_until(args['start_at'])
+    started_at = time.time()
+    for benchmark in running_benchmarks:
+        benchmark.stdin.write(b'\n')
+    for benchmark in running_benchmarks:
+        benchmark.stdin.close()
+    reporter = asyncio.ensure_future(report_progress(agent, args['bench'], readers, interval)) if readers else None
 
     print('Waiting on benchmarks to finish')
     # Wait for benchmarks to complete
     for benchmark in running_benchmarks:
-        benchmark.wait()
+        await benchmark.wait()
+    if reporter is not None:
+        reporter.cancel()
+    for reader in readers:
+        reader.close()
+    return started_at
+
+async def run_batch_protocol(agent, args, started_at):
+    # Adaptive mode: report the batch, then either run another batch (RESET) or finish the cell.
+    # The host stops on VM1's statistics, so only VM1 works them out.
+    loop = asyncio.get_running_loop()
+    stats = None
+    if is_vm1:
+        paths = [batch_path(results_dir, args['bench'], i, args['batch']) for i in range(num_vcpus)]
+        stats = await loop.run_in_executor(None, batch_stats, args['bench'], paths)
 
     print('Sending finished!')
+    await agent.send('FINISHED', stats=stats, started_at=started_at)
+
+    command = await agent.wait_command('RESET', 'UPLOAD')
+    if command['type'] == 'UPLOAD':
+        location = await loop.run_in_executor(None, merge_and_queue_upload, args, command['precision'])
+        await agent.send('UPLOADED', location=location)
+        print('Sent UPLOADED (upload queued)')
+        await agent.wait_command('RESET')
+
+async def calibrate_tsc(agent, message):
+    # Optional TSC calibration pass, uploaded with the cell's outputs (see tsc.py). The host asks
+    # for it once every guest has finished the cell; it runs off the event loop so the guest
+    # keeps answering meanwhile.
+    loop = asyncio.get_running_loop()
+    error = None
+    try:
+        await loop.run_in_executor(None, write_calibration, tsc_path(results_dir, message['bench']), benchmark_dir)
+    except Exception as e:
+        error = f'{my_name}: {e}'
+    await agent.send('CALIBRATED', error=error)
+
+async def flush_uploads(agent, message):
+    # The host waits for durable uploads only at the end of a round
+    loop = asyncio.get_running_loop()
+    locations, errors = await loop.run_in_executor(None, uploader.flush)
+    await agent.send('FLUSHED', locations=locations, errors=errors)
 
-    # Send finished message to host
-    guest_socket.sendto(bytes('FINISHED', 'utf-8'), host_address)
-    
-    # Prevents UPLOADED from getting mixed in with FINISH if VM1 finishes quickly
-    wait_on_command('CONTINUE')
+####  Main program  ################################################################################
 
-    # If I'm VM 1, I need to upload file 
-    if is_vm1:
-        zip_path = results_dir/(args['bench']+'.zip')
-        print('Compressing files')
-        with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=5) as zf:
-            for i in range(num_vcpus):
-                results_path = results_dir/(args['bench']+str(i)+'.out')
-                zf.write(results_path, results_path.name)
-        cloud_bench_string = args["bench_string"].replace('[', '(') \
-                                                 .replace(']', ')')
-        cloud_path = f'{cloud_bench_string}/{args["num_vms_open"]}/{zip_path.name}'
-        print('Uploading files')
-        upload_file(zip_path, cloud_path)
-        guest_socket.sendto(bytes('UPLOADED', 'utf-8'), host_address)
-        print('Sent UPLOADED')
-
-    print('Waiting on RESET')
-    wait_on_command('RESET')
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    '--upload', default=f'gs://{STORAGE_BUCKET_NAME}',
+    help='where to upload results: gs://<bucket>, http://<upload_server.py> or a local directory')
+parser.add_argument(
+    '--upload-jobs', type=int, default=1,
+    help='threads compressing results between cells (they run at idle priority)')
+
+cli_args = parser.parse_args()
 
+# Staged outputs left behind by a previous boot are never uploaded; the host reruns those cells
+shutil.rmtree(staging_dir, ignore_errors=True)
+uploader = Uploader(open_backend(cli_args.upload), staging_dir, cli_args.upload_jobs)
+
+async def main():
+    agent = await GuestAgent.open(my_name, host_address, SOCKET_PORT)
+    agent.handlers['FLUSH'] = lambda message: asyncio.ensure_future(flush_uploads(agent, message))
+    agent.handlers['CALIBRATE'] = lambda message: asyncio.ensure_future(calibrate_tsc(agent, message))
+
+    print('Waiting on messages!')
+
+    while True:
+        # Between cells the queued results are compressed and uploaded; during one they wait
+        uploader.resume()
+        print('Either just started or got RESET, sending READY')
+        # Tell the host we are ready, retransmitting until it acknowledges
+        await agent.send('READY')
+
+        print('Waiting on START')
+        args = await agent.wait_command('START')
+        uploader.pause()
+
+        print('Got START! Starting benchmarks.')
+        started_at = await run_benchmarks(agent, args)
+        # Kept with the results; an adaptive cell's batches add to the record of its first
+        start = write_start(start_path(results_dir, args['bench']), args['start_at'], started_at,
+                            new_cell=args.get('batch', 0) == 0)
+
+        if 'batch' in args:
+            await run_batch_protocol(agent, args, started_at)
+            continue
+
+        print('Sending finished!')
+        await agent.send('FINISHED', location=upload_location(args), started_at=started_at)
+
+        print('Waiting on RESET')
+        await agent.wait_command('RESET')
+        # Queued once every guest has finished, with the TSC calibration if one was taken meanwhile,
+        # and compressed and uploaded in the background between cells
+        queue_upload(args, [start] + calibration_paths(args))
+
+asyncio.run(main())
@@ -2,31 +2,25 @@
 
 import argparse
 import sys
-import re
-import subprocess
-import socket
-import math
 import time
+import asyncio
 from pathlib import Path
+from configs import XEN_VIRT_METHODS, format_benchmark, format_line, results_location
+from layout import guest_layout
+from registry import select
+from planner import pending_entries, make_plan, host_key, print_plan
+from lifecycle import DomainManager
+from journal import Journal, journal_path, write_atomic
+from adaptive import AdaptiveSettings, DEFAULT_BATCH_FRACTION, batch_iterations, precision, is_finished, format_precision
+from protocol import Coordinator, PhaseTimeout, GuestError, SOCKET_PORT, READY, RUNNING, FINISHED, UPLOADED, RESETTING
+from telemetry import AbortRules, Anomaly, LiveView
+from xensampler import XenSampler, samples_path
+from tsc import CALIBRATION_TIMEOUT
+from upload import open_backend
 
 GUEST_NAME_PREFIX = 'xen-benchmark-vm-'
 GUEST_BASE_CFG = 'memory = 8192\n'
-BENCHMARKS = ('timesyscall', 'timectxsw', 'timetctxsw', 'timetctxsw2')
-SOCKET_PORT = 44544
-REGEX_STR = (
-    r'\|( |X)\|    '
-    r'\[(?P<num_vms>4VM|13VM)\]'
-    r'\[(?P<virt_method>pv|hvm|pvh)\]'
-    r'\[(?P<vcpu_pinning>(pinning\-(on|off))|null\-pinning)\]'
-    r'\[(?P<taskset>taskset\-(on|off))\]'
-    r'\[(?P<scheduler>(credit2\-(1ms|3ms|10ms))|null)\]'
-    r'\[(?P<hyperthreading>ht\-(on|off))\]'
-    r'\[(?P<mem_management>hap|shadow|pv\-mmu)\]'
-    r'\[(?P<dom0_cpus>dom0\-(all\-cpus|less\-cpus|less\-cpus\-pinned|null\-pinning))\]'
-    r'\[(?P<slop>(default|low)\-slop)\]'
-)
-
-host_cpus = 52
+RATELIMIT_US = {'credit2-1ms' : 1000, 'credit2-3ms' : 3000, 'credit2-10ms' : 10000}
 
 # Directory that this script resides in
 prog_dir = Path(__file__).parent
@@ -39,58 +33,205 @@ mac_list = (prog_dir / 'macs.txt').read_text().splitlines()
 def bicond(a, b):
     return (a and b) or (not a and not b)
 
-def get_online_guests(guest_statuses):
-    return {name:status for name, status in guest_statuses.items() if status != 'X'}
-
-def wait_on_guest_messages(expected_message, guest_statuses):
-    print_guest_status(guest_statuses)
-    while not all(status==expected_message for status in get_online_guests(guest_statuses).values()):
-        # print('Guest statuses: ', guest_statuses)
-        message, (ip_addr, _) = host_socket.recvfrom(1024)
-
-        # print(f'wait_on_message got -> {message} ({message.decode("utf-8")})')
-        # print(f'expected message was {expected_message}')
-        # print(f'ip address is {ip_addr}')
-
-        if message.decode('utf-8') == expected_message:
-            # print(f'ip address is {ip_addr}!')
-            # This will catch any READYs that come from a domain as they're being shut down
-            try:
-                guest_hostname, _, _ = socket.gethostbyaddr(ip_addr)
-            except socket.herror:
+async def set_ratelimit(config):
+    # The credit2 ratelimit is a runtime setting, so lines differing only in it share guests
+    if config.scheduler in RATELIMIT_US:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            None, domains.run_xl, 'sched-credit2', '--schedparam', f'--ratelimit_us={RATELIMIT_US[config.scheduler]}')
+
+def upload_locations():
+    # Where every open guest is uploading its results of the cell just run
+    return {guest : coordinator.messages[guest].get('location') for guest in coordinator.online()}
+
+async def start_all(**start_fields):
+    # START every open guest at the same instant, --start-delay from now: guests create their
+    # benchmark processes on receipt and release them together at start_at. Returns start_at.
+    start_at = time.time() + args.start_delay
+    live_view.start(coordinator.online(), time.monotonic() + args.start_delay)
+    await coordinator.send_all('START', args.ack_timeout, RUNNING, start_at=start_at,
+                               telemetry_interval=args.telemetry_interval, **start_fields)
+    return start_at
+
+async def watch_progress():
+    # Print the live view every telemetry interval, raising Anomaly if an abort rule is broken
+    while True:
+        await asyncio.sleep(args.telemetry_interval)
+        print('\n' + live_view.format())
+        reason = live_view.anomaly(abort_rules, [g for g, state in coordinator.states.items() if state == RUNNING])
+        if reason is not None:
+            raise Anomaly(reason)
+
+async def wait_finished():
+    # Wait for every open guest to finish the benchmark, following the run if telemetry is on
+    if not args.telemetry_interval:
+        await coordinator.wait_for(FINISHED, args.run_timeout)
+        return
+    finished = asyncio.ensure_future(coordinator.wait_for(FINISHED, args.run_timeout))
+    watcher = asyncio.ensure_future(watch_progress())
+    await asyncio.wait([finished, watcher], return_when=asyncio.FIRST_COMPLETED)
+    if finished.done():
+        watcher.cancel()
+        finished.result()
+    else:
+        finished.cancel()
+        watcher.result()
+
+async def calibrate_tsc(start_fields):
+    # With --calibrate-tsc, every open guest measures its TSC rate for the cell's results (see
+    # tsc.py). Only asked for once every guest has finished the cell, so the calibration's busy
+    # wait never overlaps another guest's measurement.
+    if not args.calibrate_tsc:
+        return
+    replies = await asyncio.gather(*(
+        coordinator.request(guest, 'CALIBRATE', 'CALIBRATED', args.ack_timeout + CALIBRATION_TIMEOUT,
+                            bench=start_fields['bench'])
+        for guest in coordinator.online()))
+    errors = [reply['error'] for reply in replies if reply['error']]
+    if errors:
+        raise GuestError(f'TSC calibration failed: {"; ".join(errors)}')
+
+def start_offsets(start_at):
+    # Seconds each open guest started its benchmarks after start_at, as reported in FINISHED.
+    # Assumes the guests' clocks follow the host's (Xen keeps PV and PVH guests' wallclock in
+    # step; HVM guests need NTP).
+    return {guest : coordinator.messages[guest]['started_at'] - start_at for guest in coordinator.online()}
+
+def start_skew(offsets):
+    return max(offsets.values()) - min(offsets.values())
+
+def format_skew(offsets):
+    latest = max(offsets, key=offsets.get)
+    return (f'start skew {1000*start_skew(offsets):.2f}ms '
+            f'(latest {latest}, {1000*offsets[latest]:+.2f}ms from target)')
+
+async def run_cell(start_fields):
+    # One fixed-size run of a benchmark on every open guest. Returns {guest: location} of the
+    # uploads and the guests' start offsets.
+    await coordinator.wait_for(READY, args.ready_timeout)
+    print('\nAll guests ready! Starting benchmarks...')
+
+    start_at = await start_all(**start_fields)
+
+    await wait_finished()
+    offsets = start_offsets(start_at)
+    print(f'\nAll guests finished, {format_skew(offsets)}. Results upload in the background.')
+    locations = upload_locations()
+    await calibrate_tsc(start_fields)
+
+    await coordinator.send_all('RESET', args.ack_timeout, RESETTING)
+    return locations, offsets
+
+async def run_adaptive_cell(start_fields, vm_1):
+    # Batches of the benchmark until VM1's median and p99 are known precisely enough, or the
+    # budget is spent (see adaptive.py)
+    iterations = batch_iterations(start_fields['bench'], adaptive_settings)
+    batches = []
+    # Start offsets of the batch with the largest start skew
+    worst_offsets = None
+    while True:
+        await coordinator.wait_for(READY, args.ready_timeout)
+        start_at = await start_all(batch=len(batches), iterations=iterations, **start_fields)
+        await wait_finished()
+
+        offsets = start_offsets(start_at)
+        if worst_offsets is None or start_skew(offsets) > start_skew(worst_offsets):
+            worst_offsets = offsets
+        batches.append(coordinator.messages[vm_1]['stats'])
+        record = precision(batches, adaptive_settings)
+        print(f'\n{start_fields["bench"]}: {format_precision(record)}, {format_skew(offsets)}')
+        if is_finished(record, adaptive_settings):
+            break
+        await coordinator.send_all('RESET', args.ack_timeout, RESETTING)
+
+    await calibrate_tsc(start_fields)
+    print('Merging batches...')
+    await coordinator.send_all('UPLOAD', args.ack_timeout, FINISHED, precision=record)
+    await coordinator.wait_for(UPLOADED, args.upload_timeout)
+    print('\nUploads queued!')
+    locations = upload_locations()
+
+    await coordinator.send_all('RESET', args.ack_timeout, RESETTING)
+    return locations, worst_offsets
+
+def pending_cells(config, num_open_vms):
+    return [e for e in benchmarks if not journal.is_done(format_benchmark(config), num_open_vms, e)]
+
+def open_vms_needed(configs, num_vms):
+    # Guests to start with: the highest number of open VMs with a cell still to run (0 if none)
+    return max((n for n in range(1, num_vms+1) for config in configs if pending_cells(config, n)), default=0)
+
+async def flush_uploads(guests):
+    # Wait for the given guests to finish uploading. Returns their FLUSHED replies.
+    return await asyncio.gather(*(coordinator.request(guest, 'FLUSH', 'FLUSHED', args.upload_timeout)
+                                  for guest in guests))
+
+def journal_uploaded(completed, replies):
+    # Journal the cells whose results are stored for every guest that ran them
+    uploaded = {}
+    for reply in replies:
+        uploaded.update(reply['locations'])
+    for benchmark, num_open_vms, executable, destinations, offsets in completed:
+        if all(destination in uploaded for destination in destinations.values()):
+            journal.record(benchmark, num_open_vms, executable,
+                           locations={guest : uploaded[d] for guest, d in destinations.items()},
+                           start_skew=start_skew(offsets), start_offsets=offsets)
+    completed.clear()
+    errors = [error for reply in replies for error in reply['errors']]
+    if errors:
+        raise GuestError(f'Upload failed: {"; ".join(errors)}')
+
+async def run_group(configs, num_open_at_start):
+    # Every benchmark of every line for every number of open VMs, shutting one guest down after
+    # each round. The lines only differ in runtime settings, so they all run on the same guests.
+    # Cells already in the journal are skipped.
+    loop = asyncio.get_running_loop()
+    guests = [f'{GUEST_NAME_PREFIX}{i}' for i in range(1, num_open_at_start+1)]
+    coordinator.expect(guests)
+    # Cells run but not yet known to be uploaded, with {guest: upload destination} and the guests'
+    # start offsets
+    completed = []
+
+    for num_open_vms in range(num_open_at_start, 0, -1):
+        for config in configs:
+            executables = pending_cells(config, num_open_vms)
+            if not executables:
                 continue
-            # print(guest_hostname)
-            guest_hostname = guest_hostname.split('.')[0]
-            if guest_hostname in guest_statuses:
-                guest_statuses[guest_hostname] = expected_message
-                print_guest_status(guest_statuses)
-
-def send_message_to_guests(message, guest_statuses):
-    for guest in get_online_guests(guest_statuses).keys():
-        guest_hostname = socket.gethostbyname(guest)
-        host_socket.sendto(bytes(message, 'utf-8'), (guest_hostname, SOCKET_PORT))
-
-def wait_on_message(expected_message):
-    matches = False
-    while not matches:
-        message, _ = host_socket.recvfrom(1024)
-        # print(f'wait_on_message got -> {message} ({message.decode("utf-8")})')
-        # print(f'expected message was {expected_message}')
-        matches = (message.decode('utf-8') == expected_message)
-        
-def print_guest_status(guest_statuses):
-    # Since Python 3.7, dict order is guaranteed to be insertion order
-    status_string = ' '.join([s[0].capitalize() for s in guest_statuses.values()])
-    print(f'Guest status: [{status_string}]', end='\r')
-
-def attempt_shutdown(name, ensure=False):
-    try:
-        subprocess.run(['xl', 'shutdown', '--wait', name], timeout=120)
-    except subprocess.TimeoutExpired:
-        print(f'Failed to shutdown domain "{name}". Destroying...')
-        subprocess.run(['xl', 'destroy', name])
-    if ensure:
-        time.sleep(30)
+            print(f'\n{format_benchmark(config)} with {num_open_vms} VMs open')
+            await set_ratelimit(config)
+
+            for executable in executables:
+                start_fields = dict(bench=executable, num_vms_open=num_open_vms, params=config.taskset,
+                                    bench_string=format_benchmark(config), calibrate_tsc=args.calibrate_tsc)
+                # What Xen was doing is sampled for as long as the cell runs
+                if sampler is not None:
+                    sampler.start()
+                try:
+                    if args.adaptive:
+                        destinations, offsets = await run_adaptive_cell(start_fields, guests[0])
+                    else:
+                        destinations, offsets = await run_cell(start_fields)
+                finally:
+                    if sampler is not None:
+                        path = samples_path(args.xen_samples, results_location(config, num_open_vms, executable))
+                        await loop.run_in_executor(None, sampler.stop, path)
+                # Journalled at once, so that a crash before the round ends can find the uploads
+                journal.record_pending(format_benchmark(config), num_open_vms, executable, destinations,
+                                       start_skew=start_skew(offsets), start_offsets=offsets)
+                completed.append((format_benchmark(config), num_open_vms, executable, destinations, offsets))
+
+        # Uploads only have to be durable at the end of a round. The guest about to be shut down
+        # finishes its own first; the others finish while it shuts down.
+        print('\nWaiting for uploads...')
+        if num_open_vms > 1:
+            name = guests[num_open_vms-1]
+            replies = await flush_uploads([name])
+            coordinator.set_offline(name)
+            other_replies, _ = await asyncio.gather(flush_uploads(guests[:num_open_vms-1]),
+                                                    loop.run_in_executor(None, domains.shutdown, [name]))
+            journal_uploaded(completed, replies + other_replies)
+        else:
+            journal_uploaded(completed, await flush_uploads(guests[:1]))
 
 ####  Main program  ################################################################################
 #--------------------------------------------------------------------------------------------------#
@@ -121,6 +262,72 @@ parser.add_argument(
 parser.add_argument(
     '--config-only', action='store_true', 
     help='don\'t run benchmark, just create config files')
+parser.add_argument(
+    '--xl', default='xl',
+    help='xl executable to use (e.g. fake_xl.py for testing without Xen)')
+parser.add_argument(
+    '--parallel', type=int, default=4,
+    help='maximum number of domains to create or shut down at once')
+parser.add_argument(
+    '--ready-timeout', type=float, default=600,
+    help='seconds to wait for all guests to report READY (including boot)')
+parser.add_argument(
+    '--run-timeout', type=float, default=3600,
+    help='seconds to wait for all guests to finish a benchmark')
+parser.add_argument(
+    '--upload-timeout', type=float, default=1800,
+    help='seconds to wait for results to be uploaded')
+parser.add_argument(
+    '--adaptive', action='store_true',
+    help='run each benchmark in batches until its median and p99 are precise enough')
+parser.add_argument(
+    '--target', type=float, default=0.01,
+    help='adaptive mode: relative 95%% confidence interval half-width to reach (default 0.01)')
+parser.add_argument(
+    '--min-batches', type=int, default=3,
+    help='adaptive mode: fewest batches to run')
+parser.add_argument(
+    '--max-batches', type=int, default=10,
+    help='adaptive mode: most batches to run')
+parser.add_argument(
+    '--batch-fraction', type=int, default=DEFAULT_BATCH_FRACTION,
+    help='adaptive mode: batch size as a fraction of the fixed iteration count')
+parser.add_argument(
+    '--ack-timeout', type=float, default=30,
+    help='seconds to wait for guests to acknowledge a command')
+parser.add_argument(
+    '--start-delay', type=float, default=2,
+    help='seconds between sending START and the instant all guests start their benchmarks')
+parser.add_argument(
+    '--telemetry-interval', type=float, default=0,
+    help='seconds between progress frames from the guests during a run (default 0: none)')
+parser.add_argument(
+    '--xen-interval', type=float, default=0,
+    help='seconds between samples of xl vcpu-list, xentop and xl info during a cell (default 0: '
+         'none). Each sample forks three commands in dom0, which shares pCPUs with the guests '
+         'unless dom0 is given its own, and counts towards dom0\'s CPU use in xenstats.py')
+parser.add_argument(
+    '--xen-samples', type=Path, default=prog_dir/'xen-samples',
+    help='directory to save the Xen samples of each cell to, laid out like the results')
+parser.add_argument(
+    '--xentop', default='xentop',
+    help='xentop command to use (e.g. "fake_xl.py top" for testing without Xen)')
+parser.add_argument(
+    '--upload', metavar='DESTINATION',
+    help='where the guests upload results (as guest.py --upload), so that cells whose uploads a '
+         'crash left unconfirmed are looked up there instead of run again')
+parser.add_argument(
+    '--calibrate-tsc', action='store_true',
+    help='have the guests measure their TSC rate after every cell and store it with the results')
+parser.add_argument(
+    '--benchmarks', default='default',
+    help='comma-separated benchmarks to run on every line, "default" or "all" (see registry.py)')
+parser.add_argument(
+    '--abort-stall', type=float, metavar='SECONDS',
+    help='abandon the guest group if a vCPU makes no progress for this long')
+parser.add_argument(
+    '--abort-p99', type=float, metavar='CYCLES',
+    help='abandon the guest group if a guest\'s recent p99 exceeds this many cycles')
 
 # Mutually exclusive args
 mut_group = parser.add_mutually_exclusive_group()
@@ -133,6 +340,16 @@ mut_group.add_argument(
 
 args = parser.parse_args()
 
+try:
+    benchmarks = select(args.benchmarks)
+except ValueError as e:
+    parser.error(str(e))
+
+adaptive_settings = AdaptiveSettings(args.target, args.min_batches, args.max_batches, args.batch_fraction)
+abort_rules = AbortRules(args.abort_stall, args.abort_p99)
+if any(abort_rules) and not args.telemetry_interval:
+    parser.error('--abort-stall and --abort-p99 need --telemetry-interval')
+
 #--------------------------------------------------------------------------------------------------#
 
 # Check paths are valid
@@ -144,84 +361,52 @@ if not args.benchmark_list.is_file():
 # Read list of benchmarks from file
 benchmark_list = args.benchmark_list.read_text().splitlines()
 
-#--------------------------------------------------------------------------------------------------#
-
-# Create and bind socket for communication with guests
-host_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-host_socket.bind(('0.0.0.0', SOCKET_PORT))
+# Creates and shuts down guests concurrently
+domains = DomainManager(xl=args.xl, max_parallel=args.parallel)
+# Samples Xen's view of every cell
+sampler = XenSampler(args.xl, args.xentop, args.xen_interval) if args.xen_interval else None
 
 #--------------------------------------------------------------------------------------------------#
 
-# Run benchmark for each benchmark in the list
-for lineno, benchmark in enumerate(benchmark_list):
-
-    # Ignore any blank lines
-    if benchmark in ('', '\n'):
-        continue
-
-    # Check benchmark string is well formed
-    re_match = re.fullmatch(REGEX_STR, benchmark)
-    if re_match is None:
-        sys.exit('Invalid benchmark string')
+# One event loop for the whole run, so the socket for communication with guests stays bound
+# between suites
+loop = asyncio.new_event_loop()
+coordinator = loop.run_until_complete(Coordinator.open(SOCKET_PORT))
+# Latest progress of the running benchmark on every guest
+live_view = LiveView()
+coordinator.handlers['PROGRESS'] = live_view.update
 
-    # Extract regex groups into dictionary
-    m = re_match.groupdict()
-
-    # Ignore benchmarks that have already been run
-    if benchmark.startswith('|X|'):
-        continue
-
-    if args.no_hvm and m['virt_method'] == 'hvm':
-        continue
+#--------------------------------------------------------------------------------------------------#
 
-    # Ignore benchmarks that cannot be run because of current hypervisor configuration
+def matches_host(key):
+    # Whether lines with this host key can run under the current hypervisor configuration.
     # For example, do not run null-scheduler benchmarks when credit2-scheduler is active
-    if not bicond(args.null, m['scheduler'] == 'null'):
-        continue
-    if not bicond(args.low_slop, m['slop'] == 'low-slop'):
-        continue
-    if not bicond(args.less_dom0_cpus == 'pinning-on', m['dom0_cpus'] == 'dom0-less-cpus-pinned'):
-        continue
-    if not bicond(args.less_dom0_cpus == 'pinning-off', m['dom0_cpus'] == 'dom0-less-cpus'):
-        continue
-    if not bicond(args.ht, m['hyperthreading'] == 'ht-on'):
-        continue
+    return bicond(args.null, key.null_scheduler) \
+       and bicond(args.low_slop, key.slop == 'low-slop') \
+       and bicond(args.less_dom0_cpus == 'pinning-on', key.dom0_cpus == 'dom0-less-cpus-pinned') \
+       and bicond(args.less_dom0_cpus == 'pinning-off', key.dom0_cpus == 'dom0-less-cpus') \
+       and bicond(args.ht, key.hyperthreading == 'ht-on')
 
-    #----------------------------------------------------------------------------------------------#
+def write_guest_cfgs(config):
+    # The guest configs depend only on the host and guest keys, so any line of a group will do
+    m = config._asdict()
+    layout = guest_layout(config)
 
     # Delete old guest configs
     for vm_cfg in guest_cfg_dir.glob(GUEST_NAME_PREFIX + '*.cfg'):
         vm_cfg.unlink()
 
-    # Number of vCPUs to assign to each guest
-    if m['num_vms'] == '4VM':
-        guest_vcpus = 13
-    elif m['num_vms'] == '13VM':
-        guest_vcpus = 4
-
-    if m['dom0_cpus'] in ('dom0-less-cpus-pinned', 'dom0-null-pinning'):
-        num_vms = (host_cpus - 8) // guest_vcpus
-        first_guest_vcpu = math.ceil(8 / guest_vcpus) * guest_vcpus
-    else:
-        num_vms = host_cpus // guest_vcpus
-        first_guest_vcpu = 0
-
-    # Double these values if SMT is enabled
-    if m['hyperthreading'] == 'ht-on':
-        guest_vcpus *= 2
-        host_cpus *= 2
-
-    for vm_number, lowest_vcpu in enumerate(range(first_guest_vcpu, host_cpus, guest_vcpus)):
+    for vm_number, lowest_vcpu in enumerate(layout.lowest_cpus):
         vm_name = GUEST_NAME_PREFIX + str(vm_number+1)
         image = 'hvm-disk.raw,hda1' if m['virt_method'] == 'hvm' else 'disk.img,xvda2'
         mac_offset = 13 if m['virt_method'] == 'hvm' else 0
 
         # Configuration that all VMs need
         common_cfg = (
-            f'\n#{benchmark.removeprefix("| |    ")}\n'
+            f'\n#{format_benchmark(config)}\n'
             f'name = \'{vm_name}\'\n'
             f'type = \'{m["virt_method"]}\'\n'
-            f'vcpus = {guest_vcpus}\n'
+            f'vcpus = {layout.guest_vcpus}\n'
             f'vif = [\'mac={ mac_list[vm_number+mac_offset] }\']\n'
             f'disk = [\'file:{args.image_directory/vm_name}/{image},w\']\n'
         )
@@ -238,13 +423,67 @@ for lineno, benchmark in enumerate(benchmark_list):
 
         # Pin CPUs if pinning is enabled (cpu string is range inclusive)
         if m['vcpu_pinning'] == 'pinning-on':
-            type_specific_cfg += f'cpus = \'{lowest_vcpu}-{lowest_vcpu+guest_vcpus-1}\'\n'
+            type_specific_cfg += f'cpus = \'{lowest_vcpu}-{lowest_vcpu+layout.guest_vcpus-1}\'\n'
 
         # Write new config to file 
         new_guest_cfg = GUEST_BASE_CFG + common_cfg + type_specific_cfg
         (guest_cfg_dir / (vm_name+'.cfg')).write_text(new_guest_cfg)
 
-    #----------------------------------------------------------------------------------------------#
+    return layout.num_vms
+
+def shutdown_guests(num_vms):
+    domains.shutdown(domains.list_domains().keys() & {f'{GUEST_NAME_PREFIX}{i}' for i in range(1, num_vms+1)})
+
+#--------------------------------------------------------------------------------------------------#
+
+# Completed cells, appended to as they finish
+journal = Journal(journal_path(args.benchmark_list))
+# Cells that finished before a crash, but whose uploads were not confirmed yet
+if journal.pending():
+    if args.upload is None:
+        print(f'{len(journal.pending())} cells were not confirmed uploaded and will run again (see --upload)')
+    else:
+        confirmed = journal.confirm(open_backend(args.upload))
+        print(f'Found the results of {confirmed} of {confirmed + len(journal.pending())} cells '
+              f'not confirmed uploaded; the others will run again')
+
+def mark_done(entries):
+    for lineno, config in entries:
+        benchmark_list[lineno] = format_line(config, done=True)
+    write_atomic(args.benchmark_list, '\n'.join(benchmark_list))
+
+# Plan the lines that can run under the current hypervisor configuration
+try:
+    entries = pending_entries(benchmark_list)
+except ValueError as e:
+    sys.exit(str(e))
+
+# Lines whose cells all finished before a crash prevented them from being marked
+finished = [(lineno, config) for lineno, config in entries
+            if open_vms_needed([config], guest_layout(config).num_vms) == 0]
+if finished:
+    print(f'Marking {len(finished)} lines completed according to the journal')
+    mark_done(finished)
+    entries = [entry for entry in entries if entry not in finished]
+if args.no_hvm:
+    entries = [(lineno, config) for lineno, config in entries if config.virt_method != 'hvm']
+# Baselines are run by native.py
+entries = [(lineno, config) for lineno, config in entries if config.virt_method in XEN_VIRT_METHODS]
+plan = [host_group for host_group in make_plan(entries) if matches_host(host_group.key)]
+guest_groups = [guest_group for host_group in plan for guest_group in host_group.guest_groups]
+
+print_plan(plan, benchmarks=benchmarks)
+other_hosts = len({host_key(config) for _, config in entries}) - len(plan)
+if other_hosts:
+    print(f'{other_hosts} other host configurations need a reboot with different flags (see planner.py)')
+
+# Run each group of lines on one set of guests
+for group_number, guest_group in enumerate(guest_groups, 1):
+    configs = [config for _, config in guest_group.entries]
+
+    num_vms = write_guest_cfgs(configs[0])
+    # After a crash, continue from the round that was interrupted
+    num_open_at_start = open_vms_needed(configs, num_vms)
 
     # Stop here if --config-only flag is provided
     if args.config_only:
@@ -255,61 +494,37 @@ for lineno, benchmark in enumerate(benchmark_list):
     print(vm_1_name + ' is defined by the following xl config:')
     print((guest_cfg_dir/(vm_1_name+'.cfg')).read_text())
 
-    # Determine host ratelimit
-    if m['scheduler'] == 'credit2-1ms':
-        ratelimit = 1000
-    elif m['scheduler'] == 'credit2-3ms':
-        ratelimit = 3000
-    elif m['scheduler'] == 'credit2-10ms':
-        ratelimit = 10000
+    remaining = sum(len(g.entries) for g in guest_groups[group_number-1:])
+    print(f'Beginning guest group {group_number}/{len(guest_groups)}: {len(configs)} lines '
+          f'({remaining} remaining)...')
 
-    remaining = '\n'.join(benchmark_list).count('| |')
-    print(f'Beginning new benchmark ({remaining} remaining)...')
-
-    print('Setting ratelimit...')
-    # Set ratelimit
-    subprocess.run(['xl', 'sched-credit2', '--schedparam', f'--ratelimit_us={ratelimit}'])
+    # Guests left running by an interrupted suite would share the CPUs with this one
+    domains.destroy_leftovers(GUEST_NAME_PREFIX)
 
     print('Starting guests...')
-    # Start all new guests
-    for vm_cfg in [guest_cfg_dir/f'{GUEST_NAME_PREFIX}{i}.cfg' for i in range(1, num_vms+1)]:
-        subprocess.run(['xl', 'create', str(vm_cfg)])
-        
-    #----------------------------------------------------------------------------------------------#
-    
-    guest_statuses = {f'{GUEST_NAME_PREFIX}{i}' : '?' for i in range(1,num_vms+1)}
-    
-    for num_open_vms in range(num_vms, 0, -1):
-        for executable in BENCHMARKS:
-            wait_on_guest_messages('READY', guest_statuses)
+    # Start all new guests, returning once every domain is listed by xl
+    failed = domains.create([guest_cfg_dir/f'{GUEST_NAME_PREFIX}{i}.cfg' for i in range(1, num_open_at_start+1)])
+    if failed:
+        shutdown_guests(num_vms)
+        sys.exit(f'Failed to start {", ".join(failed)}')
 
-            print('\nAll guests ready! Starting benchmarks...')
-
-            start_command = f'START {executable} {num_open_vms} {m["taskset"]} {benchmark}'
-            send_message_to_guests(start_command, guest_statuses)
-
-            wait_on_guest_messages('FINISHED', guest_statuses)
-            print('\nAll guests finished! Uploading files...')
-
-            # Prevents UPLOADED from getting mixed in with FINISH if VM1 finishes quickly
-            send_message_to_guests('CONTINUE', guest_statuses)
+    #----------------------------------------------------------------------------------------------#
 
-            wait_on_message('UPLOADED')
-            print('Upload finished!')
+    try:
+        loop.run_until_complete(run_group(configs, num_open_at_start))
+    except (PhaseTimeout, GuestError, Anomaly) as e:
+        # Leave the lines unmarked; the cells completed so far are in the journal
+        print(f'\n{e}. Abandoning guest group.')
+        shutdown_guests(num_vms)
+        continue
 
-            send_message_to_guests('RESET', guest_statuses)
-            
-        if num_open_vms > 1:
-            name = f'{GUEST_NAME_PREFIX}{num_open_vms}'
-            attempt_shutdown(name)
-            guest_statuses[name] = 'X'
-        
-    print('Benchmark suite complete!')
-    attempt_shutdown(GUEST_NAME_PREFIX + '1', ensure=True)
+    print('Guest group complete!')
+    # Returns once the domain is really gone, so the next group starts on an idle host
+    domains.shutdown([GUEST_NAME_PREFIX + '1'])
 
     print('Updating benchmark list...')
-    benchmark_list[lineno] = benchmark_list[lineno].replace('| |', '|X|')
-    with open(args.benchmark_list, 'w') as f:
-        f.writelines('\n'.join(benchmark_list))
+    mark_done(guest_group.entries)
 
-host_socket.close()
+journal.close()
+coordinator.close()
+loop.close()
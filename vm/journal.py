@@ -0,0 +1,102 @@
+import os
+import json
+import time
+from pathlib import Path
+
+# Crash-safe record of completed benchmark cells. Every (benchmark line, num_open_vms, executable)
+# cell is appended as one JSON line and fsync'd as soon as its results are uploaded, so after a
+# crash host.py skips exactly the cells that are done instead of the whole line:
+#
+#   {"benchmark": "[13VM][pv]...", "num_open_vms": 7, "executable": "timectxsw", "locations": {guest: ...},
+#    "start_skew": ..., "start_offsets": {guest: ...}, "time": ...}
+#
+# The guests upload in the background and the host only confirms the uploads at the end of a
+# round, so a cell is first appended as pending when it finishes, with where each guest is
+# uploading to instead of "locations":
+#
+#   {..., "destinations": {guest: ...}, "uploaded": false}
+#
+# and again as above once its uploads are confirmed. After a crash, a pending cell whose results
+# the backend has for every guest can be confirmed without running it again (see confirm).
+#
+# A line torn by a crash mid-append is ignored on load; the last line of a cell wins.
+
+def journal_path(benchmark_list):
+    return Path(f'{benchmark_list}.journal')
+
+def fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def write_atomic(path, text):
+    # Replace path with text such that a crash leaves either the old or the new contents
+    path = Path(path)
+    tmp_path = path.with_name(f'.{path.name}.tmp')
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_dir(path.parent)
+
+class Journal:
+
+    def __init__(self, path):
+        self.path = Path(path)
+        # (benchmark, num_open_vms, executable) -> journal record, of done and pending cells
+        self.cells = {}
+        self.pending_cells = {}
+        text = self.path.read_text() if self.path.exists() else ''
+        for line in text.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            self.store((record['benchmark'], record['num_open_vms'], record['executable']), record)
+        self.file = open(self.path, 'a')
+        if text and not text.endswith('\n'):
+            # Terminate a torn line so that the next record starts on its own line
+            self.file.write('\n')
+
+    def close(self):
+        self.file.close()
+
+    def store(self, key, record):
+        if record.get('uploaded', True):
+            self.cells[key] = record
+            self.pending_cells.pop(key, None)
+        else:
+            self.pending_cells[key] = record
+
+    def is_done(self, benchmark, num_open_vms, executable):
+        return (benchmark, num_open_vms, executable) in self.cells
+
+    def pending(self):
+        # Records of the cells run but not confirmed uploaded
+        return list(self.pending_cells.values())
+
+    def record(self, benchmark, num_open_vms, executable, **fields):
+        record = {'benchmark' : benchmark, 'num_open_vms' : num_open_vms, 'executable' : executable,
+                  'time' : time.time(), **fields}
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.store((benchmark, num_open_vms, executable), record)
+
+    def record_pending(self, benchmark, num_open_vms, executable, destinations, **fields):
+        self.record(benchmark, num_open_vms, executable, destinations=destinations, uploaded=False, **fields)
+
+    def confirm(self, backend):
+        # Journal as done the pending cells whose results the backend has for every guest. Returns
+        # how many there were.
+        confirmed = 0
+        for record in self.pending():
+            locations = {guest : backend.stored(d) for guest, d in record['destinations'].items()}
+            if all(locations.values()):
+                fields = {k : v for k, v in record.items() if k not in ('destinations', 'uploaded', 'time')}
+                self.record(**fields, locations=locations)
+                confirmed += 1
+        return confirmed
@@ -0,0 +1,32 @@
+import math
+import collections
+
+# How the host's CPUs are divided between guests for a configuration
+
+HOST_CPUS = 52
+
+# CPUs kept for dom0 when it is restricted
+DOM0_CPUS = 8
+
+# vCPUs given to each guest, per num_vms value
+GUEST_VCPUS = {'4VM' : 13, '13VM' : 4}
+
+GuestLayout = collections.namedtuple('GuestLayout', ['num_vms', 'guest_vcpus', 'lowest_cpus'])
+# lowest_cpus: first host CPU of each guest's range, used when pinning
+
+def guest_layout(config, host_cpus=HOST_CPUS):
+    guest_vcpus = GUEST_VCPUS[config.num_vms]
+
+    if config.dom0_cpus in ('dom0-less-cpus-pinned', 'dom0-null-pinning'):
+        num_vms = (host_cpus - DOM0_CPUS) // guest_vcpus
+        first_guest_vcpu = math.ceil(DOM0_CPUS / guest_vcpus) * guest_vcpus
+    else:
+        num_vms = host_cpus // guest_vcpus
+        first_guest_vcpu = 0
+
+    # Double the vCPUs per guest if SMT is enabled (dom0's vCPUs stay on the first CPUs)
+    if config.hyperthreading == 'ht-on':
+        guest_vcpus *= 2
+
+    lowest_cpus = [first_guest_vcpu + i*guest_vcpus for i in range(num_vms)]
+    return GuestLayout(num_vms, guest_vcpus, lowest_cpus)
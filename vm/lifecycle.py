@@ -0,0 +1,126 @@
+import re
+import time
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+# Concurrent creation and teardown of guest domains through the xl toolstack. Every command is
+# issued from a small thread pool (at most max_parallel at once), and completion is decided by
+# polling "xl list" rather than by sleeping for a fixed time, so a suite moves on as soon as its
+# domains are actually up or actually gone. The xl executable can be replaced (see fake_xl.py).
+
+# Domain states as tracked by the manager
+CREATING = 'creating'
+RUNNING = 'running'
+SHUTTING_DOWN = 'shutting-down'
+GONE = 'gone'
+FAILED = 'failed'
+
+CFG_NAME_REGEX = r'(?m)^\s*name\s*=\s*[\'"](?P<name>[^\'"]+)[\'"]'
+
+def cfg_domain_name(cfg_path):
+    match = re.search(CFG_NAME_REGEX, cfg_path.read_text())
+    if match is None:
+        raise ValueError(f'No domain name in {cfg_path}')
+    return match['name']
+
+class DomainManager:
+
+    def __init__(self, xl='xl', max_parallel=4, poll_interval=0.5, shutdown_timeout=120,
+                 destroy_timeout=30, create_timeout=120):
+        self.xl = xl
+        self.max_parallel = max_parallel
+        self.poll_interval = poll_interval
+        self.shutdown_timeout = shutdown_timeout
+        self.destroy_timeout = destroy_timeout
+        self.create_timeout = create_timeout
+        # Domain name -> one of the states above
+        self.states = {}
+
+    def run_xl(self, *args, timeout=None, check=False):
+        return subprocess.run([self.xl, *args], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              text=True, timeout=timeout, check=check)
+
+    def list_domains(self):
+        # Name -> xl state flags (e.g. 'r-----') of every domain except Domain-0
+        output = self.run_xl('list', check=True).stdout.splitlines()
+        domains = {}
+        for line in output[1:]:
+            fields = line.split()
+            if len(fields) >= 5 and fields[0] != 'Domain-0':
+                domains[fields[0]] = fields[4]
+        return domains
+
+    def run_all(self, function, items):
+        with ThreadPoolExecutor(max_workers=self.max_parallel) as executor:
+            return list(executor.map(function, items))
+
+    def wait_until(self, names, predicate, timeout):
+        # Poll xl list until predicate(name, domains) holds for every name. Returns the names for
+        # which it still does not hold when the timeout expires.
+        deadline = time.monotonic() + timeout
+        pending = set(names)
+        while True:
+            domains = self.list_domains()
+            pending = {name for name in pending if not predicate(name, domains)}
+            if not pending or time.monotonic() >= deadline:
+                return pending
+            time.sleep(self.poll_interval)
+
+    #----------------------------------------------------------------------------------------------#
+
+    def create(self, cfg_paths):
+        # Create every domain, at most max_parallel xl create commands at once, and wait until they
+        # are all listed. Returns the names of the domains that failed to come up.
+        names = [cfg_domain_name(cfg_path) for cfg_path in cfg_paths]
+        for name in names:
+            self.states[name] = CREATING
+
+        def create_one(item):
+            name, cfg_path = item
+            result = self.run_xl('create', str(cfg_path), timeout=self.create_timeout)
+            if result.returncode != 0:
+                print(f'Failed to create domain "{name}": {result.stderr.strip()}')
+                self.states[name] = FAILED
+
+        self.run_all(create_one, list(zip(names, cfg_paths)))
+
+        created = [name for name in names if self.states[name] == CREATING]
+        missing = self.wait_until(created, lambda name, domains: name in domains, self.create_timeout)
+        for name in created:
+            self.states[name] = FAILED if name in missing else RUNNING
+        return [name for name in names if self.states[name] == FAILED]
+
+    def shutdown(self, names):
+        # Ask every domain to shut down, destroy any that are still there after shutdown_timeout, and
+        # return once none of them are listed any more
+        names = list(names)
+        for name in names:
+            self.states[name] = SHUTTING_DOWN
+
+        self.run_all(lambda name: self.run_xl('shutdown', name), names)
+        remaining = self.wait_until(names, lambda name, domains: name not in domains, self.shutdown_timeout)
+
+        if remaining:
+            for name in sorted(remaining):
+                print(f'Failed to shutdown domain "{name}". Destroying...')
+            self.destroy(remaining)
+
+        for name in names:
+            self.states[name] = GONE
+
+    def destroy(self, names):
+        names = list(names)
+        self.run_all(lambda name: self.run_xl('destroy', name), names)
+        remaining = self.wait_until(names, lambda name, domains: name not in domains, self.destroy_timeout)
+        if remaining:
+            raise RuntimeError(f'Domains still present after destroy: {", ".join(sorted(remaining))}')
+        for name in names:
+            self.states[name] = GONE
+
+    def destroy_leftovers(self, prefix):
+        # Domains left behind by an interrupted run would skew the next suite
+        leftovers = [name for name in self.list_domains() if name.startswith(prefix)]
+        if leftovers:
+            print(f'Destroying leftover domains: {" ".join(leftovers)}')
+            self.destroy(leftovers)
+        return leftovers
@@ -0,0 +1,234 @@
+#!/usr/bin/env -S python3 -u
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import subprocess
+from pathlib import Path
+from configs import (NATIVE_VIRT_METHODS, XEN_VIRT_METHODS, format_benchmark, format_vm_dir, native_config,
+                     parse, parse_line, results_location)
+from layout import guest_layout
+from journal import Journal
+from registry import BENCHMARKS, VCPU_ENV, select
+from upload import LocalBackend, write_zip
+from tsc import TSC_PROGRAM, tsc_path, write_calibration
+from start import start_path, write_start
+
+# Baseline runner for bare metal, or inside a single KVM guest, replacing the shell loops in
+# contextswitch/ (bare_metal_4_13.sh and cpubench.sh). For a configuration it runs the sweep
+# host.py runs under Xen: with n = N..1 VM-equivalents open, n groups of processes, one per vCPU a
+# guest would have, placed on the CPUs guest_layout gives the guests:
+#
+#   vcpu_pinning    pinning-on: a group runs on its VM's CPUs; pinning-off: on any guest CPU
+#   taskset         taskset-on: with pinning-on, every process on its own CPU of its VM
+#   num_vms, hyperthreading, dom0_cpus
+#                   as in the guest layout; the CPUs dom0 would keep stay idle
+#
+# The layout is applied to the CPUs this process may use, in order, counting two threads per core
+# with ht-on, so a smaller machine runs fewer VM-equivalents.
+#
+# A configuration whose layout does not fit on those CPUs is skipped.
+#
+# The scheduler, memory management and slop only apply to Xen and stay in the name, so the results
+# line up with the Xen configuration they are a baseline for. Configurations that differ only in
+# these are run once and the results copied to each of them. They are written to the same tree as
+# the Xen runs, with virt_method set to native or kvm:
+#
+#   <results>/(13VM)(native)(pinning-on)...(low-slop)/7/timectxsw.zip       VM1
+#   <results>/(13VM)(native)(pinning-on)...(low-slop)/7/vm4/timectxsw.zip   VM4
+#
+# so "summary_db.py query <benchmark> --like <suite> --vary virt_method" compares Xen and native.
+# Completed cells are journalled like host.py's, and skipped when the runner is started again.
+
+# Dimensions that make no difference without Xen
+XEN_ONLY_DIMENSIONS = ('scheduler', 'mem_management', 'slop')
+
+JOURNAL_NAME = 'native.journal'
+STAGING_NAME = '.native-staging'
+TSC_NAME = 'tsc.json'
+
+# As in guest.py: processes are created ahead of the start and exec the benchmark once released
+BARRIER_COMMAND = ['sh', '-c', 'read _ && exec "$@"', 'sh']
+
+def detect_virt_method():
+    # kvm inside a virtual machine, native otherwise
+    try:
+        flags = next(line for line in Path('/proc/cpuinfo').read_text().splitlines() if line.startswith('flags'))
+    except (OSError, StopIteration):
+        return 'native'
+    return 'kvm' if 'hypervisor' in flags.split() else 'native'
+
+def read_configs(specs):
+    # Configurations from the command line: either form, a benchmark list line, or a benchmark
+    # list file (all of its lines, done or not)
+    configs = []
+    for spec in specs:
+        lines = Path(spec).read_text().splitlines() if Path(spec).is_file() else [spec]
+        for line in lines:
+            if not line.strip():
+                continue
+            parsed = parse_line(line)
+            config = parsed[0] if parsed is not None else parse(line.strip())
+            if config is None:
+                raise ValueError(f'Invalid configuration: {line}')
+            configs.append(config)
+    return configs
+
+def group_configs(configs):
+    # Configurations grouped by what is actually run: [[config, ...], ...] with the members of a
+    # group differing only in XEN_ONLY_DIMENSIONS
+    groups = {}
+    for config in configs:
+        groups.setdefault(config._replace(**dict.fromkeys(XEN_ONLY_DIMENSIONS)), []).append(config)
+    return list(groups.values())
+
+def native_layout(config, cpus):
+    # The guest layout on the given CPUs
+    return guest_layout(config, len(cpus) // 2 if config.hyperthreading == 'ht-on' else len(cpus))
+
+def vm_cpus(config, cpus, vm):
+    # CPUs the processes of VM vm (1-based) may run on
+    layout = native_layout(config, cpus)
+    firsts = layout.lowest_cpus[vm-1:vm] if config.vcpu_pinning == 'pinning-on' else layout.lowest_cpus
+    return [cpus[first + i] for first in firsts for i in range(layout.guest_vcpus)]
+
+def run_cell(config, num_open_vms, benchmark, cpus, staging_dir, benchmark_dir, iterations=None):
+    # Run one benchmark on num_open_vms VM-equivalents at once. Returns {vm: output paths}, which
+    # include each VM's start record, and the seconds each VM was released after the first one.
+    spec = BENCHMARKS[benchmark]
+    pinned = spec.affinity == 'vcpu' and config.taskset == 'taskset-on' and config.vcpu_pinning == 'pinning-on'
+    guest_vcpus = native_layout(config, cpus).guest_vcpus
+    outputs = {}
+    processes = []
+    for vm in range(1, num_open_vms+1):
+        vm_dir = staging_dir/format_vm_dir(vm)
+        vm_dir.mkdir(parents=True, exist_ok=True)
+        allowed = vm_cpus(config, cpus, vm)
+        # Position of the VM's first vCPU in `allowed`, which holds every guest's CPUs unless pinned
+        first_vcpu = 0 if config.vcpu_pinning == 'pinning-on' else (vm-1) * guest_vcpus
+        outputs[vm] = []
+        for vcpu in range(guest_vcpus):
+            outputs[vm].append(vm_dir/f'{benchmark}{vcpu}.out')
+            parameters = [str(benchmark_dir/spec.name), str(outputs[vm][-1])]
+            if iterations:
+                parameters.append(str(iterations))
+            # Programs that place their own threads get all of the VM's CPUs and the index of their
+            # vCPU's among them
+            process_cpus = allowed[first_vcpu+vcpu:first_vcpu+vcpu+1] if pinned else allowed
+            command = ['taskset', '--cpu-list', ','.join(map(str, process_cpus))] + BARRIER_COMMAND + parameters
+            env = {**os.environ, VCPU_ENV : str(first_vcpu + vcpu)}
+            processes.append((vm, subprocess.Popen(command, stdin=subprocess.PIPE, env=env)))
+
+    released = {}
+    for vm, process in processes:
+        released.setdefault(vm, time.time())
+        process.stdin.write(b'\n')
+        process.stdin.close()
+    failed = [vm for vm, process in processes if process.wait() != 0]
+    if failed:
+        raise RuntimeError(f'{benchmark} failed in {", ".join(format_vm_dir(vm) for vm in sorted(set(failed)))}')
+    first = min(released.values())
+    for vm, t in released.items():
+        outputs[vm].append(write_start(start_path(staging_dir/format_vm_dir(vm), benchmark), first, t))
+    return outputs, {format_vm_dir(vm) : t - first for vm, t in released.items()}
+
+def store_cell(backend, configs, num_open_vms, benchmark, outputs, staging_dir, tsc=None):
+    # Zip every VM's outputs, and the TSC calibration if one was taken, into the results tree of
+    # each configuration. Returns {config: {vm: location}}.
+    locations = {config : {} for config in configs}
+    for vm, paths in outputs.items():
+        if tsc is not None:
+            paths = paths + [shutil.copyfile(tsc, tsc_path(staging_dir/format_vm_dir(vm), benchmark))]
+        zip_path = staging_dir/format_vm_dir(vm)/f'{benchmark}.zip'
+        write_zip(zip_path, paths)
+        for config in configs:
+            locations[config][format_vm_dir(vm)] = backend.upload(
+                zip_path, results_location(config, num_open_vms, benchmark, vm))
+        zip_path.unlink()
+        for path in paths:
+            path.unlink()
+    return locations
+
+def run_group(configs, args, journal, backend, staging_dir):
+    # Run the sweep of a group of configurations (see group_configs) once, for all of them
+    config = configs[0]
+    layout = native_layout(config, args.cpus)
+    if layout.num_vms < 1:
+        print(f'Skipping {format_benchmark(config)}: it needs more than the {len(args.cpus)} CPUs available')
+        return
+    for num_open_vms in range(layout.num_vms, 0, -1):
+        for benchmark in args.benchmarks:
+            pending = [c for c in configs if not journal.is_done(format_benchmark(c), num_open_vms, benchmark)]
+            if not pending:
+                continue
+            print(f'{format_benchmark(pending[0])} with {num_open_vms} VMs open: {benchmark}'
+                  + (f' (for {len(pending)} configurations)' if len(pending) > 1 else ''))
+            outputs, offsets = run_cell(config, num_open_vms, benchmark, args.cpus, staging_dir,
+                                        args.benchmark_dir, args.iterations)
+            # The VM-equivalents share the host's TSC, so one calibration serves them all
+            tsc = write_calibration(staging_dir/TSC_NAME, args.benchmark_dir) if args.calibrate_tsc else None
+            locations = store_cell(backend, pending, num_open_vms, benchmark, outputs, staging_dir, tsc)
+            for c in pending:
+                journal.record(format_benchmark(c), num_open_vms, benchmark, locations=locations[c],
+                               start_skew=max(offsets.values()), start_offsets=offsets)
+
+####  Main program  ################################################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Run the VM-count sweep of Xen configurations on bare metal or inside a KVM guest.')
+    parser.add_argument(
+        'results_dir', metavar='results-dir', type=Path,
+        help='results tree to write to, laid out like the Xen results')
+    parser.add_argument(
+        'configs', metavar='config', nargs='+',
+        help='Xen configuration to run the baseline of, in either form, or a benchmark list file')
+    parser.add_argument(
+        '--virt-method', choices=NATIVE_VIRT_METHODS, default=detect_virt_method(),
+        help='what the results are recorded as (default: kvm inside a virtual machine, native otherwise)')
+    parser.add_argument(
+        '--benchmarks', default='default',
+        help='comma-separated benchmarks to run, "default" or "all" (see registry.py)')
+    parser.add_argument(
+        '--benchmark-dir', type=Path, default=Path(__file__).resolve().parent.parent/'contextswitch',
+        help='directory of the built benchmark programs')
+    parser.add_argument(
+        '--calibrate-tsc', action='store_true',
+        help='measure the TSC rate after every cell and store it with the results')
+    parser.add_argument(
+        '--iterations', type=int,
+        help='iterations per process instead of the programs\' fixed count (for quick trials)')
+
+    args = parser.parse_args()
+    args.cpus = sorted(os.sched_getaffinity(0))
+
+    try:
+        args.benchmarks = select(args.benchmarks)
+        configs = read_configs(args.configs)
+    except ValueError as e:
+        parser.error(str(e))
+    # Lines of a benchmark list for different Xen virt methods share one baseline
+    configs = list(dict.fromkeys(native_config(config, args.virt_method) for config in configs
+                                 if config.virt_method in XEN_VIRT_METHODS + (args.virt_method,)))
+    programs = [BENCHMARKS[name].name for name in args.benchmarks] + ([TSC_PROGRAM] if args.calibrate_tsc else [])
+    missing = [name for name in programs if not (args.benchmark_dir/name).is_file()]
+    if missing:
+        sys.exit(f'Not built in {args.benchmark_dir}: {", ".join(missing)} (run make there)')
+
+    args.results_dir.mkdir(parents=True, exist_ok=True)
+    staging_dir = args.results_dir/STAGING_NAME
+    journal = Journal(args.results_dir/JOURNAL_NAME)
+    backend = LocalBackend(args.results_dir)
+    groups = group_configs(configs)
+    try:
+        for number, group in enumerate(groups, 1):
+            print(f'Configuration {number}/{len(groups)}')
+            run_group(group, args, journal, backend, staging_dir)
+    except RuntimeError as e:
+        sys.exit(str(e))
+    finally:
+        journal.close()
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    print('Done!')
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+import sys
+import argparse
+import collections
+from pathlib import Path
+from configs import parse_line, format_benchmark
+from layout import guest_layout
+from registry import DEFAULT_BENCHMARKS, select
+
+# Execution plan for the benchmark list. Dimensions differ in what it takes to change them:
+#
+#   host:     slop, hyperthreading, dom0 CPUs, null vs credit2 scheduler   -> reboot the host
+#   guest:    num_vms, virt_method, vcpu_pinning, mem_management           -> re-create the guests
+#   runtime:  credit2 ratelimit (xl sched-credit2), taskset (guest side)   -> nothing
+#
+# Lines are grouped by host key, then by guest key. One guest group is run on one set of domains,
+# with every runtime variant run against them before a guest is shut down (see host.py), so the
+# guests are created once per group rather than once per line.
+
+GUEST_DIMENSIONS = ('num_vms', 'virt_method', 'vcpu_pinning', 'mem_management')
+RUNTIME_DIMENSIONS = ('scheduler', 'taskset')
+
+HostKey = collections.namedtuple('HostKey', ['slop', 'hyperthreading', 'dom0_cpus', 'null_scheduler'])
+GuestKey = collections.namedtuple('GuestKey', GUEST_DIMENSIONS)
+
+# entries: list of (line number in the benchmark list, Config)
+GuestGroup = collections.namedtuple('GuestGroup', ['key', 'entries'])
+HostGroup = collections.namedtuple('HostGroup', ['key', 'guest_groups'])
+
+# Rough cost of each step in seconds, used for estimates only
+Timings = collections.namedtuple('Timings', ['reboot', 'create', 'shutdown', 'ratelimit', 'benchmark'])
+DEFAULT_TIMINGS = Timings(reboot=900, create=90, shutdown=20, ratelimit=1, benchmark=60)
+
+# The fixed wait after every suite in the original runner
+OLD_SUITE_SLEEP = 30
+
+def host_key(config):
+    return HostKey(config.slop, config.hyperthreading, config.dom0_cpus, config.scheduler == 'null')
+
+def guest_key(config):
+    return GuestKey(*(getattr(config, d) for d in GUEST_DIMENSIONS))
+
+def host_flags(key):
+    # host.py arguments describing this host configuration
+    flags = []
+    if key.null_scheduler:
+        flags.append('--null')
+    if key.slop == 'low-slop':
+        flags.append('--low-slop')
+    if key.hyperthreading == 'ht-on':
+        flags.append('--ht')
+    if key.dom0_cpus == 'dom0-less-cpus-pinned':
+        flags.append('--less-dom0-cpus pinning-on')
+    if key.dom0_cpus == 'dom0-less-cpus':
+        flags.append('--less-dom0-cpus pinning-off')
+    return flags
+
+def pending_entries(benchmark_list):
+    # (line number, Config) for every line not yet marked done
+    entries = []
+    for lineno, line in enumerate(benchmark_list):
+        if line.strip() == '':
+            continue
+        parsed = parse_line(line)
+        if parsed is None:
+            raise ValueError(f'Invalid benchmark string on line {lineno+1}: {line}')
+        config, done = parsed
+        if not done:
+            entries.append((lineno, config))
+    return entries
+
+def runtime_order(entry):
+    # Within a group, run lines with the same ratelimit next to each other
+    _, config = entry
+    return tuple(getattr(config, d) for d in RUNTIME_DIMENSIONS)
+
+def make_plan(entries):
+    # Host groups and their guest groups in order of first appearance in the list
+    hosts = {}
+    for lineno, config in entries:
+        guests = hosts.setdefault(host_key(config), {})
+        guests.setdefault(guest_key(config), []).append((lineno, config))
+    return [HostGroup(hkey, [GuestGroup(gkey, sorted(group, key=runtime_order)) for gkey, group in guests.items()])
+            for hkey, guests in hosts.items()]
+
+#--------------------------------------------------------------------------------------------------#
+
+def guest_group_seconds(group, timings=DEFAULT_TIMINGS, benchmarks=DEFAULT_BENCHMARKS):
+    # Create the guests once, run every line's benchmarks for each number of open VMs, shutting a
+    # guest down after each round
+    num_vms = guest_layout(group.entries[0][1]).num_vms
+    per_round = len(group.entries) * (len(benchmarks) * timings.benchmark + timings.ratelimit)
+    return timings.create + num_vms * (per_round + timings.shutdown)
+
+def host_group_seconds(group, timings=DEFAULT_TIMINGS, benchmarks=DEFAULT_BENCHMARKS):
+    return timings.reboot + sum(guest_group_seconds(g, timings, benchmarks) for g in group.guest_groups)
+
+def line_by_line_seconds(entries, timings=DEFAULT_TIMINGS, benchmarks=DEFAULT_BENCHMARKS):
+    # The same lines run one suite at a time, each creating its own guests
+    reboots = len({host_key(config) for _, config in entries})
+    suites = sum(guest_group_seconds(GuestGroup(guest_key(config), [(lineno, config)]), timings, benchmarks)
+                 + OLD_SUITE_SLEEP
+                 for lineno, config in entries)
+    return reboots * timings.reboot + suites
+
+def format_duration(seconds):
+    hours, minutes = divmod(round(seconds / 60), 60)
+    return f'{hours}h{minutes:02d}m'
+
+def print_plan(plan, timings=DEFAULT_TIMINGS, verbose=False, benchmarks=DEFAULT_BENCHMARKS):
+    for number, host_group in enumerate(plan, 1):
+        flags = ' '.join(host_flags(host_group.key)) or '(no flags)'
+        lines = sum(len(g.entries) for g in host_group.guest_groups)
+        print(f'Host configuration {number}: host.py {flags}')
+        print(f'    {len(host_group.guest_groups)} guest groups, {lines} lines, '
+              f'~{format_duration(host_group_seconds(host_group, timings, benchmarks))}')
+        for guest_group in host_group.guest_groups:
+            print(f'    [{"][".join(guest_group.key)}]  {len(guest_group.entries)} lines, '
+                  f'~{format_duration(guest_group_seconds(guest_group, timings, benchmarks))}')
+            if verbose:
+                for lineno, config in guest_group.entries:
+                    print(f'        {lineno+1:5}: {format_benchmark(config)}')
+
+####  Main program  ################################################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Print the execution plan and estimated time for a benchmark list.')
+    parser.add_argument(
+        'benchmark_list', metavar='benchmark-list', type=Path,
+        help='file containing list of remaining benchmarks')
+    parser.add_argument(
+        '-v', '--verbose', action='store_true',
+        help='list every line in each group')
+    parser.add_argument(
+        '--benchmarks', default='default',
+        help='comma-separated benchmarks each line runs, "default" or "all" (see registry.py)')
+    for field, default in DEFAULT_TIMINGS._asdict().items():
+        parser.add_argument(
+            f'--{field}-seconds', type=float, default=default,
+            help=f'estimated seconds per {field} (default {default})')
+
+    args = parser.parse_args()
+
+    try:
+        benchmarks = select(args.benchmarks)
+    except ValueError as e:
+        parser.error(str(e))
+    timings = Timings(*(getattr(args, f'{field}_seconds') for field in Timings._fields))
+    try:
+        entries = pending_entries(args.benchmark_list.read_text().splitlines())
+    except ValueError as e:
+        sys.exit(str(e))
+
+    plan = make_plan(entries)
+    print_plan(plan, timings, args.verbose, benchmarks)
+
+    planned = sum(host_group_seconds(g, timings, benchmarks) for g in plan)
+    print(f'\n{len(entries)} lines in {sum(len(g.guest_groups) for g in plan)} guest groups '
+          f'on {len(plan)} host configurations')
+    print(f'Estimated time: {format_duration(planned)} '
+          f'(line by line: {format_duration(line_by_line_seconds(entries, timings, benchmarks))})')
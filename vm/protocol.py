@@ -0,0 +1,297 @@
+import os
+import json
+import time
+import asyncio
+import itertools
+
+# Host <-> guest control protocol over UDP. Every message is a JSON object:
+#
+#   {"type": "READY", "from": "xen-benchmark-vm-3", "session": "...", "seq": 12, ...fields}
+#
+# "from" identifies the sender, so neither side has to resolve addresses to names; "session" is
+# unique per process, so a rebooted guest starting again at seq 1 is not taken for a duplicate.
+# Every message is acknowledged with {"type": "ACK", "from": ..., "ack": seq} and retransmitted
+# with exponential backoff until it is, and receivers drop duplicates. The host drives a state
+# machine per guest (Coordinator) with a deadline on every phase, so a lost datagram costs a
+# retransmit and a dead guest costs a PhaseTimeout instead of a stalled benchmark matrix.
+
+SOCKET_PORT = 44544
+HOST = 'host'
+
+RETRANSMIT_INTERVAL = 0.25
+MAX_RETRANSMIT_INTERVAL = 4
+
+# Guest states, as seen by the host
+BOOTING = 'BOOTING'
+READY = 'READY'
+RUNNING = 'RUNNING'
+FINISHED = 'FINISHED'
+UPLOADED = 'UPLOADED'
+RESETTING = 'RESETTING'
+OFFLINE = 'OFFLINE'
+
+# Guest message -> states it is accepted in. READY is accepted from every live state, since a
+# guest that reboots starts again from READY.
+TRANSITIONS = {
+    READY    : (BOOTING, READY, RUNNING, FINISHED, UPLOADED, RESETTING),
+    FINISHED : (RUNNING,),
+    UPLOADED : (FINISHED,),
+}
+
+# State waited for -> states that satisfy the wait (VM1 may already have uploaded)
+REACHED = {
+    FINISHED : (FINISHED, UPLOADED),
+}
+
+class PhaseTimeout(Exception):
+
+    def __init__(self, phase, guests):
+        super().__init__(f'Timed out waiting for {phase} from {", ".join(sorted(guests))}')
+        self.phase = phase
+        self.guests = sorted(guests)
+
+class GuestError(Exception):
+    pass
+
+def encode(message):
+    return json.dumps(message, separators=(',', ':')).encode('utf-8')
+
+def decode(data):
+    try:
+        message = json.loads(data.decode('utf-8'))
+    except ValueError:
+        return None
+    if not isinstance(message, dict) or not {'type', 'from'} <= message.keys():
+        return None
+    return message
+
+class Endpoint(asyncio.DatagramProtocol):
+    # Reliable, de-duplicated message delivery on top of a UDP socket
+
+    def __init__(self, name, on_message):
+        self.name = name
+        self.on_message = on_message
+        self.session = f'{os.getpid()}-{time.time_ns()}'
+        self.seq = itertools.count(1)
+        # (peer name, seq) -> future resolved by the peer's ACK
+        self.pending = {}
+        # (peer name, peer session) -> seqs already delivered
+        self.seen = {}
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, address):
+        message = decode(data)
+        if message is None:
+            return
+        if message['type'] == 'ACK':
+            future = self.pending.get((message['from'], message.get('ack')))
+            if future is not None and not future.done():
+                future.set_result(address)
+            return
+        if 'seq' not in message:
+            # Unacknowledged message (see post)
+            self.on_message(message, address)
+            return
+        self.transport.sendto(encode({'type' : 'ACK', 'from' : self.name, 'ack' : message['seq']}), address)
+        seen = self.seen.setdefault((message['from'], message.get('session')), set())
+        if message['seq'] in seen:
+            return
+        seen.add(message['seq'])
+        self.on_message(message, address)
+
+    def error_received(self, exc):
+        # E.g. ICMP port unreachable while the peer is not listening yet; retransmits cover it
+        pass
+
+    def post(self, address, type, **fields):
+        # Fire-and-forget message, for data that is superseded by the next one anyway
+        self.transport.sendto(encode({'type' : type, 'from' : self.name, **fields}), address)
+
+    async def send(self, peer, address, type, **fields):
+        # Send until acknowledged by peer. Callers bound the wait with their own deadline.
+        seq = next(self.seq)
+        data = encode({'type' : type, 'from' : self.name, 'session' : self.session, 'seq' : seq, **fields})
+        future = asyncio.get_running_loop().create_future()
+        self.pending[(peer, seq)] = future
+        interval = RETRANSMIT_INTERVAL
+        try:
+            while True:
+                self.transport.sendto(data, address)
+                try:
+                    return await asyncio.wait_for(asyncio.shield(future), interval)
+                except asyncio.TimeoutError:
+                    interval = min(interval * 2, MAX_RETRANSMIT_INTERVAL)
+        finally:
+            del self.pending[(peer, seq)]
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+async def open_endpoint(name, on_message, port=0):
+    loop = asyncio.get_running_loop()
+    _, endpoint = await loop.create_datagram_endpoint(
+        lambda: Endpoint(name, on_message), local_addr=('0.0.0.0', port))
+    return endpoint
+
+####  Host side  ###################################################################################
+
+class Coordinator:
+
+    def __init__(self):
+        self.endpoint = None
+        # Guest name -> state, address it last sent from and its last message (not counting
+        # messages that go to a handler)
+        self.states = {}
+        self.addresses = {}
+        self.messages = {}
+        # (guest, message type) -> future of an outstanding request()
+        self.replies = {}
+        # Message type -> callback(guest, message), for messages that are not replies, e.g. PROGRESS
+        self.handlers = {}
+        self.changed = asyncio.Event()
+
+    @classmethod
+    async def open(cls, port=SOCKET_PORT):
+        coordinator = cls()
+        coordinator.endpoint = await open_endpoint(HOST, coordinator.received, port)
+        return coordinator
+
+    def close(self):
+        self.endpoint.close()
+
+    def expect(self, guests):
+        # Start tracking a new set of guests, all of which are booting
+        self.states = {guest : BOOTING for guest in guests}
+        self.messages = {}
+        self.print_status()
+
+    def set_offline(self, guest):
+        self.states[guest] = OFFLINE
+        self.notify()
+
+    def online(self):
+        return [guest for guest, state in self.states.items() if state != OFFLINE]
+
+    def print_status(self):
+        status_string = ' '.join(state[0] for state in self.states.values())
+        print(f'Guest status: [{status_string}]', end='\r')
+
+    def notify(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def received(self, message, address):
+        guest, new_state = message['from'], message['type']
+        # E.g. a domain of a previous suite that is still shutting down
+        if guest not in self.states:
+            return
+        self.addresses[guest] = address
+        # Handled messages can arrive at any time (a PROGRESS frame after FINISHED), so they must not
+        # replace the message whose fields the host reads once a state is reached
+        if new_state in self.handlers:
+            self.handlers[new_state](guest, message)
+            return
+        self.messages[guest] = message
+        if new_state not in TRANSITIONS:
+            self.on_other_message(guest, message)
+            return
+        if self.states[guest] not in TRANSITIONS[new_state]:
+            print(f'\nIgnoring {new_state} from {guest} in state {self.states[guest]}')
+            return
+        self.states[guest] = new_state
+        self.print_status()
+        self.notify()
+
+    def on_other_message(self, guest, message):
+        # Messages that do not change a guest's state answer a request()
+        future = self.replies.pop((guest, message['type']), None)
+        if future is not None and not future.done():
+            future.set_result(message)
+
+    async def request(self, guest, type, reply_type, timeout, **fields):
+        # Send a command to one guest and wait for its reply, whatever state it is in
+        future = asyncio.get_running_loop().create_future()
+        self.replies[(guest, reply_type)] = future
+        try:
+            await asyncio.wait_for(self.endpoint.send(guest, self.addresses[guest], type, **fields), timeout)
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise PhaseTimeout(reply_type, [guest]) from None
+        finally:
+            self.replies.pop((guest, reply_type), None)
+
+    async def wait_for(self, state, timeout, guests=None):
+        # Wait until every given (by default every online) guest has reached state
+        guests = self.online() if guests is None else guests
+        deadline = time.monotonic() + timeout
+        while True:
+            pending = [guest for guest in guests if self.states[guest] not in REACHED.get(state, (state,))]
+            if not pending:
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise PhaseTimeout(state, pending)
+            try:
+                await asyncio.wait_for(self.changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    async def send_all(self, type, timeout, new_state, guests=None, **fields):
+        # Send a command to the given (by default every online) guests and wait for all of them to
+        # acknowledge it
+        guests = self.online() if guests is None else guests
+        # The new state is entered before sending: a guest may act on the command and reply before
+        # its acknowledgement reaches us
+        for guest in guests:
+            self.states[guest] = new_state
+        self.print_status()
+        sends = {guest : asyncio.ensure_future(self.endpoint.send(guest, self.addresses[guest], type, **fields))
+                 for guest in guests}
+        done, pending = await asyncio.wait(sends.values(), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            raise PhaseTimeout(f'{type} acknowledgement', [g for g, task in sends.items() if task in pending])
+
+####  Guest side  ##################################################################################
+
+class GuestAgent:
+
+    def __init__(self, name, host_address):
+        self.name = name
+        self.host_address = host_address
+        self.endpoint = None
+        self.commands = asyncio.Queue()
+        # Message type -> callback, for commands handled whatever the guest is doing
+        self.handlers = {}
+
+    @classmethod
+    async def open(cls, name, host_address, port=SOCKET_PORT):
+        agent = cls(name, host_address)
+        agent.endpoint = await open_endpoint(name, agent.received, port)
+        return agent
+
+    def received(self, message, address):
+        if message['from'] != HOST:
+            return
+        if message['type'] in self.handlers:
+            self.handlers[message['type']](message)
+        else:
+            self.commands.put_nowait(message)
+
+    async def send(self, type, **fields):
+        await self.endpoint.send(HOST, self.host_address, type, **fields)
+
+    def post(self, type, **fields):
+        self.endpoint.post(self.host_address, type, **fields)
+
+    async def wait_command(self, *types):
+        while True:
+            message = await self.commands.get()
+            print(message)
+            if message['type'] in types:
+                return message
@@ -0,0 +1,56 @@
+import collections
+
+# Every microbenchmark the guests can run: the programs in contextswitch/, installed on the guests
+# under benchmarks/ next to guest.py. host.py, guest.py, the adaptive mode and the analysis
+# scripts all take the benchmark set from here, so a new workload is its program plus one entry.
+#
+#   name         name of the program, which is called as <name> <output file> [iterations]
+#   iterations   iterations of a fixed-size run, as compiled into the program
+#   record       layout of the output file
+#   affinity     'vcpu': with taskset-on, the process is pinned to the vCPU it is numbered after
+#                'self': the program places its own threads among the CPUs it may use, starting
+#                from the one numbered VCPU_ENV
+#   default      run unless a benchmark set is chosen ("host.py --benchmarks")
+#   description  what it exercises
+#
+# With BENCHMARK_PROGRESS set, every program also keeps its results in that file as it goes (see
+# telemetry.py).
+
+RecordLayout = collections.namedtuple('RecordLayout', ['header_dtype', 'sample_dtype'])
+
+# int64 clock_gettime total in ns, then one uint32 rdtsc delta per iteration
+BINARY_RECORD = RecordLayout('<i8', '<u4')
+
+Benchmark = collections.namedtuple(
+    'Benchmark', ['name', 'iterations', 'record', 'affinity', 'default', 'description'])
+
+AFFINITIES = ('vcpu', 'self')
+VCPU_ENV = 'BENCHMARK_VCPU'
+
+BENCHMARKS = {b.name : b for b in (
+    Benchmark('timesyscall', 10_000_000, BINARY_RECORD, 'vcpu', True, 'gettid() system call'),
+    Benchmark('timectxsw', 500_000, BINARY_RECORD, 'vcpu', True, 'futex context switch between two processes'),
+    Benchmark('timetctxsw', 500_000, BINARY_RECORD, 'vcpu', True, 'futex context switch between two threads'),
+    Benchmark('timetctxsw2', 500_000, BINARY_RECORD, 'vcpu', True, 'sched_yield() switch between two threads'),
+    Benchmark('timeyield', 10_000_000, BINARY_RECORD, 'vcpu', False, 'sched_yield() with nothing else to run'),
+    Benchmark('timepipe', 500_000, BINARY_RECORD, 'vcpu', False, 'pipe ping-pong between two processes'),
+    Benchmark('timeeventfd', 500_000, BINARY_RECORD, 'vcpu', False, 'eventfd ping-pong between two threads'),
+    Benchmark('timepagefault', 1_000_000, BINARY_RECORD, 'vcpu', False, 'mmap, first write and munmap of a page'),
+    Benchmark('timeipi', 500_000, BINARY_RECORD, 'self', False, 'futex wakeup of a thread on the next vCPU'),
+)}
+
+DEFAULT_BENCHMARKS = tuple(name for name, b in BENCHMARKS.items() if b.default)
+
+def select(spec):
+    # Benchmark names from a comma-separated list, "default" or "all"
+    if spec == 'default':
+        return DEFAULT_BENCHMARKS
+    if spec == 'all':
+        return tuple(BENCHMARKS)
+    names = tuple(name.strip() for name in spec.split(',') if name.strip())
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if not names:
+        raise ValueError('No benchmarks given')
+    if unknown:
+        raise ValueError(f'Unknown benchmarks: {", ".join(unknown)} (known: {", ".join(BENCHMARKS)})')
+    return names
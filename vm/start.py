@@ -0,0 +1,23 @@
+import json
+
+# When a cell's benchmarks actually started. host.py tells every guest the wall-clock instant to
+# release its processes at; each guest stores when it did in the cell's results zip as
+# <bench>.start.json, one entry per run (a fixed-size cell has one, an adaptive cell one per batch):
+#
+#   {"runs": [{"start_at": 1700000000.25, "started_at": 1700000000.2503}, ...]}
+#
+# A run's start skew is the spread of started_at - start_at over the VMs' records, as host.py prints
+# and journals it. native.py stores the same record for each VM-equivalent, with start_at the
+# release of the first one.
+
+START_SUFFIX = '.start.json'
+
+def start_path(results_dir, benchmark):
+    return results_dir/f'{benchmark}{START_SUFFIX}'
+
+def write_start(path, start_at, started_at, new_cell=True):
+    # Add a run to the record, which is started afresh for a new cell
+    runs = [] if new_cell or not path.exists() else json.loads(path.read_text())['runs']
+    runs.append({'start_at' : start_at, 'started_at' : started_at})
+    path.write_text(json.dumps({'runs' : runs}, indent=2))
+    return path
@@ -0,0 +1,171 @@
+import time
+import collections
+import numpy as np
+from pathlib import Path
+
+# Live progress of a run. With BENCHMARK_PROGRESS set, the benchmark programs keep their results
+# array in a shared tmpfs file, filled in order and never zero. Every interval the guest finds the
+# filled prefix of each file by binary search (a few page reads) and posts a PROGRESS frame with,
+# per vCPU:
+#
+#   [iterations done, iterations in total, max sampled delta, [[bucket, count], ...]]
+#
+# The histogram and max cover the deltas since the previous frame, subsampled to at most
+# WINDOW_SAMPLES so that a frame costs the same however long the window, in log buckets with
+# 2**(SUB_BUCKET_BITS-1) buckets per power of two (as in histogram.py, but coarser). A frame is up
+# to about 1 KB of JSON per vCPU. Frames are posted without acknowledgement; a lost one is
+# superseded by the next. The host merges the latest frames into a per-VM view and can abandon a
+# run that looks pathological.
+
+PROGRESS_ENV = 'BENCHMARK_PROGRESS'
+PROGRESS_DIR = Path('/dev/shm')
+
+WINDOW_SAMPLES = 4096
+SUB_BUCKET_BITS = 4
+HALF_SUB_BUCKETS = 1 << (SUB_BUCKET_BITS - 1)
+
+AbortRules = collections.namedtuple('AbortRules', ['stall_seconds', 'p99_cycles'])
+
+class Anomaly(Exception):
+    pass
+
+def bucket_index(values):
+    values = np.asarray(values, dtype=np.int64)
+    shift = np.maximum(np.frexp(values)[1] - SUB_BUCKET_BITS, 0)
+    return shift * HALF_SUB_BUCKETS + (values >> shift)
+
+def bucket_value(indices):
+    # Midpoint of the values mapping to each bucket
+    indices = np.asarray(indices, dtype=np.int64)
+    shift = np.maximum(indices // HALF_SUB_BUCKETS - 1, 0)
+    low = (indices - shift * HALF_SUB_BUCKETS) << shift
+    return low + ((1 << shift) - 1) / 2
+
+def bucket_percentiles(buckets, counts, qs):
+    if not len(counts) or not counts.sum():
+        return [np.nan] * len(qs)
+    order = np.argsort(buckets)
+    buckets, cumulative = buckets[order], np.cumsum(counts[order])
+    ranks = np.clip(np.ceil(np.asarray(qs) / 100 * cumulative[-1]), 1, cumulative[-1])
+    return list(bucket_value(buckets[np.searchsorted(cumulative, ranks)]))
+
+#--------------------------------------------------------------------------------------------------#
+# Guest side
+
+def progress_path(benchmark, vcpu):
+    return PROGRESS_DIR/f'{benchmark}{vcpu}.progress'
+
+class ProgressReader:
+    # Follows one benchmark process through its progress file
+
+    def __init__(self, path):
+        self.path = path
+        self.deltas = None
+        self.done = 0
+        # A file left behind by an earlier run must not be mapped in place of this run's
+        self.path.unlink(missing_ok=True)
+
+    def open(self):
+        # The file appears once the process has started and sized it
+        if self.deltas is None and self.path.exists() and self.path.stat().st_size:
+            self.deltas = np.memmap(self.path, dtype=np.uint32, mode='r')
+        return self.deltas is not None
+
+    def completed(self):
+        # Length of the non-zero prefix
+        low, high = self.done, len(self.deltas)
+        while low < high:
+            middle = (low + high) // 2
+            if self.deltas[middle]:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def frame(self):
+        # [done, total, max, histogram] for the deltas since the last frame
+        if not self.open():
+            return [0, 0, 0, []]
+        done = self.completed()
+        window = self.deltas[self.done:done]
+        self.done = done
+        if not len(window):
+            return [done, len(self.deltas), 0, []]
+        sample = window[::max(len(window) // WINDOW_SAMPLES, 1)]
+        buckets, counts = np.unique(bucket_index(sample), return_counts=True)
+        return [done, len(self.deltas), int(sample.max()), [[int(b), int(c)] for b, c in zip(buckets, counts)]]
+
+    def close(self):
+        self.deltas = None
+        self.path.unlink(missing_ok=True)
+
+#--------------------------------------------------------------------------------------------------#
+# Host side
+
+class LiveView:
+    # Latest PROGRESS frame of every guest, and when each of its vCPUs last made progress
+
+    def __init__(self):
+        self.start(())
+
+    def start(self, guests, now=None):
+        # now: when the run starts, as from time.monotonic()
+        now = time.monotonic() if now is None else now
+        self.started = now
+        self.frames = {guest : None for guest in guests}
+        # guest -> [(iterations done, time it was first seen)] per vCPU
+        self.progress = {guest : [] for guest in guests}
+        self.last_frame = {guest : now for guest in guests}
+
+    def update(self, guest, message):
+        if guest not in self.frames:
+            return
+        now = time.monotonic()
+        vcpus = message['vcpus']
+        previous = self.progress[guest]
+        self.progress[guest] = [(done, now) if i >= len(previous) or done != previous[i][0] else previous[i]
+                                for i, (done, *_) in enumerate(vcpus)]
+        self.frames[guest] = vcpus
+        self.last_frame[guest] = now
+
+    def summary(self, guest):
+        # (fraction done, window p50, window p99, max) over the guest's vCPUs, or None
+        vcpus = self.frames[guest]
+        if not vcpus:
+            return None
+        pairs = np.array([pair for *_, histogram in vcpus for pair in histogram], dtype=np.int64).reshape(-1, 2)
+        p50, p99 = bucket_percentiles(pairs[:, 0], pairs[:, 1], [50, 99])
+        total = sum(v[1] for v in vcpus)
+        return (sum(v[0] for v in vcpus) / total if total else 0.0, p50, p99, max(v[2] for v in vcpus))
+
+    def format(self):
+        parts = []
+        for guest in self.frames:
+            summary = self.summary(guest)
+            label = guest.rsplit('-', 1)[-1]
+            if summary is None:
+                parts.append(f'vm{label} -')
+            else:
+                done, p50, p99, worst = summary
+                parts.append(f'vm{label} {100*done:3.0f}% p50 {p50:.0f} p99 {p99:.0f} max {worst}')
+        return f'{time.monotonic() - self.started:6.0f}s  ' + ' | '.join(parts)
+
+    def anomaly(self, rules, running):
+        # Description of the first broken rule among the given running guests, or None
+        now = time.monotonic()
+        for guest in running:
+            if guest not in self.frames:
+                continue
+            if rules.stall_seconds:
+                # A vCPU that has not finished and has not moved, or a guest that went silent
+                totals = [v[1] for v in self.frames[guest] or ()]
+                for vcpu, ((done, since), total) in enumerate(zip(self.progress[guest], totals)):
+                    if done < total and now - since > rules.stall_seconds:
+                        return f'{guest} vCPU {vcpu} made no progress for {now - since:.1f}s'
+                if now - self.last_frame[guest] > rules.stall_seconds:
+                    return f'{guest} sent no progress for {now - self.last_frame[guest]:.1f}s'
+            if rules.p99_cycles:
+                summary = self.summary(guest)
+                if summary is not None and summary[2] > rules.p99_cycles:
+                    return f'{guest} p99 of {summary[2]:.0f} cycles exceeds {rules.p99_cycles}'
+        return None
@@ -0,0 +1,27 @@
+import json
+import subprocess
+
+# Optional TSC calibration pass ("host.py --calibrate-tsc"). Once every guest has finished a cell,
+# the host sends CALIBRATE and each guest runs contextswitch/tsccal, which measures the TSC rate
+# against CLOCK_MONOTONIC_RAW, and stores the result in the cell's results zip as <bench>.tsc.json:
+#
+#   {"cycles_per_ns": 2.1, "window_ns": 20000000, "windows": [...]}
+#
+# calibration.py prefers it to the rate implied by each output's own clock_gettime total.
+
+TSC_PROGRAM = 'tsccal'
+TSC_SUFFIX = '.tsc.json'
+CALIBRATION_TIMEOUT = 60
+
+def tsc_path(results_dir, benchmark):
+    return results_dir/f'{benchmark}{TSC_SUFFIX}'
+
+def calibrate(benchmark_dir):
+    # The calibration record, as printed by tsccal
+    output = subprocess.run([str(benchmark_dir/TSC_PROGRAM)], stdout=subprocess.PIPE, check=True,
+                            timeout=CALIBRATION_TIMEOUT).stdout
+    return json.loads(output)
+
+def write_calibration(path, benchmark_dir):
+    path.write_text(json.dumps(calibrate(benchmark_dir), indent=2))
+    return path
@@ -0,0 +1,241 @@
+import os
+import time
+import zlib
+import queue
+import struct
+import shutil
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# Result upload pipeline for the guests. Outputs are moved aside as soon as a benchmark finishes,
+# so the next one can start straight away, and a background worker zips and uploads them:
+#
+#   - members are deflated by `jobs` threads (zlib releases the GIL), one by default, and the
+#     compressed streams are written into one ZIP that zipfile and the analysis scripts read as
+#     usual
+#   - uploads go to a pluggable backend: a local directory, an HTTP server accepting PUT (see
+#     upload_server.py) or a GCS bucket
+#
+# The worker shares the vCPUs with the benchmarks, so it runs at SCHED_IDLE and only works while
+# the uploader is resumed: the guest pauses it for the length of every cell, and it stops within
+# one chunk of input. The trade-off is that uploads only progress between cells, so most of a
+# round's compression and uploading is left for the round-end flush, which takes longer in
+# exchange for measurements free of zlib threads.
+#
+# flush() blocks until everything submitted so far is durably stored, which the host only asks
+# for at the end of a round.
+
+COMPRESS_LEVEL = 5
+UPLOAD_ATTEMPTS = 3
+ZIP_LIMIT = 0xFFFFFFFF
+
+####  Parallel ZIP writer  #########################################################################
+
+def deflate_file(path, checkpoint=None):
+    # (raw deflate stream, crc32, uncompressed size) of a file. checkpoint is called before every
+    # chunk, and may block to hold the compression up.
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+    chunks, crc, size = [], 0, 0
+    with open(path, 'rb') as f:
+        while True:
+            if checkpoint is not None:
+                checkpoint()
+            data = f.read(1 << 22)
+            if not data:
+                break
+            chunks.append(compressor.compress(data))
+            crc = zlib.crc32(data, crc)
+            size += len(data)
+    chunks.append(compressor.flush())
+    return b''.join(chunks), crc, size
+
+def dos_time(timestamp):
+    t = time.localtime(timestamp)
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((max(t.tm_year, 1980) - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)
+
+def write_zip(zip_path, paths, jobs=None, checkpoint=None):
+    # ZIP of the given files (stored under their own names), deflated by `jobs` threads (by
+    # default one per CPU), or in the calling thread if jobs is 1
+    paths = [Path(path) for path in paths]
+    deflate = lambda path: deflate_file(path, checkpoint)
+    if jobs == 1:
+        compressed = list(map(deflate, paths))
+    else:
+        with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+            compressed = list(executor.map(deflate, paths))
+
+    central_directory = []
+    with open(zip_path, 'wb') as out:
+        for path, (data, crc, size) in zip(paths, compressed):
+            if size > ZIP_LIMIT or out.tell() > ZIP_LIMIT:
+                raise ValueError(f'{path} is too large for a ZIP without ZIP64 extensions')
+            name = path.name.encode('utf-8')
+            mod_time, mod_date = dos_time(path.stat().st_mtime)
+            fields = struct.pack('<HHHHHIIIHH', 20, 0, zlib.DEFLATED, mod_time, mod_date, crc,
+                                 len(data), size, len(name), 0)
+            central_directory.append((fields, name, out.tell()))
+            out.write(struct.pack('<I', 0x04034B50) + fields + name)
+            out.write(data)
+
+        directory_offset = out.tell()
+        for fields, name, offset in central_directory:
+            out.write(struct.pack('<IH', 0x02014B50, 20) + fields + struct.pack('<HHHII', 0, 0, 0, 0, offset) + name)
+        directory_size = out.tell() - directory_offset
+        out.write(struct.pack('<IHHHHIIH', 0x06054B50, 0, 0, len(central_directory), len(central_directory),
+                              directory_size, directory_offset, 0))
+        out.flush()
+        os.fsync(out.fileno())
+
+####  Storage backends  ############################################################################
+
+class LocalBackend:
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def upload(self, path, destination):
+        target = self.root/destination
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(f'.{target.name}.tmp')
+        shutil.copyfile(path, tmp_path)
+        with open(tmp_path, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, target)
+        return str(target)
+
+    def stored(self, destination):
+        # Location of an upload to destination, or None if there is none
+        target = self.root/destination
+        return str(target) if target.is_file() else None
+
+class HttpBackend:
+    # PUT <url>/<destination>, as accepted by upload_server.py
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+
+    def upload(self, path, destination):
+        url = f'{self.url}/{urllib.parse.quote(destination)}'
+        request = urllib.request.Request(url, data=Path(path).read_bytes(), method='PUT')
+        with urllib.request.urlopen(request, timeout=300) as response:
+            response.read()
+        return url
+
+    def stored(self, destination):
+        url = f'{self.url}/{urllib.parse.quote(destination)}'
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, method='HEAD'), timeout=60):
+                return url
+        except urllib.error.URLError:
+            return None
+
+class GcsBackend:
+
+    def __init__(self, bucket_name):
+        # Only guests that upload to GCS need the client library
+        from google.cloud import storage
+        self.bucket = storage.Client().get_bucket(bucket_name)
+
+    def upload(self, path, destination):
+        self.bucket.blob(destination).upload_from_filename(str(path))
+        return f'gs://{self.bucket.name}/{destination}'
+
+    def stored(self, destination):
+        return f'gs://{self.bucket.name}/{destination}' if self.bucket.blob(destination).exists() else None
+
+def open_backend(spec):
+    # gs://<bucket>, http(s)://<server>/<prefix>, or a local directory (optionally file://...)
+    if spec.startswith('gs://'):
+        return GcsBackend(spec[len('gs://'):].strip('/'))
+    if spec.startswith(('http://', 'https://')):
+        return HttpBackend(spec)
+    if spec.startswith('file://'):
+        spec = urllib.parse.urlparse(spec).path
+    return LocalBackend(spec)
+
+####  Background uploader  #########################################################################
+
+def idle_priority():
+    # Let the calling thread, and the threads it starts later, run only on otherwise idle CPUs
+    try:
+        os.sched_setscheduler(0, os.SCHED_IDLE, os.sched_param(0))
+    except (AttributeError, OSError):
+        os.nice(19)
+
+class Uploader:
+
+    def __init__(self, backend, staging_dir, jobs=1):
+        self.backend = backend
+        self.staging_dir = Path(staging_dir)
+        self.jobs = jobs
+        self.jobs_queue = queue.Queue()
+        # Set while the uploader may work (see pause())
+        self.resumed = threading.Event()
+        self.resumed.set()
+        # Results of the jobs completed since the last flush
+        self.lock = threading.Lock()
+        self.locations = {}
+        self.errors = []
+        self.thread = threading.Thread(target=self.work, daemon=True)
+        self.thread.start()
+
+    def submit(self, paths, zip_name, destination):
+        # Move the files out of the way (so they can be overwritten at once) and queue them to be
+        # zipped and uploaded to destination. Returns the location they will be uploaded to.
+        job_dir = self.staging_dir/Path(destination).with_suffix('').as_posix().replace('/', '_')
+        job_dir.mkdir(parents=True, exist_ok=True)
+        staged = []
+        for path in paths:
+            staged.append(job_dir/Path(path).name)
+            os.replace(path, staged[-1])
+        self.jobs_queue.put((job_dir, staged, zip_name, destination))
+        return destination
+
+    def pause(self):
+        # Hold the work up, from the next chunk of input or upload on, until resume()
+        self.resumed.clear()
+
+    def resume(self):
+        self.resumed.set()
+
+    def work(self):
+        idle_priority()
+        while True:
+            job_dir, paths, zip_name, destination = self.jobs_queue.get()
+            try:
+                zip_path = job_dir/zip_name
+                write_zip(zip_path, paths, self.jobs, self.resumed.wait)
+                self.resumed.wait()
+                location = self.upload_with_retries(zip_path, destination)
+                shutil.rmtree(job_dir)
+                with self.lock:
+                    self.locations[destination] = location
+            except Exception as e:
+                # The staged files are kept for inspection; the host reruns the cell
+                with self.lock:
+                    self.errors.append(f'{destination}: {e}')
+            finally:
+                self.jobs_queue.task_done()
+
+    def upload_with_retries(self, path, destination):
+        for attempt in range(1, UPLOAD_ATTEMPTS+1):
+            try:
+                return self.backend.upload(path, destination)
+            except Exception:
+                if attempt == UPLOAD_ATTEMPTS:
+                    raise
+                time.sleep(2 ** attempt)
+
+    def flush(self):
+        # Wait for every submitted job. Returns the jobs completed since the last flush as
+        # {destination : uploaded location}, and the errors of those that failed.
+        self.jobs_queue.join()
+        with self.lock:
+            locations, errors = self.locations, self.errors
+            self.locations, self.errors = {}, []
+        return locations, errors
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+import os
+import argparse
+import urllib.parse
+from pathlib import Path
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Stand-in for the storage bucket: stores every PUT /<path> under a local directory, laid out the
+# way the analysis scripts expect, e.g.
+#
+#   python3 upload_server.py ~/benchmark-data --port 8080
+#   python3 guest.py --upload http://xone:8080
+
+class UploadHandler(BaseHTTPRequestHandler):
+
+    def target(self):
+        relative = Path(urllib.parse.unquote(urllib.parse.urlparse(self.path).path).lstrip('/'))
+        if relative.is_absolute() or '..' in relative.parts or not relative.parts:
+            return None
+        return self.server.root/relative
+
+    def do_PUT(self):
+        target = self.target()
+        if target is None:
+            self.send_error(400, 'Invalid path')
+            return
+        length = int(self.headers['Content-Length'])
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(f'.{target.name}.tmp')
+        with open(tmp_path, 'wb') as f:
+            remaining = length
+            while remaining:
+                data = self.rfile.read(min(remaining, 1 << 20))
+                if not data:
+                    break
+                f.write(data)
+                remaining -= len(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if remaining:
+            tmp_path.unlink()
+            self.send_error(400, 'Incomplete upload')
+            return
+        os.replace(tmp_path, target)
+        self.send_response(201)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_HEAD(self):
+        target = self.target()
+        self.send_response(200 if target is not None and target.is_file() else 404)
+        self.send_header('Content-Length', str(target.stat().st_size) if target and target.is_file() else '0')
+        self.end_headers()
+
+####  Main program  ################################################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local HTTP stand-in for the results bucket.')
+    parser.add_argument(
+        'root', type=Path,
+        help='directory to store uploads in')
+    parser.add_argument(
+        '--port', type=int, default=8080,
+        help='port to listen on')
+
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('0.0.0.0', args.port), UploadHandler)
+    server.root = args.root
+    print(f'Storing uploads in {args.root} on port {args.port}')
+    server.serve_forever()
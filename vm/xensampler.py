@@ -0,0 +1,137 @@
+import os
+import time
+import shlex
+import threading
+import subprocess
+import numpy as np
+from pathlib import Path
+
+# What Xen was doing during a cell. While a cell runs, a thread samples every interval:
+#
+#   xl vcpu-list     which pCPU every vCPU is on and its state (running, blocked, runnable)
+#   xentop -b -i 1   cumulative CPU seconds and memory of every domain
+#   xl info          host-wide figures such as free memory
+#
+# and the samples are saved as columns in an .npz per cell, laid out like the results tree:
+#
+#   <samples dir>/(13VM)(pvh)...(low-slop)/7/timectxsw.xen.npz
+#
+# Every table has a wall-clock column "t"; domain names are stored once in "domains" and referred
+# to by index. xenstats.py joins the files with the summary database by cell.
+#
+# Sampling is not free: every sample forks the three commands in dom0, during the cell. In the
+# dom0-all-cpus layouts dom0 shares pCPUs with the guests, so the sampler can disturb the cell it
+# describes, and its own CPU time is part of the dom0 CPU use xenstats.py reports. host.py only
+# samples when given "--xen-interval".
+
+SAMPLES_SUFFIX = '.xen.npz'
+COMMAND_TIMEOUT = 10
+
+def samples_path(samples_dir, location):
+    # location: where the cell's results are uploaded to, as from configs.results_location
+    return Path(samples_dir)/Path(location).with_suffix(SAMPLES_SUFFIX)
+
+def parse_vcpu_list(text):
+    # (name, vcpu, pcpu, state, cpu seconds) per vCPU; offline vCPUs have no pCPU (-1)
+    rows = []
+    for line in text.splitlines()[1:]:
+        fields = line.split()
+        if len(fields) < 6 or not fields[2].isdigit():
+            continue
+        name, _, vcpu, pcpu, state, seconds = fields[:6]
+        rows.append((name, int(vcpu), int(pcpu) if pcpu.isdigit() else -1, state, float(seconds)))
+    return rows
+
+def parse_xentop(text):
+    # (name, cpu seconds, memory in KiB) per domain
+    lines = text.splitlines()
+    header = next((i for i, line in enumerate(lines) if line.split()[:1] == ['NAME']), None)
+    if header is None:
+        return []
+    columns = lines[header].split()
+    name_column, cpu_column, mem_column = (columns.index(c) for c in ('NAME', 'CPU(sec)', 'MEM(k)'))
+    rows = []
+    for line in lines[header+1:]:
+        # MAXMEM(k) is "no limit" for unrestricted domains
+        fields = line.replace('no limit', 'no-limit').split()
+        if len(fields) == len(columns):
+            rows.append((fields[name_column], float(fields[cpu_column]), int(fields[mem_column])))
+    return rows
+
+def parse_info(text):
+    # Numeric fields of xl info
+    values = {}
+    for line in text.splitlines():
+        key, _, value = line.partition(':')
+        try:
+            values[key.strip()] = float(value)
+        except ValueError:
+            pass
+    return values
+
+class XenSampler:
+
+    def __init__(self, xl='xl', xentop='xentop', interval=1.0):
+        self.xl = xl
+        self.xentop = shlex.split(xentop)
+        self.interval = interval
+        self.thread = None
+        self.stopping = threading.Event()
+
+    def run(self, *command):
+        try:
+            return subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+                                  timeout=COMMAND_TIMEOUT).stdout
+        except (OSError, subprocess.TimeoutExpired):
+            # A missed sample is not worth losing the cell for
+            return ''
+
+    def sample(self):
+        t = time.time()
+        self.vcpus += [(t, *row) for row in parse_vcpu_list(self.run(self.xl, 'vcpu-list'))]
+        self.domains += [(t, *row) for row in parse_xentop(self.run(*self.xentop, '-b', '-i', '1', '-f'))]
+        self.info.append((t, parse_info(self.run(self.xl, 'info'))))
+
+    def work(self):
+        next_sample = time.monotonic()
+        while not self.stopping.is_set():
+            self.sample()
+            next_sample += self.interval
+            self.stopping.wait(max(next_sample - time.monotonic(), 0))
+
+    def start(self):
+        self.vcpus, self.domains, self.info = [], [], []
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.work, daemon=True)
+        self.thread.start()
+
+    def stop(self, path):
+        # Stop sampling and save what was collected to path
+        self.stopping.set()
+        self.thread.join()
+        self.sample()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f'.{path.name}.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, **self.columns())
+        os.replace(tmp_path, path)
+
+    def columns(self):
+        names = sorted({row[1] for row in self.vcpus} | {row[1] for row in self.domains})
+        code = {name : i for i, name in enumerate(names)}
+        keys = sorted({key for _, values in self.info for key in values})
+        return {
+            'domains'           : np.array(names, dtype=str),
+            'vcpu_t'            : np.array([r[0] for r in self.vcpus], dtype=np.float64),
+            'vcpu_domain'       : np.array([code[r[1]] for r in self.vcpus], dtype=np.int32),
+            'vcpu_vcpu'         : np.array([r[2] for r in self.vcpus], dtype=np.int32),
+            'vcpu_pcpu'         : np.array([r[3] for r in self.vcpus], dtype=np.int32),
+            'vcpu_state'        : np.array([r[4] for r in self.vcpus], dtype='U8'),
+            'vcpu_cpu_seconds'  : np.array([r[5] for r in self.vcpus], dtype=np.float64),
+            'domain_t'          : np.array([r[0] for r in self.domains], dtype=np.float64),
+            'domain_domain'     : np.array([code[r[1]] for r in self.domains], dtype=np.int32),
+            'domain_cpu_seconds': np.array([r[2] for r in self.domains], dtype=np.float64),
+            'domain_mem_kb'     : np.array([r[3] for r in self.domains], dtype=np.int64),
+            'info_t'            : np.array([t for t, _ in self.info], dtype=np.float64),
+            **{f'info_{key}' : np.array([values.get(key, np.nan) for _, values in self.info]) for key in keys},
+        }
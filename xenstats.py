@@ -0,0 +1,128 @@
+import sys
+import pathlib
+import argparse
+import numpy as np
+import pandas as pd
+from summary_db import ALL_VCPUS, DEFAULT_DB, connect
+from vm.xensampler import SAMPLES_SUFFIX
+
+# Hypervisor-side view of every cell, from the samples host.py takes while it runs (see
+# vm/xensampler.py), joined with the cell's latency from the summary database:
+#
+#   migrations_per_s   guest vCPUs seen on a different pCPU than in the previous sample, per second
+#   waiting_vcpus      guest vCPUs runnable but not running, on average per sample
+#   imbalance          standard deviation of the running and runnable guest vCPUs per pCPU
+#   dom0_cpu_pct       dom0's CPU use over the cell, in % of one CPU (as xentop reports it)
+#   guest_cpu_pct      the same for all guests together
+#   min_free_mb        lowest free host memory seen
+#
+# and the Spearman rank correlation of each with the cells' p50 and p99.
+
+XEN_METRICS = ('migrations_per_s', 'waiting_vcpus', 'imbalance', 'dom0_cpu_pct', 'guest_cpu_pct', 'min_free_mb')
+LATENCY_METRICS = ('p50', 'p99')
+DOM0_NAME = 'Domain-0'
+
+def is_waiting(states):
+    # xl vcpu-list states: r (running), b (blocked), p (paused/offline); none of them is runnable
+    return np.array([not set(state) & set('rbp') for state in states], dtype=bool)
+
+def cpu_percent(t, domain, cpu_seconds, selected):
+    # CPU use of the selected domains over the samples, in % of one CPU
+    total = 0.0
+    for d in np.unique(domain[selected]):
+        rows = domain == d
+        if rows.sum() >= 2:
+            first, last = np.argmin(t[rows]), np.argmax(t[rows])
+            total += cpu_seconds[rows][last] - cpu_seconds[rows][first]
+    duration = t.max() - t.min() if len(t) else 0
+    return 100 * total / duration if duration > 0 else np.nan
+
+def cell_metrics(samples):
+    domains = list(samples['domains'])
+    dom0 = domains.index(DOM0_NAME) if DOM0_NAME in domains else -1
+    t, domain, pcpu = samples['vcpu_t'], samples['vcpu_domain'], samples['vcpu_pcpu']
+    guest = domain != dom0
+    sample_times = np.unique(t)
+    duration = sample_times[-1] - sample_times[0] if len(sample_times) >= 2 else np.nan
+
+    # Consecutive samples of the same vCPU on different pCPUs
+    order = np.lexsort((t, samples['vcpu_vcpu'], domain))
+    same_vcpu = (np.diff(domain[order]) == 0) & (np.diff(samples['vcpu_vcpu'][order]) == 0)
+    placed = (pcpu[order][:-1] >= 0) & (pcpu[order][1:] >= 0)
+    moves = (same_vcpu & placed & (np.diff(pcpu[order]) != 0) & guest[order][1:]).sum()
+
+    waiting = is_waiting(samples['vcpu_state'])
+    busy = guest & (pcpu >= 0) & (waiting | np.char.find(samples['vcpu_state'], 'r') >= 0)
+    nr_cpus = int(np.nanmax(samples['info_nr_cpus'])) if 'info_nr_cpus' in samples else int(pcpu.max(initial=0)) + 1
+    imbalance = [np.bincount(pcpu[busy & (t == s)], minlength=nr_cpus).std() for s in sample_times]
+
+    domain_t, domain_domain = samples['domain_t'], samples['domain_domain']
+    return {
+        'samples'          : len(sample_times),
+        'migrations_per_s' : moves / duration if duration > 0 else np.nan,
+        'waiting_vcpus'    : (guest & waiting).sum() / len(sample_times) if len(sample_times) else np.nan,
+        'imbalance'        : np.mean(imbalance) if imbalance else np.nan,
+        'dom0_cpu_pct'     : cpu_percent(domain_t, domain_domain, samples['domain_cpu_seconds'], domain_domain == dom0),
+        'guest_cpu_pct'    : cpu_percent(domain_t, domain_domain, samples['domain_cpu_seconds'], domain_domain != dom0),
+        'min_free_mb'      : np.nanmin(samples['info_free_memory']) if 'info_free_memory' in samples else np.nan,
+    }
+
+def load_cells(samples_dir, benchmarks=None):
+    # One row of Xen metrics per sampled cell
+    rows = []
+    for path in sorted(pathlib.Path(samples_dir).glob(f'(*)/*/*{SAMPLES_SUFFIX}')):
+        benchmark = path.name[:-len(SAMPLES_SUFFIX)]
+        if benchmarks and benchmark not in benchmarks:
+            continue
+        with np.load(path) as samples:
+            metrics = cell_metrics(samples)
+        rows.append({'suite' : path.parent.parent.name, 'vm_count' : int(path.parent.name),
+                     'benchmark' : benchmark, **metrics})
+    return pd.DataFrame(rows, columns=['suite', 'vm_count', 'benchmark', 'samples', *XEN_METRICS])
+
+def join_latency(cells, db):
+    # The cells' combined-vCPU latency statistics from the summary database
+    latency = pd.read_sql_query(
+        f'SELECT suite, vm_count, benchmark, {", ".join(LATENCY_METRICS)} FROM summaries WHERE vcpu = ?',
+        db, params=(ALL_VCPUS,))
+    return cells.merge(latency, on=['suite', 'vm_count', 'benchmark'], how='left')
+
+def correlations(table):
+    # Spearman correlation of every Xen metric with every latency statistic, per benchmark
+    frames = {}
+    for benchmark, rows in table.groupby('benchmark'):
+        ranked = rows[[*XEN_METRICS, *LATENCY_METRICS]].rank()
+        frames[benchmark] = ranked.corr().loc[list(XEN_METRICS), list(LATENCY_METRICS)]
+    return pd.concat(frames, names=['benchmark', 'metric']) if frames else pd.DataFrame()
+
+####  Main program  ################################################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Correlate Xen samples of each cell with its latency.')
+    parser.add_argument(
+        'xen_samples', metavar='xen-samples', type=pathlib.Path,
+        help='directory of samples written by "host.py --xen-samples"')
+    parser.add_argument(
+        'benchmark_names', metavar='benchmark-name', nargs='*',
+        help='benchmarks to analyse (timesyscall, timectxsw etc.), all of them if omitted')
+    parser.add_argument(
+        '--db', type=pathlib.Path, default=DEFAULT_DB,
+        help='summary database to take latencies from (see summary_db.py)')
+    parser.add_argument(
+        '--csv', type=pathlib.Path,
+        help='also write the per-cell table to this CSV file')
+
+    args = parser.parse_args()
+
+    if not args.xen_samples.is_dir():
+        parser.error('Invalid samples path specified')
+
+    cells = load_cells(args.xen_samples, args.benchmark_names)
+    if cells.empty:
+        sys.exit('No matching samples')
+    table = join_latency(cells, connect(args.db))
+    if args.csv:
+        table.to_csv(args.csv, index=False)
+    print(table.to_string(index=False))
+    print('\nSpearman correlation with latency:')
+    print(correlations(table).to_string())